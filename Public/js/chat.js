@@ -31,7 +31,12 @@ var audioContext = null
 var audioProcessor = null
 var isAudioStreaming = false
 var audioQueue = []
+var realtimeRetryAfterMs = 0
+// Lets a reconnect pick up the same realtime session (and replay what was missed) after a network blip
+var realtimeResumeToken = null
+var realtimeLastEventId = null
 var mediaStream = null // Store the media stream for audio input and muting
+var audioInputSampleRate = 16000 // Microphone capture rate; the middle tier resamples to 24 kHz
 
 // Enhanced interruption detection variables
 var isAvatarSpeaking = false
@@ -108,39 +113,56 @@ function connectAvatar() {
         });
 }
 
+// Send session configuration - optimized for direct audio input
+function sendRealtimeSessionConfig() {
+    const sessionConfig = {
+        type: 'session.update',
+        session: {
+            modalities: ['text', 'audio'], // Keep both for transcription display
+            instructions: azureConfig.systemPrompt,
+            voice: 'alloy',
+            input_audio_format: 'pcm16',
+            output_audio_format: 'pcm16',
+            input_audio_transcription: {
+                model: 'whisper-1' // Enable transcription for UI display
+            },
+            turn_detection: {
+                type: 'server_vad', // Let API handle voice activity detection
+                threshold: 0.3,     // Lower threshold for better responsiveness
+                prefix_padding_ms: 200,
+                silence_duration_ms: 500
+            }
+        }
+    };
+
+    realtimeWebSocket.send(JSON.stringify(sessionConfig));
+}
+
 // Connect to realtime API WebSocket
 function connectRealtimeAPI() {
     try {
         //const realtimeEndpoint = azureConfig.realtimeEndpoint || 'ws://localhost:8765/realtime';
         const realtimeEndpoint = azureConfig.realtimeEndpoint || 'wss://dxcdigitalavatar-gme8cna3cbbagwa2.centralus-01.azurewebsites.net/realtime';
         console.log('Connecting to realtime API:', realtimeEndpoint);
-        realtimeWebSocket = new WebSocket(realtimeEndpoint);
+        // Microphone audio is sent as raw binary PCM16 frames at this rate. Replies are voiced by the
+        // avatar TTS, so only response text is requested and the model's audio stream is never sent.
+        const separator = realtimeEndpoint.includes('?') ? '&' : '?';
+        let realtimeUrl = `${realtimeEndpoint}${separator}input_rate=${audioInputSampleRate}&outputs=text`;
+        if (realtimeResumeToken) {
+            realtimeUrl += `&resume=${encodeURIComponent(realtimeResumeToken)}`;
+            if (realtimeLastEventId) {
+                realtimeUrl += `&last_event=${encodeURIComponent(realtimeLastEventId)}`;
+            }
+        }
+        realtimeWebSocket = new WebSocket(realtimeUrl);
 
         realtimeWebSocket.onopen = function(event) {
             console.log('Connected to realtime API');
 
-            // Send session configuration - optimized for direct audio input
-            const sessionConfig = {
-                type: 'session.update',
-                session: {
-                    modalities: ['text', 'audio'], // Keep both for transcription display
-                    instructions: azureConfig.systemPrompt,
-                    voice: 'alloy',
-                    input_audio_format: 'pcm16',
-                    output_audio_format: 'pcm16',
-                    input_audio_transcription: {
-                        model: 'whisper-1' // Enable transcription for UI display
-                    },
-                    turn_detection: {
-                        type: 'server_vad', // Let API handle voice activity detection
-                        threshold: 0.3,     // Lower threshold for better responsiveness
-                        prefix_padding_ms: 200,
-                        silence_duration_ms: 500
-                    }
-                }
-            };
-
-            realtimeWebSocket.send(JSON.stringify(sessionConfig));
+            // A resumed session is already configured; see 'extension.session_resumable'
+            if (!realtimeResumeToken) {
+                sendRealtimeSessionConfig();
+            }
 
             // Start direct audio streaming after session is configured
             setTimeout(() => {
@@ -150,18 +172,24 @@ function connectRealtimeAPI() {
 
         realtimeWebSocket.onmessage = function(event) {
             const message = JSON.parse(event.data);
+            if (message.event_id) {
+                realtimeLastEventId = message.event_id;
+            }
             handleRealtimeMessage(message);
         };
 
         realtimeWebSocket.onclose = function(event) {
             console.log('Realtime API connection closed:', event.code, event.reason);
             if (!userClosedSession && azureConfig.autoReconnectAvatar) {
+                // The server asks busy clients to come back later instead of retrying right away
+                const reconnectDelay = realtimeRetryAfterMs || 2000;
+                realtimeRetryAfterMs = 0;
                 setTimeout(() => {
                     if (!userClosedSession) {
                         console.log('Attempting to reconnect to realtime API...');
                         connectRealtimeAPI();
                     }
-                }, 2000);
+                }, reconnectDelay);
             }
         };
 
@@ -410,6 +438,15 @@ function handleRealtimeMessage(message) {
             console.log('Realtime session updated');
             break;
 
+        // The middle tier cancels the response on its own; just stop what is already playing
+        case 'input_audio_buffer.speech_started':
+            if (isAvatarSpeaking) {
+                console.log('User started speaking - stopping avatar speech');
+                stopSpeaking();
+                audioQueue = [];
+            }
+            break;
+
         // Handle direct audio responses (optimized path)
         case 'response.audio.delta':
             if (message.delta) {
@@ -483,8 +520,27 @@ function handleRealtimeMessage(message) {
             handleInterruptionAcknowledged(message);
             break;
 
+        case 'extension.session_resumable':
+            if (message.resumed) {
+                console.log('Realtime session resumed, replayed', message.replayed, 'missed frames');
+            } else if (realtimeResumeToken) {
+                // The old session had expired, so this new one still needs its configuration
+                sendRealtimeSessionConfig();
+            }
+            realtimeResumeToken = message.resume_token;
+            break;
+
+        case 'extension.queue_position':
+            if (message.position > 0) {
+                displayIntermediateFeedback('All assistants are busy - you are number ' + message.position + ' in line');
+            }
+            break;
+
         case 'error':
             console.error('Realtime API error:', message.error);
+            if (message.error && message.error.type === 'server_busy' && message.error.retry_after) {
+                realtimeRetryAfterMs = message.error.retry_after * 1000;
+            }
             isAvatarSpeaking = false;
             interruptionInProgress = false;
             break;
@@ -614,7 +670,7 @@ async function startDirectAudioStreaming() {
         // Get microphone access with optimal settings
         mediaStream = await navigator.mediaDevices.getUserMedia({
             audio: {
-                sampleRate: 16000,
+                sampleRate: audioInputSampleRate,
                 channelCount: 1,
                 echoCancellation: true,
                 noiseSuppression: true,
@@ -622,7 +678,7 @@ async function startDirectAudioStreaming() {
             }
         });
 
-        audioContext = new AudioContext({ sampleRate: 16000 });
+        audioContext = new AudioContext({ sampleRate: audioInputSampleRate });
         const source = audioContext.createMediaStreamSource(mediaStream);
 
         // Create audio processor for PCM16 conversion and VAD
@@ -644,13 +700,9 @@ async function startDirectAudioStreaming() {
                 pcm16Buffer[i] = Math.max(-32768, Math.min(32767, inputBuffer[i] * 32768));
             }
 
-            // Send audio data to Realtime API
+            // Send raw PCM16 to the middle tier, which resamples it and builds the append message
             try {
-                const audioMessage = {
-                    type: 'input_audio_buffer.append',
-                    audio: arrayBufferToBase64(pcm16Buffer.buffer)
-                };
-                realtimeWebSocket.send(JSON.stringify(audioMessage));
+                realtimeWebSocket.send(pcm16Buffer.buffer);
             } catch (error) {
                 console.error('Error sending audio data:', error);
             }
@@ -971,7 +1023,10 @@ function disconnectAvatar() {
     // Close realtime WebSocket
     if (realtimeWebSocket) {
         try {
-            realtimeWebSocket.close();
+            // A normal close ends the session on the server instead of keeping it for a reconnect
+            realtimeWebSocket.close(1000);
+            realtimeResumeToken = null;
+            realtimeLastEventId = null;
         } catch (e) {
             console.error("Error closing realtime WebSocket:", e);
         } finally {
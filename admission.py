@@ -0,0 +1,184 @@
+import asyncio
+import math
+import os
+import time
+from collections import deque
+from typing import Optional
+
+from aiohttp import web
+
+from token_bucket import TokenBucket
+
+class AdmissionRejected(Exception):
+    """
+    A session that is not admitted, with the reason and how long the client should wait before retrying.
+    """
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+    def retry_after_header(self) -> str:
+        return str(max(1, math.ceil(self.retry_after)))
+
+class QueueTicket:
+    """
+    A client waiting for a session slot; `admitted` resolves once it holds one.
+    """
+    def __init__(self, ip: str):
+        self.ip = ip
+        self.admitted: asyncio.Future = asyncio.get_running_loop().create_future()
+
+class AdmissionController:
+    """
+    Decides which /realtime connections get an upstream session, per worker process.
+
+    At most ADMISSION_MAX_SESSIONS sessions run at once; further clients wait in a FIFO queue of
+    ADMISSION_QUEUE_SIZE (at most ADMISSION_QUEUE_PER_IP of them from one address) for up to
+    ADMISSION_QUEUE_TIMEOUT seconds. Each address may open ADMISSION_IP_RATE connections per minute
+    (bursts of ADMISSION_IP_BURST). The effective session limit adapts to the upstream service:
+    it is cut multiplicatively on failed dials, server/rate-limit errors or first-delta latency above
+    ADMISSION_LATENCY_TARGET, and grows back additively once responses are fast again for
+    ADMISSION_SHED_WINDOW seconds. While the service is overloaded, clients beyond the limit are
+    rejected at once with a retry hint instead of queueing.
+    """
+    min_sessions: int = 1
+    decrease_factor: float = 0.7
+    # Sessions added back per response that meets the latency target, once the service has recovered
+    increase_step: float = 0.5
+    # Overload signals closer together than this count as one
+    decrease_cooldown: float = 1.0
+    max_tracked_ips: int = 10000
+
+    def __init__(self, max_sessions: Optional[int] = None, queue_size: Optional[int] = None, queue_per_ip: Optional[int] = None,
+                 queue_timeout: Optional[float] = None, ip_rate: Optional[float] = None, ip_burst: Optional[int] = None,
+                 latency_target: Optional[float] = None, shed_window: Optional[float] = None, trust_forwarded: Optional[bool] = None):
+        self.max_sessions = max_sessions if max_sessions is not None else int(os.environ.get("ADMISSION_MAX_SESSIONS", "100"))
+        self.queue_size = queue_size if queue_size is not None else int(os.environ.get("ADMISSION_QUEUE_SIZE", "20"))
+        self.queue_per_ip = queue_per_ip if queue_per_ip is not None else int(os.environ.get("ADMISSION_QUEUE_PER_IP", "5"))
+        self.queue_timeout = queue_timeout if queue_timeout is not None else float(os.environ.get("ADMISSION_QUEUE_TIMEOUT", "30"))
+        # Connections per minute per client address, 0 disables the limit
+        self.ip_rate = ip_rate if ip_rate is not None else float(os.environ.get("ADMISSION_IP_RATE", "60"))
+        self.ip_burst = ip_burst if ip_burst is not None else int(os.environ.get("ADMISSION_IP_BURST", "20"))
+        self.latency_target = latency_target if latency_target is not None else float(os.environ.get("ADMISSION_LATENCY_TARGET", "3.0"))
+        self.shed_window = shed_window if shed_window is not None else float(os.environ.get("ADMISSION_SHED_WINDOW", "10"))
+        # Behind a reverse proxy every connection comes from the proxy; only trust its header when configured
+        self.trust_forwarded = trust_forwarded if trust_forwarded is not None else os.environ.get("ADMISSION_TRUST_FORWARDED_FOR", "") == "1"
+        self.limit = float(self.max_sessions)
+        self.active = 0
+        self.queue: deque[QueueTicket] = deque()
+        self.overloaded_until = 0.0
+        self._last_decrease = 0.0
+        self._buckets: dict[str, TokenBucket] = {}
+        self._changed = asyncio.Event()
+        self.counts = {"admitted": 0, "admitted_after_queue": 0, "queued": 0, "abandoned": 0,
+                       "rejected_rate_limited": 0, "rejected_shed": 0, "rejected_queue_full": 0, "rejected_queue_timeout": 0}
+
+    def client_ip(self, request: web.Request) -> str:
+        if self.trust_forwarded and "X-Forwarded-For" in request.headers:
+            return request.headers["X-Forwarded-For"].split(",")[0].strip()
+        return request.remote or ""
+
+    @property
+    def changed(self) -> asyncio.Event:
+        """
+        Set the next time queue positions change.
+        """
+        return self._changed
+
+    def _notify(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def shedding(self) -> bool:
+        return time.monotonic() < self.overloaded_until
+
+    def check_rate(self, ip: str):
+        if self.ip_rate <= 0:
+            return
+        bucket = self._buckets.get(ip)
+        if bucket is None:
+            if len(self._buckets) >= self.max_tracked_ips:
+                # Buckets that have refilled carry no state worth keeping
+                now = time.monotonic()
+                self._buckets = {k: b for k, b in self._buckets.items() if b.tokens + (now - b.updated) * b.rate < b.burst}
+            bucket = self._buckets[ip] = TokenBucket(self.ip_rate / 60, self.ip_burst)
+        wait = bucket.take()
+        if wait > 0:
+            self.counts["rejected_rate_limited"] += 1
+            raise AdmissionRejected("rate_limited", wait)
+
+    def request(self, ip: str) -> Optional[QueueTicket]:
+        """
+        Admit a new connection. Returns None when a session slot was taken right away, or a ticket to
+        wait on; raises AdmissionRejected when the client should come back later.
+        """
+        self.check_rate(ip)
+        if not self.queue and self.active < int(self.limit):
+            self.active += 1
+            self.counts["admitted"] += 1
+            return None
+        if self.shedding():
+            self.counts["rejected_shed"] += 1
+            raise AdmissionRejected("shed", self.overloaded_until - time.monotonic())
+        if len(self.queue) >= self.queue_size or sum(1 for t in self.queue if t.ip == ip) >= self.queue_per_ip:
+            self.counts["rejected_queue_full"] += 1
+            raise AdmissionRejected("queue_full", self.queue_timeout)
+        ticket = QueueTicket(ip)
+        self.queue.append(ticket)
+        self.counts["queued"] += 1
+        return ticket
+
+    def position(self, ticket: QueueTicket) -> int:
+        try:
+            return self.queue.index(ticket) + 1
+        except ValueError:
+            return 0
+
+    def leave(self, ticket: QueueTicket, timed_out: bool = False):
+        """
+        Take a waiting client out of the queue (it left, or waited too long).
+        """
+        if ticket in self.queue:
+            self.queue.remove(ticket)
+            self.counts["rejected_queue_timeout" if timed_out else "abandoned"] += 1
+            self._notify()
+
+    def release(self):
+        """
+        A session ended; hand its slot to the longest-waiting client.
+        """
+        self.active -= 1
+        self._admit_waiting()
+
+    def _admit_waiting(self):
+        admitted = False
+        while self.queue and self.active < int(self.limit):
+            ticket = self.queue.popleft()
+            self.active += 1
+            self.counts["admitted_after_queue"] += 1
+            ticket.admitted.set_result(True)
+            admitted = True
+        if admitted:
+            self._notify()
+
+    def overloaded(self):
+        """
+        The upstream service is struggling (failed dial, server or rate-limit error, slow responses).
+        """
+        now = time.monotonic()
+        self.overloaded_until = now + self.shed_window
+        if now - self._last_decrease < self.decrease_cooldown:
+            return
+        self._last_decrease = now
+        self.limit = max(float(self.min_sessions), self.limit * self.decrease_factor)
+
+    def observe_latency(self, seconds: float):
+        if seconds > self.latency_target:
+            self.overloaded()
+        elif self.limit < self.max_sessions and not self.shedding():
+            self.limit = min(float(self.max_sessions), self.limit + self.increase_step)
+            self._admit_waiting()
+
+    def stats(self) -> dict[str, float]:
+        return {"active": self.active, "queued": len(self.queue), "limit": int(self.limit), "shedding": int(self.shedding())}
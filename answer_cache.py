@@ -0,0 +1,155 @@
+import hashlib
+import os
+import re
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Optional
+
+from rag_cache import content_terms
+
+# Words that point back at earlier turns ("when does his talk start?"); the answer to a question
+# containing one depends on the conversation, so it is neither learned nor served
+REFERRING_WORDS = frozenset({
+    "he", "him", "his", "she", "her", "hers", "they", "them", "their", "theirs", "it", "its",
+    "this", "that", "these", "those", "then", "else", "other", "another", "more", "same", "again",
+})
+
+_WORDS = re.compile(r"\w+")
+
+# Ids of the assistant items the middle tier adds to the conversation for answers it served itself
+ANSWER_ITEM_PREFIX = "mt_ans_"
+
+def is_self_contained(question: str) -> bool:
+    return REFERRING_WORDS.isdisjoint(_WORDS.findall(question.lower()))
+
+def prompt_digest(instructions: str) -> str:
+    return hashlib.sha256(instructions.encode("utf-8")).hexdigest()[:16]
+
+def response_events(item_id: str, text: str, transcript: bool = False) -> list[dict[str, Any]]:
+    """
+    The server events of a complete one-message response with `text`, for clients that read response
+    text (or, with `transcript`, audio transcripts) and never hear the model's own audio.
+    """
+    response_id = "resp_" + ANSWER_ITEM_PREFIX + uuid.uuid4().hex[:16]
+    part_type, delta_type = ("audio", "response.audio_transcript") if transcript else ("text", "response.text")
+    field = "transcript" if transcript else "text"
+    ids = {"response_id": response_id, "item_id": item_id, "output_index": 0, "content_index": 0}
+    item = {"id": item_id, "object": "realtime.item", "type": "message", "role": "assistant", "status": "in_progress", "content": []}
+    done_item = dict(item, status="completed", content=[{"type": part_type, field: text}])
+    return [
+        {"type": "response.created", "response": {"id": response_id, "object": "realtime.response", "status": "in_progress", "output": []}},
+        {"type": "response.output_item.added", "response_id": response_id, "output_index": 0, "item": item},
+        {"type": "response.content_part.added", **ids, "part": {"type": part_type, field: ""}},
+        {"type": f"{delta_type}.delta", **ids, "delta": text},
+        {"type": f"{delta_type}.done", **ids, field: text},
+        {"type": "response.content_part.done", **ids, "part": {"type": part_type, field: text}},
+        {"type": "response.output_item.done", "response_id": response_id, "output_index": 0, "item": done_item},
+        {"type": "response.done", "response": {"id": response_id, "object": "realtime.response", "status": "completed", "output": [done_item]}},
+    ]
+
+class CachedAnswer:
+    def __init__(self, key: str, question: str, text: str, expires_at: float, output_tokens: int):
+        self.key = key
+        self.question = question
+        self.text = text
+        self.expires_at = expires_at
+        self.output_tokens = output_tokens
+        self.hits = 0
+
+class AnswerCache:
+    """
+    Answers to visitor questions that the system prompt alone answers (event location, date,
+    presenters, ...), learned from the model's own completed responses and shared by every session
+    of the worker. A later question with exactly the same content words (stop-words removed, plurals
+    folded, in any order, at least ANSWER_CACHE_MIN_TERMS of them) is answered from the cache without
+    an upstream response. A question that adds a qualifier ("... on mac"), drops one or adds a
+    negation ("how do I not ...") has different content words and is a miss. Questions that refer
+    back to earlier turns are never learned or answered.
+
+    Entries live for ANSWER_CACHE_TTL seconds (0 disables the cache), at most ANSWER_CACHE_MAX_ENTRIES
+    of them, and belong to the instructions they were generated under: a session with different
+    instructions never sees them, and storing an answer under new instructions drops the old ones.
+    """
+    # Weight of the latest response in the running average of model response time
+    response_time_weight: float = 0.1
+
+    def __init__(self, ttl: Optional[float] = None, max_entries: Optional[int] = None, min_terms: Optional[int] = None):
+        self.ttl = ttl if ttl is not None else float(os.environ.get("ANSWER_CACHE_TTL", "3600"))
+        self.max_entries = max_entries if max_entries is not None else int(os.environ.get("ANSWER_CACHE_MAX_ENTRIES", "256"))
+        self.min_terms = min_terms if min_terms is not None else int(os.environ.get("ANSWER_CACHE_MIN_TERMS", "2"))
+        self._entries: OrderedDict[str, CachedAnswer] = OrderedDict()
+        self.digest: Optional[str] = None
+        self.response_seconds: Optional[float] = None
+        self.counts = {"hits": 0, "misses": 0, "stored": 0, "context_dependent": 0, "expired": 0, "evicted": 0, "invalidated": 0}
+        self.seconds_saved = 0.0
+        self.tokens_saved = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0
+
+    def _key(self, question: str) -> Optional[str]:
+        """
+        The cache key of `question`: its sorted content words, or None if it cannot be cached.
+        """
+        terms = set(content_terms(question))
+        if len(terms) < self.min_terms or not is_self_contained(question):
+            return None
+        return " ".join(sorted(terms))
+
+    def invalidate(self):
+        self.counts["invalidated"] += len(self._entries)
+        self._entries.clear()
+
+    def lookup(self, digest: str, question: str) -> Optional[CachedAnswer]:
+        """
+        The stored answer to `question` under the instructions with `digest`, or None.
+        """
+        key = self._key(question)
+        entry = self._entries.get(key) if key is not None and digest == self.digest else None
+        if entry is not None and entry.expires_at < time.monotonic():
+            del self._entries[key]
+            self.counts["expired"] += 1
+            entry = None
+        if entry is None:
+            self.counts["misses"] += 1
+            return None
+        self._entries.move_to_end(key)
+        entry.hits += 1
+        self.counts["hits"] += 1
+        self.tokens_saved += entry.output_tokens
+        if self.response_seconds is not None:
+            self.seconds_saved += self.response_seconds
+        return entry
+
+    def store(self, digest: str, question: str, text: str, output_tokens: int = 0):
+        if not text:
+            return
+        key = self._key(question)
+        if key is None:
+            if not is_self_contained(question):
+                self.counts["context_dependent"] += 1
+            return
+        if digest != self.digest:
+            # The instructions changed, so every stored answer may be out of date
+            self.invalidate()
+            self.digest = digest
+        self._entries.pop(key, None)
+        self._entries[key] = CachedAnswer(key, question, text, time.monotonic() + self.ttl, output_tokens)
+        self.counts["stored"] += 1
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.counts["evicted"] += 1
+
+    def observe_response(self, seconds: float):
+        """
+        Duration of a model response (response.create to response.done), what a hit is assumed to save.
+        """
+        if self.response_seconds is None:
+            self.response_seconds = seconds
+        else:
+            self.response_seconds += self.response_time_weight * (seconds - self.response_seconds)
+
+    def stats(self) -> dict[str, int]:
+        return {"entries": len(self._entries)}
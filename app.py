@@ -1,16 +1,23 @@
+import asyncio
+import json
 import logging
 import os
 from pathlib import Path
 
 from aiohttp import web
 from azure.core.credentials import AzureKeyCredential
-from azure.identity import AzureDeveloperCliCredential, DefaultAzureCredential
 from dotenv import load_dotenv
 
 # Removed MCP and web search tools for simplified setup
+from relay_logging import LogPipeline
 from rtmt import RTMiddleTier
+from token_manager import LazyCredential
+from static_assets import StaticAssets
+from workers import SharedMetrics, serve
 
-logging.basicConfig(level=logging.INFO)
+# Records are written by a background thread; LOG_LEVEL, LOG_FORMAT and SIGUSR1 control the output
+log_pipeline = LogPipeline()
+log_pipeline.install()
 logger = logging.getLogger("voicerag")
 
 DIXIE_PROMPT = """
@@ -70,12 +77,20 @@ async def create_app():
 
     credential = None
     if not llm_key:
+        # azure-identity is imported and the credential built by the first token refresh, in the background
         if tenant_id := os.environ.get("AZURE_TENANT_ID"):
             logger.info("Using AzureDeveloperCliCredential with tenant_id %s", tenant_id)
-            credential = AzureDeveloperCliCredential(tenant_id=tenant_id, process_timeout=60)
+
+            def build_credential():
+                from azure.identity import AzureDeveloperCliCredential
+                return AzureDeveloperCliCredential(tenant_id=tenant_id, process_timeout=60)
         else:
             logger.info("Using DefaultAzureCredential")
-            credential = DefaultAzureCredential()
+
+            def build_credential():
+                from azure.identity import DefaultAzureCredential
+                return DefaultAzureCredential()
+        credential = LazyCredential(build_credential)
     llm_credential = AzureKeyCredential(llm_key) if llm_key else credential
     
     app = web.Application()
@@ -123,16 +138,18 @@ RESPONSE INSTRUCTIONS:
     current_directory = Path(__file__).parent
     public_path = current_directory / 'Public'
 
-    # Serve avatar frontend files
+    # Serve avatar frontend files from memory, precompressed and fingerprinted for long-lived caching
+    assets = StaticAssets(public_path)
     if public_path.exists():
         # Serve static files (CSS, JS, images)
-        app.router.add_static('/css', path=public_path / 'css', name='css')
-        app.router.add_static('/js', path=public_path / 'js', name='js')
-        app.router.add_static('/image', path=public_path / 'image', name='image')
+        await asyncio.to_thread(assets.load)
+        app.router.add_get('/{directory:css|js|image}/{name:.+}', assets.handle)
+
+        # Serve HTML pages, with asset references rewritten to their fingerprinted names
+        chat_page = await asyncio.to_thread(assets.add_page, '/chat', public_path / 'chat.html')
 
-        # Serve HTML pages
-        async def serve_chat(_):
-            return web.FileResponse(public_path / 'chat.html')
+        async def serve_chat(request):
+            return chat_page.respond(request)
 
         # Add routes
         app.add_routes([
@@ -149,7 +166,7 @@ RESPONSE INSTRUCTIONS:
         logger.warning(f"Public path {public_path} not found")
 
     # Add Azure configuration endpoint for frontend
-    async def azure_config_handler(_):
+    def build_azure_config():
         # Build system prompt from parts
         prompt_parts = [
             os.environ.get("SYSTEM_PROMPT_PART1", ""),
@@ -208,16 +225,50 @@ RESPONSE INSTRUCTIONS:
             'showSubtitles': os.environ.get('SHOW_SUBTITLES', 'true').lower() == 'true'
         }
 
-        return web.json_response(config)
+        return config
+
+    # The configuration only depends on the environment, so it is serialized and compressed once
+    azure_config = assets.add('/azure-config', json.dumps(build_azure_config()).encode('utf-8'),
+                              'application/json; charset=utf-8', cache_control='private, no-cache')
+
+    async def azure_config_handler(request):
+        return azure_config.respond(request)
 
     app.add_routes([web.get('/azure-config', azure_config_handler)])
+
+    # Prometheus metrics for the realtime relay (turn latency histograms, session/frame/byte counters),
+    # merged across processes when running under the multi-worker supervisor
+    shared_metrics = None
+    if metrics_dir := os.environ.get("APP_METRICS_DIR"):
+        shared_metrics = SharedMetrics(rtmt.metrics, metrics_dir, int(os.environ.get("APP_WORKER_SLOT", "0")))
+        shared_metrics.attach_to_app(app)
+    rtmt.metrics.add_collector(log_pipeline.collect_metrics)
+
+    async def metrics_handler(_):
+        text = await shared_metrics.render() if shared_metrics else rtmt.metrics.render()
+        return web.Response(text=text, headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"})
+
+    # Liveness answers as soon as the process serves; readiness waits for the background warm-up
+    async def healthz_handler(_):
+        return web.json_response({"status": "ok"})
+
+    async def readyz_handler(_):
+        report = rtmt.readiness.report()
+        return web.json_response(report, status=200 if report["ready"] else 503)
+
+    app.add_routes([
+        web.get('/metrics', metrics_handler),
+        web.get('/healthz', healthz_handler),
+        web.get('/readyz', readyz_handler)
+    ])
     
     return app
 
 if __name__ == "__main__":
     host = "0.0.0.0"
     port = 5000
-    web.run_app(create_app(), host=host, port=port)
+    # APP_WORKERS > 1 runs supervised SO_REUSEPORT workers; SIGTERM drains live conversations for APP_DRAIN_TIMEOUT seconds
+    serve(create_app, host=host, port=port)
     # host = "localhost"
     # port = 8765
     # web.run_app(create_app(), host=host, port=port)
@@ -1,39 +1,312 @@
+import asyncio
+import logging
 import os
-from typing import List, Dict, Any
-from azure.core.credentials import AzureKeyCredential
-from azure.search.documents import SearchClient
+import threading
+import time
+from collections import deque
+from typing import List, Dict, Any, Optional
+
+import aiohttp
+
+logger = logging.getLogger("voicerag")
+
+# How the local index (LOCAL_INDEX_DIR) is combined with Azure Search, see AzureCognitiveSearchRAG
+LOCAL_INDEX_MODES = ("first", "fallback", "only")
+
+def reciprocal_rank_fusion(result_lists: List[List[Dict[str, Any]]], top: int, k: int = 60) -> List[Dict[str, Any]]:
+    """
+    Merge ranked result lists by reciprocal-rank fusion: a document scores sum(1 / (k + rank)) over the
+    lists it appears in. Documents are identified by their content, so copies from replicas merge.
+    """
+    scores: Dict[str, float] = {}
+    docs: Dict[str, Dict[str, Any]] = {}
+    for results in result_lists:
+        for rank, doc in enumerate(results, 1):
+            key = doc.get("content", "")
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank)
+            docs.setdefault(key, doc)
+    return [docs[key] for key in sorted(scores, key=scores.get, reverse=True)[:top]]
+
+class LatencyTracker:
+    """
+    Rolling window of one search target's latencies, used to decide when a request is slow enough to hedge.
+    """
+    def __init__(self, window: int = 200, min_samples: int = 20, default_delay: float = 0.25):
+        self.samples: deque[float] = deque(maxlen=window)
+        self.min_samples = min_samples
+        self.default_delay = default_delay
+
+    def record(self, seconds: float):
+        self.samples.append(seconds)
+
+    def p95(self) -> Optional[float]:
+        if len(self.samples) < self.min_samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[int(0.95 * (len(ordered) - 1))]
+
+    def hedge_after(self) -> float:
+        p95 = self.p95()
+        return p95 if p95 is not None else self.default_delay
 
 class AzureCognitiveSearchRAG:
     def __init__(self):
         self.endpoint = os.environ.get("AZURE_SEARCH_ENDPOINT")
-        self.index = os.environ.get("AZURE_SEARCH_INDEX")
+        # One or more comma-separated indexes; async lookups query all of them in parallel and fuse the results
+        self.indexes = [name.strip() for name in os.environ.get("AZURE_SEARCH_INDEX", "").split(",") if name.strip()]
+        self.index = self.indexes[0] if self.indexes else None
+        # Optional second endpoint serving the same indexes (a replica service); hedged requests go there
+        self.replica_endpoint = os.environ.get("AZURE_SEARCH_REPLICA_ENDPOINT") or None
         self.api_key = os.environ.get("AZURE_SEARCH_API_KEY")
         self.content_field = os.environ.get("AZURE_SEARCH_CONTENT_FIELD", "content")
-        self.client = None
-        if self.endpoint and self.index and self.api_key:
-            self.client = SearchClient(
+        # Overall deadline (seconds) for the async path across all indexes and hedges; past it the turn
+        # proceeds with whatever indexes answered
+        self.query_timeout = float(os.environ.get("AZURE_SEARCH_QUERY_TIMEOUT", "1.5"))
+        # Hedge delay until enough latencies are known to use each index's p95
+        self.hedge_delay = float(os.environ.get("AZURE_SEARCH_HEDGE_DELAY", "0.25"))
+        self.latency = {index: LatencyTracker(default_delay=self.hedge_delay) for index in self.indexes}
+        self.fanout_stats = {"queries": 0, "hedged": 0, "hedge_wins": 0, "partial": 0, "index_failures": 0}
+        self.pool_size = int(os.environ.get("AZURE_SEARCH_POOL_SIZE", "32"))
+        # The search SDK and the local index are loaded by start(), off the startup path; until then
+        # lookups create what they need on first use
+        self.configured = bool(self.endpoint and self.index and self.api_key)
+        self._client = None
+        # The async client and its keep-alive connection pool are bound to the running event loop,
+        # so they are created on first use rather than here
+        self._async_clients: Dict[tuple[str, str], Any] = {}
+        self._http_session: Optional[aiohttp.ClientSession] = None
+        # Optional embedded index over the exported corpus (LOCAL_INDEX_DIR). "first" answers from it when
+        # its best hit covers enough of the query and falls through to Azure Search otherwise; "fallback"
+        # only uses it when Azure Search is not configured or fails; "only" never calls Azure Search.
+        self.local_index_dir = os.environ.get("LOCAL_INDEX_DIR") or None
+        self.local_index = None
+        self._local_lock = threading.Lock()
+        self.local_mode = os.environ.get("LOCAL_INDEX_MODE", "first")
+        if self.local_mode not in LOCAL_INDEX_MODES:
+            raise ValueError(f"LOCAL_INDEX_MODE must be one of {', '.join(LOCAL_INDEX_MODES)}, got {self.local_mode!r}")
+        self.local_min_coverage = float(os.environ.get("LOCAL_INDEX_MIN_COVERAGE", "0.5"))
+        self.local_stats = {"answered": 0, "fell_through": 0, "fallback": 0}
+        if not self.configured and self.local_index_dir is None:
+            logger.warning("Azure Search is not configured and no local index is set, RAG lookups will return no documents")
+
+    @property
+    def enabled(self) -> bool:
+        return self.configured or self.local_index_dir is not None
+
+    def _load_local_index(self):
+        with self._local_lock:
+            if self.local_index_dir is not None and self.local_index is None:
+                from local_index import open_local_index
+                self.local_index = open_local_index(self.local_index_dir)
+                logger.info("Loaded local retrieval index with %d documents (%s mode)", self.local_index.documents, self.local_mode)
+
+    def _load(self):
+        """
+        Import the search SDK, create the synchronous client and open the local index. Blocking.
+        """
+        self._load_local_index()
+        if self.configured and self._client is None:
+            from azure.core.credentials import AzureKeyCredential
+            from azure.search.documents import SearchClient
+            import azure.search.documents.aio  # noqa: F401  (used by _get_async_client)
+            self._client = SearchClient(
                 endpoint=self.endpoint,
                 index_name=self.index,
                 credential=AzureKeyCredential(self.api_key)
             )
 
-    def retrieve_documents(self, query: str, top: int = 3) -> List[Dict[str, Any]]:
-        if not self.client:
-            return []
+    async def start(self):
+        """
+        Load everything in a worker thread, then create the async clients for every index up front.
+        """
+        await asyncio.to_thread(self._load)
+        if self.configured:
+            for index in self.indexes:
+                self._get_async_client(self.endpoint, index)
+                if self.replica_endpoint:
+                    self._get_async_client(self.replica_endpoint, index)
+
+    @property
+    def client(self):
+        if self._client is None and self.configured:
+            self._load()
+        return self._client
+
+    def _get_local_index(self):
+        # Opened by start() in the background; lookups before that (or without it) open it on first use
+        if self.local_index is None and self.local_index_dir is not None:
+            self._load_local_index()
+        return self.local_index
+
+    def select_fields(self) -> List[str]:
         # Only select the content field and known StringCollection fields
-        select_fields = [self.content_field, "people", "organizations", "locations", "keyphrases"]
+        return [self.content_field, "people", "organizations", "locations", "keyphrases"]
+
+    def _to_doc(self, doc: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "content": doc.get(self.content_field, ""),
+            "people": doc.get("people", []),
+            "organizations": doc.get("organizations", []),
+            "locations": doc.get("locations", []),
+            "keyphrases": doc.get("keyphrases", [])
+        }
+
+    def _search_local(self, query: str, top: int) -> List[Dict[str, Any]]:
+        local_index = self._get_local_index()
+        if local_index is None:
+            return []
+        return [doc for doc, _, _ in local_index.search(query, top)]
+
+    def _local_first_tier(self, query: str, top: int) -> Optional[List[Dict[str, Any]]]:
+        """
+        Answer from the local index when the mode allows it and, in "first" mode, its best hit is confident.
+        """
+        if self.local_mode == "fallback" or self._get_local_index() is None:
+            return None
+        hits = self.local_index.search(query, top)
+        if self.local_mode == "only" or (hits and hits[0][2] >= self.local_min_coverage):
+            self.local_stats["answered"] += 1
+            return [doc for doc, _, _ in hits]
+        self.local_stats["fell_through"] += 1
+        return None
+
+    def _local_fallback(self, query: str, top: int) -> List[Dict[str, Any]]:
+        docs = self._search_local(query, top)
+        if docs:
+            self.local_stats["fallback"] += 1
+        return docs
+
+    def retrieve_documents(self, query: str, top: int = 3) -> List[Dict[str, Any]]:
+        local = self._local_first_tier(query, top)
+        if local is not None:
+            return local
+        if not self.configured:
+            return self._local_fallback(query, top)
         results = self.client.search(
             search_text=query,
             top=top,
-            select=select_fields
+            select=self.select_fields()
         )
         docs = []
         for doc in results:
-            docs.append({
-                "content": doc.get(self.content_field, ""),
-                "people": doc.get("people", []),
-                "organizations": doc.get("organizations", []),
-                "locations": doc.get("locations", []),
-                "keyphrases": doc.get("keyphrases", [])
-            })
+            docs.append(self._to_doc(doc))
         return docs
+
+    def _get_async_client(self, endpoint: str, index: str):
+        if self._http_session is None:
+            connector = aiohttp.TCPConnector(limit=self.pool_size, keepalive_timeout=60)
+            self._http_session = aiohttp.ClientSession(connector=connector)
+        client = self._async_clients.get((endpoint, index))
+        if client is None:
+            from azure.core.credentials import AzureKeyCredential
+            from azure.core.pipeline.transport import AioHttpTransport
+            from azure.search.documents.aio import SearchClient as AsyncSearchClient
+
+            # Every index and replica shares the one keep-alive connection pool
+            client = self._async_clients[(endpoint, index)] = AsyncSearchClient(
+                endpoint=endpoint,
+                index_name=index,
+                credential=AzureKeyCredential(self.api_key),
+                transport=AioHttpTransport(session=self._http_session, session_owner=False)
+            )
+        return client
+
+    async def _search_async(self, endpoint: str, index: str, query: str, top: int) -> List[Dict[str, Any]]:
+        start = time.monotonic()
+        try:
+            results = await self._get_async_client(endpoint, index).search(
+                search_text=query,
+                top=top,
+                select=self.select_fields()
+            )
+            docs = []
+            async for doc in results:
+                docs.append(self._to_doc(doc))
+        except asyncio.CancelledError:
+            # A request cut off by a hedge or the deadline was at least this slow
+            self.latency[index].record(time.monotonic() - start)
+            raise
+        self.latency[index].record(time.monotonic() - start)
+        return docs
+
+    async def _hedged_search(self, index: str, query: str, top: int) -> List[Dict[str, Any]]:
+        """
+        Query one index; if it has not answered within its p95 latency, send a duplicate request
+        (to the replica endpoint when configured) and take whichever answers first.
+        """
+        primary = asyncio.create_task(self._search_async(self.endpoint, index, query, top))
+        pending = {primary}
+        error: Optional[BaseException] = None
+        try:
+            done, _ = await asyncio.wait(pending, timeout=self.latency[index].hedge_after())
+            if done:
+                return primary.result()
+            self.fanout_stats["hedged"] += 1
+            hedge = asyncio.create_task(self._search_async(self.replica_endpoint or self.endpoint, index, query, top))
+            pending = {primary, hedge}
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            self.fanout_stats["hedge_wins"] += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def _fan_out(self, query: str, top: int) -> List[Dict[str, Any]]:
+        """
+        Query every index in parallel under one overall deadline and fuse what came back in time.
+        Raises TimeoutError if no index answered by the deadline.
+        """
+        self.fanout_stats["queries"] += 1
+        legs = {asyncio.create_task(self._hedged_search(index, query, top)): index for index in self.indexes}
+        try:
+            done, pending = await asyncio.wait(legs, timeout=self.query_timeout)
+        finally:
+            for task in legs:
+                task.cancel()
+        results = []
+        for task in done:
+            if task.exception() is not None:
+                self.fanout_stats["index_failures"] += 1
+                logger.warning("Search on index %s failed: %s", legs[task], task.exception())
+            else:
+                results.append(task.result())
+        if pending:
+            self.fanout_stats["partial"] += 1
+            if not done:
+                raise asyncio.TimeoutError()
+        if not results:
+            raise RuntimeError("every search index failed")
+        return results[0] if len(results) == 1 else reciprocal_rank_fusion(results, top)
+
+    async def retrieve_documents_async(self, query: str, top: int = 3) -> List[Dict[str, Any]]:
+        """
+        Non-blocking retrieval on the event loop over a shared keep-alive connection pool, behind the local index if configured.
+        All configured indexes are queried in parallel with hedging; indexes that miss the deadline are left out.
+        If none answers in time, returns the local index's results or an empty list, so the turn can go ahead.
+        """
+        local = self._local_first_tier(query, top)
+        if local is not None:
+            return local
+        if not self.configured:
+            return self._local_fallback(query, top)
+        try:
+            return await self._fan_out(query, top)
+        except asyncio.TimeoutError:
+            logger.warning("Search query exceeded its %.2fs deadline, continuing without context", self.query_timeout)
+        except Exception as e:
+            logger.warning("Search query failed, continuing without context: %s", e)
+        return self._local_fallback(query, top)
+
+    async def close(self):
+        for client in self._async_clients.values():
+            await client.close()
+        self._async_clients.clear()
+        if self._http_session is not None:
+            await self._http_session.close()
+            self._http_session = None
@@ -0,0 +1,302 @@
+"""
+Offline load test for the RTMiddleTier relay.
+
+Starts a stand-in `/openai/realtime` WebSocket server and a stand-in Azure Cognitive Search
+endpoint in a helper process, serves the real RTMiddleTier in this process, and drives N
+parallel avatar sessions against it from a second helper process. Each session streams
+binary microphone audio, the fake service answers with scripted VAD/transcript events and a
+paced stream of audio and transcript deltas, and every server frame carries a monotonic
+timestamp so the client can measure how long the relay held it.
+
+Reports p50/p95/p99 relay latency and turn latency (last microphone frame to first model
+delta), relayed frames/sec, and the relay process's CPU time and RSS growth per session.
+Exits non-zero when --max-p99-ms is exceeded, so it can gate performance regressions.
+
+Usage: python bench_load.py [--sessions 50] [--turns 3] [--deltas 40] [--delta-interval 0.01] [--max-p99-ms 50]
+"""
+import argparse
+import asyncio
+import base64
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import time
+
+import aiohttp
+from aiohttp import web
+
+# chat.js streams 4096-sample blocks of 16 kHz PCM16; the service returns 100 ms deltas of 24 kHz PCM16
+CLIENT_BLOCK_SAMPLES = 4096
+CLIENT_SAMPLE_RATE = 16000
+SERVER_DELTA_SAMPLES = 2400
+SEARCH_INDEX = "bench"
+
+QUESTIONS = [
+    "Where is the keynote happening?",
+    "What time does the networking session start?",
+    "Who is speaking about digital humans?",
+    "Is there a demo of the avatar today?",
+]
+
+
+def _now() -> float:
+    # CLOCK_MONOTONIC is shared by every process on the host, so stamps compare across the helpers
+    return time.monotonic()
+
+
+def _audio_b64(samples: int) -> str:
+    return base64.b64encode(bytes(samples * 2)).decode("ascii")
+
+
+def percentile(values: list[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))]
+
+
+def rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        # Peak rather than current RSS, but close enough for growth per session on macOS
+        usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return usage if sys.platform == "darwin" else usage * 1024
+
+
+# --- Stand-in services -----------------------------------------------------------------------
+
+class FakeRealtimeService:
+    """
+    Scripted stand-in for the realtime API: after `frames_per_turn` microphone appends it reports
+    speech start/stop and a transcript, and answers each response.create with `deltas` audio deltas
+    (plus a transcript delta every third one) spaced `delta_interval` seconds apart.
+    """
+    def __init__(self, frames_per_turn: int, deltas: int, delta_interval: float):
+        self.frames_per_turn = frames_per_turn
+        self.deltas = deltas
+        self.delta_interval = delta_interval
+        self.audio_delta = _audio_b64(SERVER_DELTA_SAMPLES)
+
+    async def _respond(self, ws: web.WebSocketResponse, response_id: str):
+        await ws.send_json({"type": "response.created", "response": {"id": response_id}, "bench_ts": _now()})
+        for i in range(self.deltas):
+            await asyncio.sleep(self.delta_interval)
+            await ws.send_json({
+                "type": "response.audio.delta", "response_id": response_id, "item_id": f"item_{response_id}",
+                "output_index": 0, "content_index": 0, "delta": self.audio_delta, "bench_ts": _now()
+            })
+            if i % 3 == 0:
+                await ws.send_json({
+                    "type": "response.audio_transcript.delta", "response_id": response_id, "item_id": f"item_{response_id}",
+                    "output_index": 0, "content_index": 0, "delta": "word ", "bench_ts": _now()
+                })
+        await ws.send_json({"type": "response.done", "response": {"id": response_id, "output": []}, "bench_ts": _now()})
+
+    async def handler(self, request: web.Request) -> web.WebSocketResponse:
+        ws = web.WebSocketResponse(max_msg_size=0)
+        await ws.prepare(request)
+        await ws.send_json({"type": "session.created", "session": {"instructions": ""}, "bench_ts": _now()})
+        appends = 0
+        turns = 0
+        responder: asyncio.Task | None = None
+        async for msg in ws:
+            if msg.type != aiohttp.WSMsgType.TEXT:
+                continue
+            message = json.loads(msg.data)
+            match message["type"]:
+                case "session.update":
+                    await ws.send_json({"type": "session.updated", "session": message["session"], "bench_ts": _now()})
+                case "input_audio_buffer.append":
+                    appends += 1
+                    if appends % self.frames_per_turn == 0:
+                        item_id = f"item_user_{turns}"
+                        await ws.send_json({"type": "input_audio_buffer.speech_started", "item_id": item_id, "bench_ts": _now()})
+                        await ws.send_json({"type": "input_audio_buffer.speech_stopped", "item_id": item_id, "bench_ts": _now()})
+                        await ws.send_json({
+                            "type": "conversation.item.input_audio_transcription.completed", "item_id": item_id,
+                            "content_index": 0, "transcript": QUESTIONS[turns % len(QUESTIONS)], "bench_ts": _now()
+                        })
+                        turns += 1
+                case "response.create":
+                    responder = asyncio.create_task(self._respond(ws, f"resp_{turns}"))
+        if responder is not None:
+            responder.cancel()
+        return ws
+
+
+def fake_search_handler(latency: float):
+    async def handler(request: web.Request) -> web.Response:
+        body = await request.json()
+        await asyncio.sleep(latency)
+        docs = [{
+            "@search.score": 1.0 / (i + 1),
+            "content": f"Result {i} for '{body.get('search', '')}': the session is in Hall {i + 1} at {10 + i}:00.",
+            "people": [], "organizations": ["DXC"], "locations": [f"Hall {i + 1}"], "keyphrases": ["session"],
+        } for i in range(body.get("top", 3))]
+        return web.json_response({"value": docs})
+    return handler
+
+
+def run_services(args: argparse.Namespace, ports: multiprocessing.Queue):
+    async def serve():
+        realtime = FakeRealtimeService(args.frames_per_turn, args.deltas, args.delta_interval)
+        app = web.Application()
+        app.router.add_get("/openai/realtime", realtime.handler)
+        app.router.add_post(f"/indexes('{SEARCH_INDEX}')/docs/search.post.search", fake_search_handler(args.search_latency))
+        app.router.add_post(f"/indexes/{SEARCH_INDEX}/docs/search.post.search", fake_search_handler(args.search_latency))
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        ports.put(runner.addresses[0][1])
+        await asyncio.Event().wait()
+    asyncio.run(serve())
+
+
+# --- Client driver ---------------------------------------------------------------------------
+
+async def run_session(http: aiohttp.ClientSession, url: str, args: argparse.Namespace, results: dict):
+    mic_frame = bytes(CLIENT_BLOCK_SAMPLES * 2)
+    async with http.ws_connect(url, max_msg_size=0) as ws:
+        await ws.send_json({"type": "session.update", "session": {
+            "modalities": ["text", "audio"],
+            "input_audio_transcription": {"model": "whisper-1"},
+            "turn_detection": {"type": "server_vad"},
+        }})
+        for _ in range(args.turns):
+            for _ in range(args.frames_per_turn):
+                await ws.send_bytes(mic_frame)
+                await asyncio.sleep(args.frame_interval)
+            spoke_at = _now()
+            first_delta = True
+            async for msg in ws:
+                if msg.type != aiohttp.WSMsgType.TEXT:
+                    break
+                received = _now()
+                message = json.loads(msg.data)
+                results["frames"] += 1
+                if "bench_ts" in message:
+                    results["relay"].append(received - message["bench_ts"])
+                if first_delta and message["type"] in ("response.audio.delta", "response.audio_transcript.delta"):
+                    results["turn"].append(received - spoke_at)
+                    first_delta = False
+                if message["type"] == "response.done":
+                    break
+            else:
+                raise ConnectionError("relay closed the session mid-turn")
+
+
+async def drive(url: str, args: argparse.Namespace) -> dict:
+    results = {"frames": 0, "relay": [], "turn": [], "errors": 0, "elapsed": 0.0}
+    start = _now()
+    async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=0)) as http:
+        outcomes = await asyncio.gather(*(run_session(http, url, args, results) for _ in range(args.sessions)),
+                                        return_exceptions=True)
+    results["errors"] = sum(1 for outcome in outcomes if isinstance(outcome, BaseException))
+    results["elapsed"] = _now() - start
+    return results
+
+
+def run_driver(url: str, args: argparse.Namespace, out: multiprocessing.Queue):
+    out.put(asyncio.run(drive(url, args)))
+
+
+# --- Relay under test ------------------------------------------------------------------------
+
+async def run_relay(args: argparse.Namespace, service_port: int) -> dict:
+    # Point the RAG helper at the stand-in search service before it reads its configuration
+    os.environ["AZURE_SEARCH_ENDPOINT"] = f"http://127.0.0.1:{service_port}"
+    os.environ["AZURE_SEARCH_INDEX"] = SEARCH_INDEX
+    os.environ["AZURE_SEARCH_API_KEY"] = "bench"
+    # Every simulated visitor connects from this host; admission limits can still be set explicitly
+    os.environ.setdefault("ADMISSION_IP_RATE", "0")
+    os.environ.setdefault("ADMISSION_MAX_SESSIONS", str(args.sessions))
+    from azure.core.credentials import AzureKeyCredential
+    from rtmt import RTMiddleTier
+
+    rtmt = RTMiddleTier(endpoint=f"http://127.0.0.1:{service_port}", deployment="bench", credentials=AzureKeyCredential("bench"))
+    app = web.Application()
+    rtmt.attach_to_app(app, "/realtime")
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    url = f"http://127.0.0.1:{runner.addresses[0][1]}/realtime?input_rate={CLIENT_SAMPLE_RATE}"
+
+    # Let the upstream pool pre-dial before taking the baseline
+    await asyncio.sleep(0.5)
+    base_rss = peak_rss = rss_bytes()
+    base_usage = resource.getrusage(resource.RUSAGE_SELF)
+
+    out = multiprocessing.Queue()
+    driver = multiprocessing.Process(target=run_driver, args=(url, args, out), daemon=True)
+    driver.start()
+    result = asyncio.create_task(asyncio.to_thread(out.get))
+    while not result.done():
+        peak_rss = max(peak_rss, rss_bytes())
+        await asyncio.wait([result], timeout=0.1)
+    results = result.result()
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    driver.join()
+
+    results["cpu"] = (usage.ru_utime - base_usage.ru_utime) + (usage.ru_stime - base_usage.ru_stime)
+    results["rss_growth"] = peak_rss - base_rss
+    results["relayed_frames"] = sum(rtmt._frames.values.values())
+    results["rag_prefetch"] = dict(rtmt.rag_prefetch_stats)
+    await runner.cleanup()
+    return results
+
+
+def report(args: argparse.Namespace, results: dict):
+    sessions = args.sessions
+    relay_ms = [v * 1000 for v in results["relay"]]
+    turn_ms = [v * 1000 for v in results["turn"]]
+    print(f"{sessions} sessions x {args.turns} turns, {results['errors']} failed, {results['elapsed']:.2f}s wall")
+    print(f"relay latency  p50 {percentile(relay_ms, 50):8.2f} ms   p95 {percentile(relay_ms, 95):8.2f} ms   p99 {percentile(relay_ms, 99):8.2f} ms")
+    print(f"turn latency   p50 {percentile(turn_ms, 50):8.2f} ms   p95 {percentile(turn_ms, 95):8.2f} ms   p99 {percentile(turn_ms, 99):8.2f} ms")
+    print(f"throughput     {results['relayed_frames'] / results['elapsed']:>10,.0f} relayed frames/s ({results['frames']:,} frames delivered)")
+    print(f"per session    {results['cpu'] * 1000 / sessions:8.2f} ms CPU   {results['rss_growth'] / 1024 / sessions:8.1f} KiB RSS")
+    print(f"rag prefetch   {results['rag_prefetch']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=50, help="parallel client sessions")
+    parser.add_argument("--turns", type=int, default=3, help="conversational turns per session")
+    parser.add_argument("--frames-per-turn", type=int, default=4, help="microphone frames the client sends per turn")
+    parser.add_argument("--frame-interval", type=float, default=0.02, help="seconds between microphone frames")
+    parser.add_argument("--deltas", type=int, default=40, help="audio deltas per model response")
+    parser.add_argument("--delta-interval", type=float, default=0.01, help="seconds between audio deltas from the fake service")
+    parser.add_argument("--search-latency", type=float, default=0.05, help="seconds the fake search service takes per query")
+    parser.add_argument("--max-p99-ms", type=float, default=None, help="fail if p99 relay latency exceeds this")
+    parser.add_argument("--json", action="store_true", help="print the raw summary as JSON")
+    args = parser.parse_args()
+
+    ports = multiprocessing.Queue()
+    services = multiprocessing.Process(target=run_services, args=(args, ports), daemon=True)
+    services.start()
+    try:
+        results = asyncio.run(run_relay(args, ports.get(timeout=30)))
+    finally:
+        services.terminate()
+
+    if args.json:
+        relay = results.pop("relay")
+        turn = results.pop("turn")
+        results.update({f"relay_p{p}_ms": percentile(relay, p) * 1000 for p in (50, 95, 99)})
+        results.update({f"turn_p{p}_ms": percentile(turn, p) * 1000 for p in (50, 95, 99)})
+        print(json.dumps(results, indent=2))
+        p99 = results["relay_p99_ms"]
+    else:
+        report(args, results)
+        p99 = percentile(results["relay"], 99) * 1000
+    if results["errors"] or (args.max_p99_ms is not None and p99 > args.max_p99_ms):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
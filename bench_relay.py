@@ -0,0 +1,115 @@
+"""
+Microbenchmark for the RTMiddleTier relay hot path.
+
+Replays a synthetic realtime conversation (microphone appends, audio deltas, transcript
+deltas and the occasional control frame) through the relay's message processors and
+reports frames/sec and CPU time per relayed second of audio. The "before" numbers model
+the previous relay, which decoded every frame (client-bound frames twice) before deciding
+whether to forward it unchanged.
+
+Usage: python bench_relay.py [--seconds 60]
+"""
+import argparse
+import asyncio
+import base64
+import json
+import os
+import time
+
+import aiohttp
+from azure.core.credentials import AzureKeyCredential
+
+from rtmt import RTMiddleTier, RTSession
+
+# chat.js streams 4096-sample blocks of 16 kHz PCM16; the service returns 24 kHz PCM16 deltas
+CLIENT_BLOCK_SAMPLES = 4096
+CLIENT_SAMPLE_RATE = 16000
+SERVER_DELTA_SAMPLES = 2400
+SERVER_SAMPLE_RATE = 24000
+
+
+def _audio_b64(samples: int) -> str:
+    return base64.b64encode(os.urandom(samples * 2)).decode("ascii")
+
+
+def build_traffic(seconds: int) -> tuple[list[str], list[str]]:
+    """
+    Return (to_server, to_client) frame lists covering `seconds` of audio in each direction.
+    """
+    to_server = []
+    for i in range(seconds * CLIENT_SAMPLE_RATE // CLIENT_BLOCK_SAMPLES):
+        to_server.append(json.dumps({"type": "input_audio_buffer.append", "audio": _audio_b64(CLIENT_BLOCK_SAMPLES)}))
+    to_server.append(json.dumps({"type": "session.update", "session": {"modalities": ["text", "audio"]}}))
+
+    to_client = []
+    for i in range(seconds * SERVER_SAMPLE_RATE // SERVER_DELTA_SAMPLES):
+        to_client.append(json.dumps({
+            "type": "response.audio.delta", "event_id": f"event_{i}", "response_id": "resp_1",
+            "item_id": "item_1", "output_index": 0, "content_index": 0, "delta": _audio_b64(SERVER_DELTA_SAMPLES)
+        }))
+        if i % 3 == 0:
+            to_client.append(json.dumps({
+                "type": "response.audio_transcript.delta", "event_id": f"event_t{i}", "response_id": "resp_1",
+                "item_id": "item_1", "output_index": 0, "content_index": 0, "delta": "word "
+            }))
+        if i % 50 == 0:
+            to_client.append(json.dumps({"type": "response.done", "response": {"id": "resp_1", "output": []}}))
+    return to_server, to_client
+
+
+async def legacy_to_client(msg: aiohttp.WSMessage) -> str:
+    message = json.loads(msg.data)
+    message.get("type")
+    message = json.loads(msg.data)
+    return msg.data
+
+
+async def legacy_to_server(msg: aiohttp.WSMessage) -> str:
+    json.loads(msg.data)
+    return msg.data
+
+
+async def run(to_server_fn, to_client_fn, to_server: list[str], to_client: list[str]) -> tuple[float, float]:
+    server_msgs = [aiohttp.WSMessage(aiohttp.WSMsgType.TEXT, data, None) for data in to_server]
+    client_msgs = [aiohttp.WSMessage(aiohttp.WSMsgType.TEXT, data, None) for data in to_client]
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    for msg in server_msgs:
+        await to_server_fn(msg)
+    for msg in client_msgs:
+        await to_client_fn(msg)
+    return time.perf_counter() - wall_start, time.process_time() - cpu_start
+
+
+def report(label: str, frames: int, audio_seconds: int, wall: float, cpu: float):
+    print(f"{label:<8} {frames / wall:>12,.0f} frames/s   {cpu * 1000 / audio_seconds:>8.3f} ms CPU per relayed audio second")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=int, default=60, help="seconds of audio to relay in each direction")
+    args = parser.parse_args()
+
+    rtmt = RTMiddleTier(endpoint="https://bench.invalid", deployment="bench", credentials=AzureKeyCredential("bench"))
+    to_server, to_client = build_traffic(args.seconds)
+    frames = len(to_server) + len(to_client)
+    # Both directions carry `seconds` of audio
+    audio_seconds = args.seconds * 2
+
+    rt_session = RTSession(None, None)
+
+    async def after_to_server(msg):
+        return await rtmt._process_message_to_server(msg, rt_session)
+
+    async def after_to_client(msg):
+        return await rtmt._process_message_to_client(msg, rt_session)
+
+    print(f"Relaying {frames:,} frames ({args.seconds}s of audio each way)")
+    wall, cpu = await run(legacy_to_server, legacy_to_client, to_server, to_client)
+    report("before", frames, audio_seconds, wall, cpu)
+    wall, cpu = await run(after_to_server, after_to_client, to_server, to_client)
+    report("after", frames, audio_seconds, wall, cpu)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
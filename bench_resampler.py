@@ -0,0 +1,50 @@
+"""
+Throughput benchmark for the streaming PCM16 resampler used for binary audio ingest.
+
+Feeds `--seconds` of synthetic microphone audio through StreamingResampler in chat.js-sized
+frames (4096 samples) and reports realtime factor, frames/sec and CPU per audio second.
+
+Usage: python bench_resampler.py [--seconds 600] [--in-rate 16000] [--out-rate 24000]
+"""
+import argparse
+import time
+
+import numpy as np
+
+from resampler import StreamingResampler
+
+FRAME_SAMPLES = 4096
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=int, default=600, help="seconds of audio to resample")
+    parser.add_argument("--in-rate", type=int, default=16000, help="input sample rate")
+    parser.add_argument("--out-rate", type=int, default=24000, help="output sample rate")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    t = np.arange(args.in_rate * args.seconds) / args.in_rate
+    signal = 8000 * np.sin(2 * np.pi * 220 * t) + rng.normal(0, 500, len(t))
+    pcm16 = np.clip(signal, -32768, 32767).astype("<i2").tobytes()
+    frame_bytes = FRAME_SAMPLES * 2
+    frames = [pcm16[i:i + frame_bytes] for i in range(0, len(pcm16), frame_bytes)]
+
+    resampler = StreamingResampler(args.in_rate, args.out_rate)
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    out_bytes = 0
+    for frame in frames:
+        out_bytes += len(resampler.process(frame))
+    wall = time.perf_counter() - wall_start
+    cpu = time.process_time() - cpu_start
+
+    print(f"Resampled {args.seconds}s of audio {args.in_rate} Hz -> {args.out_rate} Hz in {len(frames):,} frames")
+    print(f"  output samples       : {out_bytes // 2:,}")
+    print(f"  realtime factor      : {args.seconds / wall:,.0f}x")
+    print(f"  frames/sec           : {len(frames) / wall:,.0f}")
+    print(f"  CPU per audio second : {cpu * 1000 / args.seconds:.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
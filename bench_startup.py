@@ -0,0 +1,146 @@
+"""
+Cold-start benchmark for the app.
+
+Measures how long a fresh interpreter takes to import `app` (median over --runs, plus the heaviest
+imports from `python -X importtime`), then starts the real app in a child process against a
+stand-in `/openai/realtime` service and reports, from process launch, when /healthz and
+/azure-config first answer and when /readyz reports every subsystem ready, with the warm-up time
+of each subsystem.
+
+Exits non-zero when --max-import-ms or --max-ready-ms is exceeded, so it can gate startup regressions.
+
+Usage: python bench_startup.py [--runs 5] [--max-import-ms 800] [--max-ready-ms 3000]
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import aiohttp
+from aiohttp import web
+
+ROOT = Path(__file__).parent
+SERVE_APP = "import sys; from aiohttp import web; import app; web.run_app(app.create_app(), host='127.0.0.1', port=int(sys.argv[1]), print=None)"
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def measure_import(runs: int) -> list[float]:
+    """
+    Seconds to import `app` in `runs` fresh interpreters.
+    """
+    code = "import time; start = time.perf_counter(); import app; print(time.perf_counter() - start)"
+    return [float(subprocess.run([sys.executable, "-c", code], cwd=ROOT, env=os.environ, capture_output=True,
+                                 text=True, check=True).stdout.split()[-1]) for _ in range(runs)]
+
+
+def heaviest_imports(count: int) -> list[tuple[str, float]]:
+    """
+    Top-level packages with the largest cumulative import time when importing `app`.
+    """
+    stderr = subprocess.run([sys.executable, "-X", "importtime", "-c", "import app"], cwd=ROOT, env=os.environ,
+                            capture_output=True, text=True, check=True).stderr
+    totals: dict[str, float] = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        # Imported directly by app: one level of indentation below it
+        if len(name) - len(name.lstrip()) == 3:
+            totals[name.strip()] = int(cumulative) / 1e6
+    return sorted(totals.items(), key=lambda item: item[1], reverse=True)[:count]
+
+
+async def fake_realtime(request: web.Request) -> web.WebSocketResponse:
+    ws = web.WebSocketResponse()
+    await ws.prepare(request)
+    await ws.send_json({"type": "session.created", "session": {}})
+    async for _ in ws:
+        pass
+    return ws
+
+
+async def measure_cold_start(timeout: float) -> dict:
+    service = web.Application()
+    service.router.add_get("/openai/realtime", fake_realtime)
+    runner = web.AppRunner(service, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+
+    port = _free_port()
+    env = dict(os.environ, RUNNING_IN_PRODUCTION="1", AZURE_OPENAI_API_KEY="bench",
+               AZURE_OPENAI_ENDPOINT=f"http://127.0.0.1:{runner.addresses[0][1]}",
+               AZURE_OPENAI_REALTIME_DEPLOYMENT="bench", LOG_LEVEL=os.environ.get("LOG_LEVEL", "WARNING"))
+    start = time.monotonic()
+    app = subprocess.Popen([sys.executable, "-c", SERVE_APP, str(port)], cwd=ROOT, env=env)
+    results: dict = {}
+    try:
+        async with aiohttp.ClientSession(f"http://127.0.0.1:{port}") as http:
+            while "ready" not in results:
+                if time.monotonic() - start > timeout:
+                    raise TimeoutError(f"app not ready after {timeout:.0f}s: {results}")
+                if app.poll() is not None:
+                    raise RuntimeError(f"app exited with code {app.returncode}")
+                for name, path in (("healthz", "/healthz"), ("azure_config", "/azure-config"), ("ready", "/readyz")):
+                    if name in results:
+                        continue
+                    try:
+                        async with http.get(path) as response:
+                            if response.status == 200:
+                                results[name] = time.monotonic() - start
+                                if name == "ready":
+                                    results["subsystems"] = (await response.json())["subsystems"]
+                    except aiohttp.ClientConnectionError:
+                        break
+                await asyncio.sleep(0.005)
+    finally:
+        app.terminate()
+        app.wait()
+        await runner.cleanup()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreters to time the import of app in")
+    parser.add_argument("--timeout", type=float, default=60, help="seconds to wait for /readyz")
+    parser.add_argument("--max-import-ms", type=float, default=None, help="fail if the median import time exceeds this")
+    parser.add_argument("--max-ready-ms", type=float, default=None, help="fail if /readyz takes longer than this from launch")
+    parser.add_argument("--json", action="store_true", help="print the raw summary as JSON")
+    args = parser.parse_args()
+
+    imports = measure_import(args.runs)
+    heaviest = heaviest_imports(5)
+    cold = asyncio.run(measure_cold_start(args.timeout))
+    import_ms = statistics.median(imports) * 1000
+    ready_ms = cold["ready"] * 1000
+
+    if args.json:
+        print(json.dumps({"import_ms": import_ms, "import_max_ms": max(imports) * 1000,
+                          "heaviest_imports_ms": {name: seconds * 1000 for name, seconds in heaviest},
+                          **{f"{k}_ms": v * 1000 for k, v in cold.items() if k != "subsystems"},
+                          "subsystems": cold["subsystems"]}, indent=2))
+    else:
+        print(f"import app      median {import_ms:8.1f} ms   max {max(imports) * 1000:8.1f} ms   ({args.runs} runs)")
+        print("heaviest        " + ", ".join(f"{name} {seconds * 1000:.0f} ms" for name, seconds in heaviest))
+        print(f"from launch     /healthz {cold['healthz'] * 1000:8.1f} ms   /azure-config {cold['azure_config'] * 1000:8.1f} ms   /readyz {ready_ms:8.1f} ms")
+        for name, subsystem in cold["subsystems"].items():
+            seconds = f"{subsystem['seconds'] * 1000:8.1f} ms" if "seconds" in subsystem else "       - ms"
+            print(f"  {name:<14} {subsystem['state']:<8} {seconds}{'' if subsystem['required'] else '   (optional)'}")
+    if (args.max_import_ms is not None and import_ms > args.max_import_ms) or (args.max_ready_ms is not None and ready_ms > args.max_ready_ms):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+import os
+import re
+from typing import Any, Dict, List, NamedTuple, Optional
+
+from rag_cache import content_terms
+
+_TOKEN_PIECES = re.compile(r"\w+|[^\w\s]")
+_WORDS = re.compile(r"\w+")
+_SENTENCE_BREAK = re.compile(r"(?<=[.!?])\s+|\n+")
+METADATA_FIELDS = (("people", "People"), ("organizations", "Organizations"), ("locations", "Locations"), ("keyphrases", "Keyphrases"))
+
+def estimate_tokens(text: str) -> int:
+    """
+    Cheap local estimate of BPE tokens: one per punctuation mark or short word, plus one per
+    further four characters of a long word. Close enough to budget prompt size without a tokenizer.
+    """
+    return sum(1 + (len(piece) - 1) // 4 for piece in _TOKEN_PIECES.findall(text))
+
+def _shingles(text: str) -> set[tuple[str, ...]]:
+    words = _WORDS.findall(text.lower())
+    if len(words) < 3:
+        return {tuple(words)}
+    return {tuple(words[i:i + 3]) for i in range(len(words) - 2)}
+
+def format_documents(docs: List[Dict[str, Any]]) -> str:
+    """
+    The uncompiled context block: every document's full content and metadata lists.
+    """
+    lines = []
+    for i, doc in enumerate(docs, 1):
+        lines.append(f"[Source {i}] {doc.get('content', '')}")
+        for field, label in METADATA_FIELDS:
+            if doc.get(field):
+                lines.append(f"  {label}: {', '.join(doc[field])}")
+    return "\n".join(lines)
+
+class CompiledContext(NamedTuple):
+    text: str
+    tokens: int
+    original_tokens: int
+
+    @property
+    def tokens_saved(self) -> int:
+        return max(0, self.original_tokens - self.tokens)
+
+class ContextCompiler:
+    """
+    Builds the knowledge block injected ahead of a response under a token budget (RAG_CONTEXT_TOKEN_BUDGET).
+    Near-duplicate passages are dropped across results, the sentences sharing the most terms with the
+    query are kept first (ties go to higher-ranked documents and earlier sentences), and metadata
+    values matching the query only fill whatever budget is left. Kept sentences keep their order.
+    """
+    token_budget: int
+    duplicate_threshold: float
+
+    def __init__(self, token_budget: Optional[int] = None, duplicate_threshold: float = 0.8):
+        self.token_budget = token_budget if token_budget is not None else int(os.environ.get("RAG_CONTEXT_TOKEN_BUDGET", "400"))
+        self.duplicate_threshold = duplicate_threshold
+
+    def _is_duplicate(self, shingles: set, seen: List[set]) -> bool:
+        for other in seen:
+            overlap = len(shingles & other)
+            if overlap and overlap / min(len(shingles), len(other)) >= self.duplicate_threshold:
+                return True
+        return False
+
+    def compile(self, query: str, docs: List[Dict[str, Any]]) -> CompiledContext:
+        original_tokens = estimate_tokens(format_documents(docs))
+        query_terms = set(content_terms(query))
+
+        # (negated score, doc index, sentence position, text, tokens) for every distinct sentence
+        candidates = []
+        seen_passages: List[set] = []
+        seen_sentences: List[set] = []
+        kept_docs = []
+        for doc in docs:
+            content = doc.get("content", "") or ""
+            shingles = _shingles(content)
+            if content and self._is_duplicate(shingles, seen_passages):
+                continue
+            seen_passages.append(shingles)
+            doc_index = len(kept_docs)
+            kept_docs.append(doc)
+            for position, sentence in enumerate(s.strip() for s in _SENTENCE_BREAK.split(content)):
+                if not sentence:
+                    continue
+                sentence_shingles = _shingles(sentence)
+                if self._is_duplicate(sentence_shingles, seen_sentences):
+                    continue
+                seen_sentences.append(sentence_shingles)
+                score = len(query_terms & set(content_terms(sentence)))
+                candidates.append((-score, doc_index, position, sentence, estimate_tokens(sentence)))
+
+        # Per-source "[Source n]" prefixes cost a few tokens each
+        used = 0
+        selected: Dict[int, List[tuple[int, str]]] = {}
+        for _, doc_index, position, sentence, tokens in sorted(candidates):
+            cost = tokens + (0 if doc_index in selected else 4)
+            if used + cost > self.token_budget:
+                continue
+            used += cost
+            selected.setdefault(doc_index, []).append((position, sentence))
+
+        lines = []
+        for source, doc_index in enumerate(sorted(selected), 1):
+            sentences = " ".join(sentence for _, sentence in sorted(selected[doc_index]))
+            lines.append(f"[Source {source}] {sentences}")
+            doc = kept_docs[doc_index]
+            block_text = sentences.lower()
+            for field, label in METADATA_FIELDS:
+                # Only values the visitor asked about and the kept sentences do not already spell out
+                values = [v for v in doc.get(field) or [] if query_terms.intersection(content_terms(v)) and v.lower() not in block_text]
+                if not values:
+                    continue
+                line = f"  {label}: {', '.join(values)}"
+                tokens = estimate_tokens(line)
+                if used + tokens <= self.token_budget:
+                    used += tokens
+                    lines.append(line)
+        text = "\n".join(lines)
+        return CompiledContext(text, estimate_tokens(text), original_tokens)
@@ -0,0 +1,171 @@
+import os
+import uuid
+from typing import Any, Optional
+
+from context_compiler import estimate_tokens
+
+# Ids of items the middle tier creates itself (at most 32 characters, as the realtime API requires)
+CONTEXT_ITEM_PREFIX = "mt_ctx_"
+SUMMARY_ITEM_PREFIX = "mt_sum_"
+
+class ConversationItem:
+    id: str
+    role: str
+    kind: str
+    text: str
+    tokens: int
+
+    def __init__(self, id: str, role: str, kind: str, text: str = ""):
+        self.id = id
+        self.role = role
+        self.kind = kind
+        self.set_text(text)
+
+    def set_text(self, text: str):
+        self.text = text
+        self.tokens = estimate_tokens(text)
+
+def _item_text(item: dict[str, Any]) -> str:
+    if item.get("type") == "function_call":
+        return f"{item.get('name', '')} {item.get('arguments', '')}"
+    if item.get("type") == "function_call_output":
+        return str(item.get("output", ""))
+    parts = []
+    for content in item.get("content") or []:
+        parts.append(content.get("text") or content.get("transcript") or "")
+    return " ".join(part for part in parts if part)
+
+def _snippet(text: str, limit: int = 120) -> str:
+    text = " ".join(text.split())
+    if len(text) <= limit:
+        return text
+    return text[:limit].rsplit(" ", 1)[0] + "..."
+
+class ConversationWindow:
+    """
+    Mirror of the upstream conversation for one session, used to keep it bounded. Items are tracked
+    from conversation.item.created (text filled in from transcripts as they complete). Once the
+    estimated tokens exceed CONVERSATION_MAX_TOKENS or the visitor turns exceed CONVERSATION_MAX_TURNS,
+    everything before the last CONVERSATION_KEEP_TURNS turns is deleted and replaced by one rolling
+    summary item at the start of the conversation. Injected knowledge blocks are deleted as soon as
+    the turn they were retrieved for has been answered.
+    """
+    def __init__(self, max_tokens: Optional[int] = None, max_turns: Optional[int] = None,
+                 keep_turns: Optional[int] = None, summary_tokens: Optional[int] = None):
+        self.max_tokens = max_tokens if max_tokens is not None else int(os.environ.get("CONVERSATION_MAX_TOKENS", "3000"))
+        self.max_turns = max_turns if max_turns is not None else int(os.environ.get("CONVERSATION_MAX_TURNS", "12"))
+        self.keep_turns = keep_turns if keep_turns is not None else int(os.environ.get("CONVERSATION_KEEP_TURNS", "4"))
+        self.summary_tokens = summary_tokens if summary_tokens is not None else int(os.environ.get("CONVERSATION_SUMMARY_TOKENS", "200"))
+        self.items: list[ConversationItem] = []
+        self.summary_lines: list[str] = []
+        self.summary_id: Optional[str] = None
+        self._deleting: set[str] = set()
+        self.items_deleted = 0
+        self.tokens_trimmed = 0
+
+    def _find(self, item_id: str) -> Optional[ConversationItem]:
+        return next((item for item in self.items if item.id == item_id), None)
+
+    def tokens(self) -> int:
+        return sum(item.tokens for item in self.items)
+
+    def turns(self) -> int:
+        return sum(1 for item in self.items if item.role == "user")
+
+    def item_created(self, item: dict[str, Any]):
+        item_id = item.get("id")
+        if not item_id or self._find(item_id) is not None:
+            return
+        if item_id.startswith(CONTEXT_ITEM_PREFIX):
+            kind = "context"
+        elif item_id.startswith(SUMMARY_ITEM_PREFIX):
+            kind = "summary"
+        else:
+            kind = item.get("type", "message")
+        self.items.append(ConversationItem(item_id, item.get("role", ""), kind, _item_text(item)))
+
+    def item_text(self, item_id: str, text: str):
+        """
+        Record text that arrived after the item was created: the visitor's transcript or the model's output.
+        """
+        item = self._find(item_id)
+        if item is not None and text:
+            item.set_text(text)
+
+    def item_done(self, item: dict[str, Any]):
+        self.item_text(item.get("id", ""), _item_text(item))
+
+    def item_deleted(self, item_id: str) -> bool:
+        """
+        Forget a deleted item; returns True if the middle tier asked for the deletion itself.
+        """
+        self.items = [item for item in self.items if item.id != item_id]
+        if item_id in self._deleting:
+            self._deleting.discard(item_id)
+            return True
+        return False
+
+    def delete(self, item_id: str) -> dict[str, Any]:
+        """
+        The event that deletes `item_id` from the conversation, e.g. the output of a replaced response.
+        """
+        return self._delete(self._find(item_id) or ConversationItem(item_id, "", "message"))
+
+    def new_context_id(self) -> str:
+        return CONTEXT_ITEM_PREFIX + uuid.uuid4().hex[:24]
+
+    def _delete(self, item: ConversationItem) -> dict[str, Any]:
+        self._deleting.add(item.id)
+        self.items_deleted += 1
+        return {"type": "conversation.item.delete", "item_id": item.id}
+
+    def on_response_done(self) -> list[dict[str, Any]]:
+        """
+        Called when a turn has been fully answered; returns the events that drop its knowledge
+        blocks and, if the window is over budget, trim and summarize the oldest turns.
+        """
+        events = [self._delete(item) for item in self.items if item.kind == "context" and item.id not in self._deleting]
+        if self.tokens() > self.max_tokens or self.turns() > self.max_turns:
+            events.extend(self._trim())
+        return events
+
+    def _trim(self) -> list[dict[str, Any]]:
+        user_positions = [i for i, item in enumerate(self.items) if item.role == "user"]
+        if len(user_positions) <= self.keep_turns:
+            return []
+        keep_from = user_positions[-self.keep_turns] if self.keep_turns > 0 else len(self.items)
+        trimmed = [item for item in self.items[:keep_from] if item.kind != "summary" and item.id not in self._deleting]
+        if not trimmed:
+            return []
+        events = []
+        for item in trimmed:
+            self.tokens_trimmed += item.tokens
+            events.append(self._delete(item))
+            if item.kind == "message" and item.text and item.role in ("user", "assistant"):
+                speaker = "Visitor" if item.role == "user" else "Assistant"
+                self.summary_lines.append(f"- {speaker}: {_snippet(item.text)}")
+        # Oldest lines go first when the summary outgrows its budget
+        while self.summary_lines and estimate_tokens("\n".join(self.summary_lines)) > self.summary_tokens:
+            self.summary_lines.pop(0)
+        if self.summary_lines:
+            if self.summary_id is not None and self._find(self.summary_id) is not None:
+                events.append(self._delete(self._find(self.summary_id)))
+            self.summary_id = SUMMARY_ITEM_PREFIX + uuid.uuid4().hex[:24]
+            events.append({
+                "type": "conversation.item.create",
+                "previous_item_id": "root",
+                "item": {
+                    "id": self.summary_id,
+                    "type": "message",
+                    "role": "system",
+                    "content": [{
+                        "type": "input_text",
+                        "text": "Summary of the earlier conversation (older turns were removed):\n" + "\n".join(self.summary_lines)
+                    }]
+                }
+            })
+        return events
+
+    def stats(self) -> dict[str, int]:
+        return {"items": len(self.items), "tokens": self.tokens(), "turns": self.turns(),
+                "items_deleted": self.items_deleted, "tokens_trimmed": self.tokens_trimmed}
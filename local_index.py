@@ -0,0 +1,224 @@
+"""
+Embedded retrieval index for the static event corpus.
+
+Build once from exported documents (JSON lines or a JSON array of objects in the search index
+shape, or a plain-text file split into paragraphs), then the middle tier memory-maps it at
+startup, so it costs no parse time and every worker process shares the same pages.
+
+Usage:
+    python local_index.py build docs.jsonl local_index/ [--dense-dim 256]
+    python local_index.py query local_index/ "where is the keynote"
+"""
+import argparse
+import json
+import mmap
+import os
+import time
+import zlib
+from collections import Counter, defaultdict
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from rag_cache import content_terms
+
+METADATA_FIELDS = ("people", "organizations", "locations", "keyphrases")
+
+def _dense_features(text: str) -> List[str]:
+    # Words plus character trigrams, so transcription misspellings still land near the right passage
+    features = []
+    for term in content_terms(text):
+        features.append(term)
+        padded = f"#{term}#"
+        features.extend(padded[i:i + 3] for i in range(len(padded) - 2))
+    return features
+
+def dense_vector(text: str, dim: int) -> np.ndarray:
+    """
+    Signed feature-hashing embedding of `text`, L2-normalized. Needs no model, so queries can be
+    embedded in-process in microseconds.
+    """
+    vector = np.zeros(dim, dtype=np.float32)
+    for feature in _dense_features(text):
+        h = zlib.crc32(feature.encode())
+        vector[h % dim] += 1.0 if h & 0x80000000 else -1.0
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+def load_documents(path: str, content_field: str = "content") -> List[Dict[str, Any]]:
+    text = Path(path).read_text(encoding="utf-8")
+    if path.endswith(".txt"):
+        return [{"content": " ".join(p.split()), **{field: [] for field in METADATA_FIELDS}} for p in text.split("\n\n") if p.strip()]
+    stripped = text.lstrip()
+    records = json.loads(text) if stripped.startswith("[") else [json.loads(line) for line in text.splitlines() if line.strip()]
+    return [{
+        "content": record.get(content_field, ""),
+        **{field: list(record.get(field) or []) for field in METADATA_FIELDS},
+    } for record in records]
+
+def build_index(docs: List[Dict[str, Any]], directory: str, dense_dim: int = 0, k1: float = 1.2, b: float = 0.75):
+    """
+    Write a BM25 inverted index (and optionally hashed dense vectors) for `docs` to `directory`.
+    Metadata values are indexed along with the content, as the search index does.
+    """
+    out = Path(directory)
+    out.mkdir(parents=True, exist_ok=True)
+    postings: Dict[str, List[tuple[int, int]]] = defaultdict(list)
+    doc_lengths = []
+    for doc_id, doc in enumerate(docs):
+        text = " ".join([doc.get("content", "")] + [" ".join(doc.get(field) or []) for field in METADATA_FIELDS])
+        terms = content_terms(text)
+        doc_lengths.append(len(terms))
+        for term, tf in Counter(terms).items():
+            postings[term].append((doc_id, tf))
+
+    # The vocabulary is a sorted term array with the start of each term's postings (plus the end of
+    # the last), so it is memory-mapped and binary-searched like the postings instead of parsed
+    terms = sorted(postings)
+    term_offsets = [0]
+    doc_ids, tfs = [], []
+    for term in terms:
+        term_offsets.append(term_offsets[-1] + len(postings[term]))
+        for doc_id, tf in postings[term]:
+            doc_ids.append(doc_id)
+            tfs.append(tf)
+    lengths = np.asarray(doc_lengths, dtype=np.float32)
+    avgdl = float(lengths.mean()) if len(lengths) else 0.0
+    # BM25's per-document length normalization is precomputed so a query only gathers and adds
+    norms = (k1 * (1 - b + b * lengths / avgdl)).astype(np.float32) if avgdl else np.full(len(docs), k1, dtype=np.float32)
+
+    np.save(out / "terms.npy", np.asarray(terms, dtype=f"<U{max(map(len, terms), default=1)}"))
+    np.save(out / "term_offsets.npy", np.asarray(term_offsets, dtype=np.int64))
+    np.save(out / "doc_ids.npy", np.asarray(doc_ids, dtype=np.int32))
+    np.save(out / "tfs.npy", np.asarray(tfs, dtype=np.float32))
+    np.save(out / "norms.npy", norms)
+    if dense_dim:
+        np.save(out / "vectors.npy", np.stack([dense_vector(doc.get("content", ""), dense_dim) for doc in docs]) if docs
+                else np.zeros((0, dense_dim), dtype=np.float32))
+
+    offsets = [0]
+    with open(out / "docs.jsonl", "wb") as f:
+        for doc in docs:
+            line = (json.dumps(doc, ensure_ascii=False) + "\n").encode("utf-8")
+            f.write(line)
+            offsets.append(offsets[-1] + len(line))
+    np.save(out / "doc_offsets.npy", np.asarray(offsets, dtype=np.int64))
+    (out / "meta.json").write_text(json.dumps({"documents": len(docs), "k1": k1, "dense_dim": dense_dim}))
+
+class LocalIndex:
+    """
+    Memory-mapped BM25 index, optionally blended with hashed dense vectors. A query touches only the
+    postings of its own terms (plus one matrix-vector product when vectors are present), which keeps
+    lookups well under a millisecond for an event-sized corpus.
+    """
+    dense_weight: float = 0.3
+    # Dense-only matches (no exact term in common, e.g. a misheard name) must be at least this similar
+    dense_min_similarity: float = 0.3
+
+    def __init__(self, directory: str):
+        path = Path(directory)
+        meta = json.loads((path / "meta.json").read_text())
+        self.directory = path
+        self.documents = meta["documents"]
+        self.k1 = meta["k1"]
+        self.dense_dim = meta["dense_dim"]
+        self.terms = np.load(path / "terms.npy", mmap_mode="r")
+        self.term_offsets = np.load(path / "term_offsets.npy", mmap_mode="r")
+        # Terms longer than the longest indexed one cannot match (and would be truncated by a lookup)
+        self._max_term_length = self.terms.dtype.itemsize // np.dtype("<U1").itemsize
+        self.doc_ids = np.load(path / "doc_ids.npy", mmap_mode="r")
+        self.tfs = np.load(path / "tfs.npy", mmap_mode="r")
+        self.norms = np.load(path / "norms.npy", mmap_mode="r")
+        self.vectors = np.load(path / "vectors.npy", mmap_mode="r") if self.dense_dim else None
+        self.doc_offsets = np.load(path / "doc_offsets.npy", mmap_mode="r")
+        with open(path / "docs.jsonl", "rb") as f:
+            self._docs = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if self.documents else b""
+
+    def _postings(self, term: str) -> Optional[tuple[int, int]]:
+        """
+        Start and end of `term`'s postings, or None if no document contains it.
+        """
+        if len(term) > self._max_term_length:
+            return None
+        i = int(np.searchsorted(self.terms, term))
+        if i == len(self.terms) or self.terms[i] != term:
+            return None
+        return int(self.term_offsets[i]), int(self.term_offsets[i + 1])
+
+    def _document(self, doc_id: int) -> Dict[str, Any]:
+        return json.loads(self._docs[int(self.doc_offsets[doc_id]):int(self.doc_offsets[doc_id + 1])])
+
+    def search(self, query: str, top: int = 3) -> List[tuple[Dict[str, Any], float, float]]:
+        """
+        Return up to `top` (document, score, coverage) tuples, best first. Coverage is the fraction of the
+        query's distinct terms found in the document, a scale-free confidence for tiering decisions.
+        """
+        terms = set(content_terms(query))
+        if not terms or not self.documents:
+            return []
+        scores = np.zeros(self.documents, dtype=np.float32)
+        matched = np.zeros(self.documents, dtype=np.float32)
+        for term in terms:
+            span = self._postings(term)
+            if span is None:
+                continue
+            ids = self.doc_ids[span[0]:span[1]]
+            tf = self.tfs[span[0]:span[1]]
+            df = span[1] - span[0]
+            idf = np.log(1 + (self.documents - df + 0.5) / (df + 0.5))
+            scores[ids] += idf * tf * (self.k1 + 1) / (tf + self.norms[ids])
+            matched[ids] += 1
+        candidates = matched > 0
+        if self.vectors is not None:
+            similarity = self.vectors @ dense_vector(query, self.dense_dim)
+            if scores.max() > 0:
+                scores = scores / scores.max()
+            scores = scores + self.dense_weight * similarity
+            candidates |= similarity >= self.dense_min_similarity
+        candidates = np.flatnonzero(candidates)
+        if len(candidates) == 0:
+            return []
+        best = candidates[np.argsort(-scores[candidates], kind="stable")[:top]]
+        return [(self._document(int(i)), float(scores[i]), float(matched[i] / len(terms))) for i in best]
+
+def open_local_index(directory: Optional[str] = None) -> Optional[LocalIndex]:
+    """
+    Open the index at `directory` (default LOCAL_INDEX_DIR), or None when none is configured.
+    """
+    directory = directory if directory is not None else os.environ.get("LOCAL_INDEX_DIR")
+    if not directory:
+        return None
+    return LocalIndex(directory)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="build an index from exported documents")
+    build.add_argument("source", help="JSON lines, JSON array or .txt file of documents")
+    build.add_argument("directory", help="output directory")
+    build.add_argument("--content-field", default="content", help="field holding the document text")
+    build.add_argument("--dense-dim", type=int, default=0, help="also store hashed dense vectors of this size (e.g. 256)")
+    query = commands.add_parser("query", help="run a query against a built index")
+    query.add_argument("directory")
+    query.add_argument("text")
+    query.add_argument("--top", type=int, default=3)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        docs = load_documents(args.source, args.content_field)
+        build_index(docs, args.directory, args.dense_dim)
+        print(f"Indexed {len(docs)} documents into {args.directory}")
+    else:
+        index = LocalIndex(args.directory)
+        index.search(args.text, args.top)
+        start = time.perf_counter()
+        for _ in range(1000):
+            results = index.search(args.text, args.top)
+        elapsed = (time.perf_counter() - start) / 1000
+        for doc, score, coverage in results:
+            print(f"{score:7.3f}  {coverage:4.0%}  {doc['content'][:100]}")
+        print(f"{elapsed * 1e6:.1f} us per query")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+import asyncio
+import os
+import re
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+# Words that do not change what a kiosk visitor is asking for ("where is the event" == "where's event?")
+STOP_WORDS = frozenset({
+    "a", "an", "the", "is", "are", "was", "were", "be", "am", "do", "does", "did",
+    "of", "to", "in", "on", "at", "for", "and", "or", "me", "i", "you", "can", "could",
+    "please", "tell", "about", "what's", "whats", "s", "it", "this", "that", "us", "we",
+})
+
+_PUNCTUATION = re.compile(r"[^\w\s]")
+
+_WORDS = re.compile(r"\w+")
+
+CacheKey = Tuple[str, int, Tuple[str, ...]]
+
+def normalize_query(query: str) -> str:
+    """
+    Normalize case, punctuation, whitespace and stop-words so repeated phrasings share a cache entry.
+    """
+    tokens = _PUNCTUATION.sub(" ", query.lower()).split()
+    content_tokens = [t for t in tokens if t not in STOP_WORDS]
+    # A query made only of stop-words still has to be distinguishable from other queries
+    return " ".join(content_tokens or tokens)
+
+def content_terms(text: str) -> List[str]:
+    """
+    Lower-cased content words with stop-words removed and a trailing plural "s" folded,
+    so "sessions" matches "session". Used for relevance scoring rather than cache keys.
+    """
+    terms = []
+    for word in _WORDS.findall(text.lower()):
+        if word in STOP_WORDS:
+            continue
+        terms.append(word[:-1] if len(word) > 3 and word.endswith("s") and not word.endswith("ss") else word)
+    return terms
+
+class RetrievalCache:
+    """
+    In-process LRU cache with TTL for RAG lookups, shared by every session of the middle tier.
+    Concurrent identical lookups are coalesced into a single search call.
+    """
+    max_entries: int
+    ttl: float
+    hits: int = 0
+    misses: int = 0
+    coalesced: int = 0
+    evictions: int = 0
+
+    def __init__(self, max_entries: Optional[int] = None, ttl: Optional[float] = None):
+        self.max_entries = max_entries if max_entries is not None else int(os.environ.get("RAG_CACHE_MAX_ENTRIES", "256"))
+        self.ttl = ttl if ttl is not None else float(os.environ.get("RAG_CACHE_TTL", "300"))
+        self._entries: OrderedDict[CacheKey, Tuple[float, List[Dict[str, Any]]]] = OrderedDict()
+        self._inflight: dict[CacheKey, asyncio.Task] = {}
+
+    def key(self, query: str, top: int, fields: List[str]) -> CacheKey:
+        return (normalize_query(query), top, tuple(fields))
+
+    def _get(self, key: CacheKey) -> Optional[List[Dict[str, Any]]]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, docs = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return docs
+
+    def _put(self, key: CacheKey, docs: List[Dict[str, Any]]):
+        self._entries[key] = (time.monotonic() + self.ttl, docs)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def _on_fetched(self, key: CacheKey, task: asyncio.Task):
+        self._inflight.pop(key, None)
+        # Empty results are not cached: they are also what a timed-out or failed search returns
+        if not task.cancelled() and task.exception() is None and task.result():
+            self._put(key, task.result())
+
+    async def get_or_fetch(self, query: str, top: int, fields: List[str],
+                           fetch: Callable[[], Awaitable[List[Dict[str, Any]]]]) -> List[Dict[str, Any]]:
+        key = self.key(query, top, fields)
+        docs = self._get(key)
+        if docs is not None:
+            self.hits += 1
+            return docs
+
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            self.misses += 1
+            task = asyncio.ensure_future(fetch())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._on_fetched(key, t))
+        # Shield so one caller going away does not cancel the lookup the others are waiting on
+        return await asyncio.shield(task)
+
+    def invalidate(self):
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions,
+            "entries": len(self._entries),
+        }
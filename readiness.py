@@ -0,0 +1,74 @@
+import asyncio
+import importlib
+import logging
+import time
+from typing import Any, Awaitable, Optional
+
+logger = logging.getLogger("voicerag")
+
+class Subsystem:
+    def __init__(self, name: str, required: bool):
+        self.name = name
+        self.required = required
+        self.state = "starting"
+        self.error: Optional[str] = None
+        self.seconds: Optional[float] = None
+        self.task: Optional[asyncio.Task] = None
+
+class Readiness:
+    """
+    Second phase of startup. The app serves static content and /azure-config as soon as it listens,
+    while subsystems that need network round trips or heavy imports (token, search clients, upstream
+    pool) warm up concurrently in the background. /readyz is ready once every required one is;
+    optional ones are reported but only make the first requests that need them slower.
+    """
+    def __init__(self):
+        self.started = time.monotonic()
+        self.subsystems: dict[str, Subsystem] = {}
+
+    def track(self, name: str, warm_up: Awaitable[Any], required: bool = True) -> asyncio.Task:
+        subsystem = self.subsystems[name] = Subsystem(name, required)
+
+        async def run():
+            start = time.monotonic()
+            try:
+                await warm_up
+            except Exception as e:
+                subsystem.state = "failed"
+                subsystem.error = str(e) or type(e).__name__
+                logger.warning("Startup of %s failed: %s", name, subsystem.error)
+            else:
+                subsystem.state = "ready"
+                logger.info("%s ready in %.2fs", name, time.monotonic() - start)
+            finally:
+                subsystem.seconds = time.monotonic() - start
+
+        subsystem.task = asyncio.create_task(run())
+        return subsystem.task
+
+    def ready(self) -> bool:
+        return all(s.state == "ready" for s in self.subsystems.values() if s.required)
+
+    def report(self) -> dict[str, Any]:
+        subsystems = {}
+        for s in self.subsystems.values():
+            entry: dict[str, Any] = {"state": s.state, "required": s.required}
+            if s.seconds is not None:
+                entry["seconds"] = round(s.seconds, 3)
+            if s.error is not None:
+                entry["error"] = s.error
+            subsystems[s.name] = entry
+        return {"ready": self.ready(), "uptime": round(time.monotonic() - self.started, 3), "subsystems": subsystems}
+
+    async def close(self):
+        tasks = [s.task for s in self.subsystems.values() if s.task is not None and not s.task.done()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+async def preload(*modules: str):
+    """
+    Import modules in a worker thread, so the first request that needs them does not pay for it on the event loop.
+    """
+    for module in modules:
+        await asyncio.to_thread(importlib.import_module, module)
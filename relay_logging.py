@@ -0,0 +1,215 @@
+import atexit
+import contextvars
+import copy
+import hashlib
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import signal
+import sys
+import threading
+import time
+from typing import Any, Optional
+
+from relay_metrics import MetricFamily
+from token_bucket import TokenBucket
+
+TEXT_FORMAT = "%(asctime)s %(levelname)s %(name)s%(context)s: %(message)s"
+
+class LogContext:
+    """
+    Session and turn the records logged while relaying one session belong to. One instance is
+    shared by every task of the session, so advancing the turn is seen by all of them.
+    """
+    def __init__(self, session: str):
+        self.session = session
+        self.turn = 0
+
+_log_context: contextvars.ContextVar[Optional[LogContext]] = contextvars.ContextVar("relay_log_context", default=None)
+
+def bind_log_context(context: LogContext):
+    """
+    Attach `context` to records logged from the current task and the tasks it creates from now on.
+    """
+    _log_context.set(context)
+
+# Set by LogPipeline from LOG_MAX_FIELD_CHARS
+_max_field_chars = 300
+
+class Payload:
+    """
+    A large value (retrieved documents, context blocks, raw frames) passed as a log argument. It is
+    only rendered if the record is actually emitted, and then cut to LOG_MAX_FIELD_CHARS characters
+    followed by its full length and digest; a limit of 0 logs just the reference.
+    """
+    __slots__ = ("value", "limit")
+
+    def __init__(self, value: Any, limit: Optional[int] = None):
+        self.value = value
+        self.limit = limit
+
+    def __str__(self) -> str:
+        text = self.value if isinstance(self.value, str) else repr(self.value)
+        limit = self.limit if self.limit is not None else _max_field_chars
+        if len(text) <= limit:
+            return text
+        digest = hashlib.sha1(text.encode("utf-8", "replace")).hexdigest()[:10]
+        head = text[:limit] + "..." if limit > 0 else ""
+        return f"{head}[{len(text)} chars, sha1 {digest}]"
+
+    __repr__ = __str__
+
+class DebugRateLimit(logging.Filter):
+    """
+    Lets through at most `rate` records per second (bursts of `burst`) below INFO from each call
+    site, so per-frame and per-turn debug output cannot flood the writer when DEBUG is switched on
+    under load. The number of records dropped since the last one passed is attached to the next one.
+    """
+    max_sites: int = 1000
+
+    def __init__(self, rate: float, burst: float):
+        super().__init__()
+        self.rate = rate
+        self.burst = burst
+        self.suppressed = 0
+        self._sites: dict[tuple[str, int], list] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.INFO or self.rate <= 0:
+            return True
+        key = (record.pathname, record.lineno)
+        with self._lock:
+            site = self._sites.get(key)
+            if site is None:
+                if len(self._sites) >= self.max_sites:
+                    self._sites.clear()
+                site = self._sites[key] = [TokenBucket(self.rate, self.burst), 0]
+            if site[0].take() > 0:
+                site[1] += 1
+                self.suppressed += 1
+                return False
+            record.suppressed, site[1] = site[1], 0
+        return True
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """
+    Hands records to the writer thread. The record is rendered here, while its arguments are still
+    current, but never written; when the queue is full it is dropped and counted instead of
+    blocking the event loop.
+    """
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.msg, record.args, record.exc_info = record.message, None, None
+        context = _log_context.get()
+        if context is not None:
+            record.session, record.turn = context.session, context.turn
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+class JsonFormatter(logging.Formatter):
+    """
+    One JSON object per line, with the session and turn of records logged while relaying a session.
+    """
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        if hasattr(record, "session"):
+            entry["session"] = record.session
+            entry["turn"] = record.turn
+        if getattr(record, "suppressed", 0):
+            entry["suppressed"] = record.suppressed
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False)
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__(TEXT_FORMAT)
+
+    def format(self, record: logging.LogRecord) -> str:
+        context = f" [session={record.session} turn={record.turn}]" if hasattr(record, "session") else ""
+        if getattr(record, "suppressed", 0):
+            context += f" [{record.suppressed} suppressed]"
+        record.context = context
+        return super().format(record)
+
+class LogPipeline:
+    """
+    Process-wide logging that keeps writes off the event loop: records go through a bounded queue
+    of LOG_QUEUE_SIZE to a writer thread, rendered as LOG_FORMAT (json or text) with the session and
+    turn they belong to. Records below INFO are rate limited per call site to LOG_DEBUG_RATE per
+    second (0 disables the limit), and Payload arguments are cut to LOG_MAX_FIELD_CHARS.
+
+    The level starts at LOG_LEVEL and can be changed without a restart: SIGUSR1 switches between it
+    and DEBUG (the supervisor passes the signal on to its workers), or call set_level().
+    """
+    def __init__(self, level: Optional[str] = None, format: Optional[str] = None, queue_size: Optional[int] = None,
+                 debug_rate: Optional[float] = None, debug_burst: Optional[int] = None, max_field_chars: Optional[int] = None):
+        self.level = (level if level is not None else os.environ.get("LOG_LEVEL", "INFO")).upper()
+        self.format = format if format is not None else os.environ.get("LOG_FORMAT", "json")
+        self.queue_size = queue_size if queue_size is not None else int(os.environ.get("LOG_QUEUE_SIZE", "10000"))
+        self.debug_rate = debug_rate if debug_rate is not None else float(os.environ.get("LOG_DEBUG_RATE", "5"))
+        self.debug_burst = debug_burst if debug_burst is not None else int(os.environ.get("LOG_DEBUG_BURST", "20"))
+        self.max_field_chars = max_field_chars if max_field_chars is not None else int(os.environ.get("LOG_MAX_FIELD_CHARS", "300"))
+        self.handler: Optional[DroppingQueueHandler] = None
+        self.rate_limit = DebugRateLimit(self.debug_rate, self.debug_burst)
+        self._listener: Optional[logging.handlers.QueueListener] = None
+
+    def install(self):
+        global _max_field_chars
+        _max_field_chars = self.max_field_chars
+        output = logging.StreamHandler(sys.stderr)
+        output.setFormatter(JsonFormatter() if self.format == "json" else TextFormatter())
+        log_queue: queue.Queue = queue.Queue(self.queue_size)
+        self.handler = DroppingQueueHandler(log_queue)
+        self.handler.addFilter(self.rate_limit)
+        root = logging.getLogger()
+        for handler in root.handlers[:]:
+            root.removeHandler(handler)
+        root.addHandler(self.handler)
+        root.setLevel(self.level)
+        self._listener = logging.handlers.QueueListener(log_queue, output)
+        self._listener.start()
+        atexit.register(self.stop)
+        if hasattr(signal, "SIGUSR1") and threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGUSR1, self._toggle_debug)
+
+    def stop(self):
+        """
+        Write out the records still queued.
+        """
+        if self._listener is not None:
+            self._listener.stop()
+            self._listener = None
+
+    def set_level(self, level: str | int):
+        logging.getLogger().setLevel(level.upper() if isinstance(level, str) else level)
+        logging.getLogger("voicerag").warning("Log level set to %s", logging.getLevelName(logging.getLogger().level))
+
+    def _toggle_debug(self, _signum, _frame):
+        # No logging here: the signal may have interrupted a thread holding the queue's lock
+        logging.getLogger().setLevel(self.level if logging.getLogger().level == logging.DEBUG else logging.DEBUG)
+
+    def collect_metrics(self) -> list[MetricFamily]:
+        stats = {"dropped": self.handler.dropped if self.handler else 0, "rate_limited": self.rate_limit.suppressed}
+        return [("app_log_records_discarded_total", "counter", "Log records not written because the queue was full or their call site was rate limited",
+                 [({"reason": k}, v) for k, v in stats.items()])]
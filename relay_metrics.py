@@ -0,0 +1,221 @@
+import re
+import time
+from bisect import bisect_left
+from typing import Any, Callable, Coroutine, Generator, Iterable, Optional
+
+# Buckets (seconds) for user-visible latencies and for the relay's own per-frame processing time
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 0.75, 1.0, 1.5, 2.5, 5.0, 10.0)
+OVERHEAD_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.005, 0.025, 0.1)
+# Buckets for prompt token counts
+TOKEN_BUCKETS = (0, 25, 50, 100, 200, 400, 800, 1600, 3200)
+
+# (labels, value) pairs for one metric
+Samples = list[tuple[dict[str, str], float]]
+# (name, type, help, samples) as produced by a collector
+MetricFamily = tuple[str, str, str, Samples]
+
+_SAMPLE_LINE = re.compile(r"^([a-zA-Z_:][a-zA-Z0-9_:]*)(\{.*\})? (\S+)$")
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(labels: dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(str(v))}"' for k, v in labels.items()) + "}"
+
+def _format_value(value: float) -> str:
+    value = float(value)
+    return str(int(value)) if value.is_integer() else repr(value)
+
+class Counter:
+    def __init__(self, name: str, help: str, label: Optional[str] = None):
+        self.name = name
+        self.help = help
+        self.label = label
+        self.values: dict[str, float] = {}
+
+    def inc(self, amount: float = 1.0, label_value: str = ""):
+        self.values[label_value] = self.values.get(label_value, 0.0) + amount
+
+    def family(self) -> MetricFamily:
+        samples = [({self.label: k} if self.label else {}, v) for k, v in self.values.items()]
+        return (self.name, "counter", self.help, samples)
+
+class Gauge:
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0):
+        self.value += amount
+
+    def dec(self, amount: float = 1.0):
+        self.value -= amount
+
+    def family(self) -> MetricFamily:
+        return (self.name, "gauge", self.help, [({}, self.value)])
+
+class Histogram:
+    def __init__(self, name: str, help: str, buckets: tuple[float, ...] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(sorted(buckets))
+        # One slot per bucket plus +Inf; cumulated only when rendered
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            lines.append(f'{self.name}_bucket{{le="{bound}"}} {cumulative}')
+        lines.append(f'{self.name}_bucket{{le="+Inf"}} {self.count}')
+        lines.append(f"{self.name}_sum {_format_value(self.sum)}")
+        lines.append(f"{self.name}_count {self.count}")
+        return lines
+
+class MetricsRegistry:
+    """
+    Minimal Prometheus text-format registry. Hot-path metrics are plain attribute updates;
+    everything else is pulled from collectors when /metrics is scraped.
+    """
+    def __init__(self):
+        self._metrics: list[Counter | Gauge | Histogram] = []
+        self._collectors: list[Callable[[], Iterable[MetricFamily]]] = []
+
+    def counter(self, name: str, help: str, label: Optional[str] = None) -> Counter:
+        metric = Counter(name, help, label)
+        self._metrics.append(metric)
+        return metric
+
+    def gauge(self, name: str, help: str) -> Gauge:
+        metric = Gauge(name, help)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, help: str, buckets: tuple[float, ...] = LATENCY_BUCKETS) -> Histogram:
+        metric = Histogram(name, help, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector: Callable[[], Iterable[MetricFamily]]):
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        lines = []
+        families = []
+        for metric in self._metrics:
+            if isinstance(metric, Histogram):
+                lines.extend(metric.render())
+            else:
+                families.append(metric.family())
+        for collector in self._collectors:
+            families.extend(collector())
+        for name, kind, help, samples in families:
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+def merge_expositions(snapshots: dict[str, str]) -> str:
+    """
+    Merge the text expositions of several worker processes into one. Counter and histogram samples
+    are summed; gauges are not additive in general (maxima, averages), so each worker's gauge samples
+    are kept apart under a `worker` label.
+    """
+    families: dict[str, dict] = {}
+    for worker, text in snapshots.items():
+        family = None
+        for line in text.splitlines():
+            if line.startswith("# HELP ") or line.startswith("# TYPE "):
+                _, kind, name, rest = line.split(" ", 3)
+                family = families.setdefault(name, {"help": "", "type": "untyped", "samples": {}})
+                family["help" if kind == "HELP" else "type"] = rest
+                continue
+            match = _SAMPLE_LINE.match(line)
+            if match is None or family is None:
+                continue
+            name, labels, value = match.group(1), match.group(2) or "", float(match.group(3))
+            if family["type"] not in ("counter", "histogram"):
+                worker_label = f'worker="{_escape(worker)}"'
+                labels = "{" + worker_label + ("," + labels[1:] if labels else "}")
+            key = name + labels
+            family["samples"][key] = family["samples"].get(key, 0.0) + value
+    lines = []
+    for name, family in families.items():
+        lines.append(f"# HELP {name} {family['help']}")
+        lines.append(f"# TYPE {name} {family['type']}")
+        lines.extend(f"{key} {_format_value(value)}" for key, value in family["samples"].items())
+    return "\n".join(lines) + "\n"
+
+class SuspendTimer:
+    """
+    Awaits a coroutine and adds up the time it spends suspended (waiting on retrieval, queue room,
+    other tasks), so the time it actually runs on the event loop can be told apart from its waits.
+    """
+    def __init__(self, coro: Coroutine[Any, Any, Any]):
+        self.coro = coro
+        self.waited = 0.0
+        self.suspended = False
+
+    def __await__(self) -> Generator[Any, Any, Any]:
+        steps = self.coro.__await__()
+        value: Any = None
+        error: Optional[BaseException] = None
+        while True:
+            try:
+                pending = steps.throw(error) if error is not None else steps.send(value)
+            except StopIteration as stop:
+                return stop.value
+            self.suspended = True
+            start = time.perf_counter()
+            try:
+                value, error = (yield pending), None
+            except GeneratorExit:
+                steps.close()
+                raise
+            except BaseException as e:
+                value, error = None, e
+            finally:
+                self.waited += time.perf_counter() - start
+
+class TurnTimeline:
+    """
+    Timestamps (time.perf_counter) of the key events of one conversational turn.
+    Only the first occurrence of each event is kept.
+    """
+    def __init__(self):
+        self.events: dict[str, float] = {}
+
+    def mark(self, event: str) -> bool:
+        """
+        Record `event` now; returns False if it had already been recorded for this turn.
+        """
+        if event in self.events:
+            return False
+        self.events[event] = time.perf_counter()
+        return True
+
+    def between(self, start: str, end: str) -> Optional[float]:
+        if start in self.events and end in self.events:
+            return self.events[end] - self.events[start]
+        return None
+
+    def summary(self) -> dict[str, float]:
+        """
+        Milliseconds since the first event, in the order the events happened.
+        """
+        if not self.events:
+            return {}
+        origin = min(self.events.values())
+        return {event: round((at - origin) * 1000, 1) for event, at in sorted(self.events.items(), key=lambda item: item[1])}
@@ -0,0 +1,138 @@
+import asyncio
+import time
+from collections import deque
+from typing import Any, Optional
+
+# Interruption signals after which queued model audio is stale and must not reach the client
+INTERRUPTION_TYPES = frozenset({
+    "input_audio_buffer.speech_started",
+    "response.cancel",
+    "user.interruption",
+})
+
+class RelayQueueStats:
+    """
+    Counters shared by every queue of one relay direction, so they cover all live sessions.
+    """
+    depth: int = 0
+    max_depth: int = 0
+    frames: int = 0
+    dropped: int = 0
+    stale_dropped: int = 0
+    sends: int = 0
+    send_seconds_total: float = 0.0
+    send_seconds_max: float = 0.0
+
+    def as_dict(self) -> dict[str, Any]:
+        return {
+            "depth": self.depth,
+            "max_depth": self.max_depth,
+            "frames": self.frames,
+            "dropped": self.dropped,
+            "stale_dropped": self.stale_dropped,
+            "send_seconds_avg": self.send_seconds_total / self.sends if self.sends else 0.0,
+            "send_seconds_max": self.send_seconds_max,
+        }
+
+class RelayQueue:
+    """
+    Bounded frame queue decoupling a relay reader from the socket it writes to.
+
+    When the queue is full, frames whose type is in `droppable` evict the oldest droppable frame
+    (or are dropped themselves when nothing can be evicted); every other frame waits for room,
+    which applies backpressure to the reading side.
+    """
+    def __init__(self, stats: RelayQueueStats, max_frames: int, max_bytes: int,
+                 droppable: frozenset[str] = frozenset()):
+        self.stats = stats
+        self.max_frames = max_frames
+        self.max_bytes = max_bytes
+        self.droppable = droppable
+        self._frames: deque[tuple[Optional[str], str]] = deque()
+        self._bytes = 0
+        self._closed = False
+        self._changed = asyncio.Event()
+
+    def __len__(self) -> int:
+        return len(self._frames)
+
+    def _is_full(self, size: int) -> bool:
+        return len(self._frames) >= self.max_frames or (len(self._frames) > 0 and self._bytes + size > self.max_bytes)
+
+    def _append(self, ftype: Optional[str], data: str):
+        self._frames.append((ftype, data))
+        self._bytes += len(data)
+        self.stats.frames += 1
+        self.stats.depth += 1
+        self.stats.max_depth = max(self.stats.max_depth, len(self._frames))
+        self._changed.set()
+
+    def _remove(self, index: int) -> tuple[Optional[str], str]:
+        ftype, data = self._frames[index]
+        del self._frames[index]
+        self._bytes -= len(data)
+        self.stats.depth -= 1
+        self._changed.set()
+        return ftype, data
+
+    async def put(self, data: str, ftype: Optional[str]):
+        if self._closed:
+            return
+        while self._is_full(len(data)):
+            if ftype in self.droppable:
+                oldest = next((i for i, (t, _) in enumerate(self._frames) if t in self.droppable), None)
+                self.stats.dropped += 1
+                if oldest is None:
+                    return
+                self._remove(oldest)
+                continue
+            self._changed.clear()
+            await self._changed.wait()
+            if self._closed:
+                return
+        self._append(ftype, data)
+
+    def drop_stale(self, types: frozenset[str]) -> int:
+        """
+        Remove queued frames of the given types, e.g. model audio made stale by an interruption.
+        """
+        stale = [i for i, (t, _) in enumerate(self._frames) if t in types]
+        for index in reversed(stale):
+            self._remove(index)
+        self.stats.stale_dropped += len(stale)
+        return len(stale)
+
+    async def get(self) -> Optional[str]:
+        """
+        Return the next frame, or None once the queue is closed and drained.
+        """
+        while not self._frames:
+            if self._closed:
+                return None
+            self._changed.clear()
+            await self._changed.wait()
+        return self._remove(0)[1]
+
+    def record_send(self, seconds: float):
+        self.stats.sends += 1
+        self.stats.send_seconds_total += seconds
+        self.stats.send_seconds_max = max(self.stats.send_seconds_max, seconds)
+
+    def close(self):
+        self._closed = True
+        self._changed.set()
+
+    def discard(self):
+        # Account for frames that will never be sent because the session ended
+        while self._frames:
+            self._remove(0)
+        self.close()
+
+async def drain_to(queue: RelayQueue, send):
+    """
+    Send queued frames with `send` until the queue is closed and drained.
+    """
+    while (data := await queue.get()) is not None:
+        start = time.perf_counter()
+        await send(data)
+        queue.record_send(time.perf_counter() - start)
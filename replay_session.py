@@ -0,0 +1,142 @@
+"""
+Replay a recorded session through the RTMiddleTier relay, offline.
+
+Recordings are written by the relay when RECORD_SESSIONS_DIR is set. The client's recorded
+frames are sent to a local RTMiddleTier at their original timing (scaled by --speed, 0 meaning
+as fast as possible) while a stand-in realtime service plays back the recorded service frames
+on the same clock. Reports the frames relayed in each direction, wall and CPU time and the
+relay's per-frame overhead; --dump writes the frames the client received as JSON lines, so two
+runs (e.g. before and after a change) can be diffed.
+
+Usage: python replay_session.py recordings/<session>-*.rtrec [--speed 1.0] [--dump received.jsonl]
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+from collections import Counter
+
+import aiohttp
+from aiohttp import web
+
+from session_recorder import FROM_CLIENT, KIND_META, read_records
+
+
+async def _wait_until(start: float, t: float, speed: float):
+    if speed > 0:
+        delay = start + t / speed - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+def playback_handler(frames: list[tuple[float, str]], speed: float):
+    async def handler(request: web.Request) -> web.WebSocketResponse:
+        ws = web.WebSocketResponse(max_msg_size=0)
+        await ws.prepare(request)
+        start = time.monotonic()
+
+        async def play():
+            for t, data in frames:
+                await _wait_until(start, t, speed)
+                await ws.send_str(data)
+
+        player = asyncio.create_task(play())
+        async for _ in ws:
+            pass
+        player.cancel()
+        return ws
+    return handler
+
+
+async def replay(args: argparse.Namespace):
+    records = list(read_records(sorted(args.recording)))
+    meta = next((r.data for r in records if r.kind == KIND_META), {})
+    client_frames = [(r.t, r.data) for r in records if r.kind != KIND_META and r.direction == FROM_CLIENT]
+    server_frames = [(r.t, r.data) for r in records if r.kind != KIND_META and r.direction != FROM_CLIENT]
+
+    upstream = web.Application()
+    upstream.router.add_get("/openai/realtime", playback_handler(server_frames, args.speed))
+    upstream_runner = web.AppRunner(upstream, access_log=None)
+    await upstream_runner.setup()
+    await web.TCPSite(upstream_runner, "127.0.0.1", 0).start()
+
+    # A pre-dialed upstream socket would start playback before the client connects
+    os.environ["REALTIME_POOL_SIZE"] = "0"
+    # Resume tokens are random, which would make dumps of two runs differ
+    os.environ["RESUME_GRACE_SECONDS"] = "0"
+    os.environ.pop("RECORD_SESSIONS_DIR", None)
+    from azure.core.credentials import AzureKeyCredential
+    from rtmt import RTMiddleTier
+
+    rtmt = RTMiddleTier(endpoint=f"http://127.0.0.1:{upstream_runner.addresses[0][1]}", deployment="replay",
+                        credentials=AzureKeyCredential("replay"))
+    app = web.Application()
+    rtmt.attach_to_app(app, "/realtime")
+    relay_runner = web.AppRunner(app, access_log=None)
+    await relay_runner.setup()
+    await web.TCPSite(relay_runner, "127.0.0.1", 0).start()
+    query = {"input_rate": str(meta.get("input_rate", 24000))}
+    if meta.get("outputs"):
+        query["outputs"] = ",".join(meta["outputs"])
+
+    received = []
+    wall_start = time.monotonic()
+    cpu_start = time.process_time()
+    async with aiohttp.ClientSession() as http:
+        async with http.ws_connect(f"http://127.0.0.1:{relay_runner.addresses[0][1]}/realtime", params=query, max_msg_size=0) as ws:
+            async def receive():
+                async for msg in ws:
+                    if msg.type == aiohttp.WSMsgType.TEXT:
+                        received.append(msg.data)
+
+            receiver = asyncio.create_task(receive())
+            start = time.monotonic()
+            for t, data in client_frames:
+                await _wait_until(start, t, args.speed)
+                if isinstance(data, bytes):
+                    await ws.send_bytes(data)
+                else:
+                    await ws.send_str(data)
+            # Let the rest of the recorded service frames play out
+            last = max([t for t, _ in server_frames] + [0.0])
+            await _wait_until(start, last, args.speed)
+            while True:
+                count = len(received)
+                await asyncio.sleep(args.settle)
+                if len(received) == count:
+                    break
+            await ws.close()
+            receiver.cancel()
+    wall = time.monotonic() - wall_start
+    cpu = time.process_time() - cpu_start
+
+    overhead = rtmt._relay_overhead_seconds
+    print(f"Replayed {meta.get('session_id', 'session')}: {len(client_frames)} client frames, {len(server_frames)} service frames")
+    print(f"client received {len(received)} frames in {wall:.2f}s wall, {cpu:.2f}s CPU (speed {args.speed or 'max'})")
+    if overhead.count:
+        print(f"relay overhead  {overhead.sum / overhead.count * 1e6:.1f} us/frame over {overhead.count} frames")
+    types = Counter(json.loads(data).get("type") for data in received)
+    for ftype, count in types.most_common():
+        print(f"  {count:>6}  {ftype}")
+    if args.dump:
+        with open(args.dump, "w") as f:
+            for data in received:
+                f.write(data + "\n")
+
+    await relay_runner.cleanup()
+    await upstream_runner.cleanup()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("recording", nargs="+", help="recording parts of one session")
+    parser.add_argument("--speed", type=float, default=1.0, help="playback speed factor, 0 for as fast as possible")
+    parser.add_argument("--settle", type=float, default=0.5, help="seconds without new frames before the replay ends")
+    parser.add_argument("--dump", help="write the frames the client received to this JSON lines file")
+    args = parser.parse_args()
+    asyncio.run(replay(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+from math import gcd
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+class StreamingResampler:
+    """
+    Vectorized polyphase resampler for mono PCM16 streams. Filter history and output phase are
+    carried across calls, so feeding a stream frame by frame gives the same samples as
+    resampling it in one go.
+    """
+    def __init__(self, in_rate: int, out_rate: int, taps_per_phase: int = 16):
+        if in_rate <= 0 or out_rate <= 0:
+            raise ValueError(f"sample rates must be positive, got {in_rate} -> {out_rate}")
+        divisor = gcd(in_rate, out_rate)
+        self.in_rate = in_rate
+        self.out_rate = out_rate
+        self.up = out_rate // divisor
+        self.down = in_rate // divisor
+        self.taps_per_phase = taps_per_phase
+
+        # Kaiser-windowed sinc low-pass at the lower of the two Nyquist rates, designed at the
+        # upsampled rate and split into `up` polyphase branches
+        n_taps = taps_per_phase * self.up
+        cutoff = 1.0 / max(self.up, self.down)
+        t = np.arange(n_taps) - (n_taps - 1) / 2
+        h = cutoff * np.sinc(cutoff * t) * np.kaiser(n_taps, 8.0)
+        h *= self.up / h.sum()
+        # phases[p, j] is the tap applied to input sample k - j for an output at upsampled phase p
+        # Kept in float64: float32 products are summed in a different order depending on how many
+        # outputs a call computes, which flips the rounding of the odd sample between chunkings
+        phases = h.reshape(taps_per_phase, self.up).T
+        # Reversed so a branch can be applied as a dot product with a window of ascending input samples
+        self._reversed_phases = np.ascontiguousarray(phases[:, ::-1])
+        self._history = np.zeros(taps_per_phase - 1)
+        self._consumed = 0
+        self._next_out = 0
+        # A frame may end mid-sample; the odd byte is prepended to the next frame
+        self._partial = b""
+
+    def process(self, pcm16: bytes) -> bytes:
+        """
+        Resample a chunk of little-endian PCM16 samples, returning the output samples it completes.
+        """
+        if self._partial:
+            pcm16 = self._partial + pcm16
+        usable = len(pcm16) & ~1
+        self._partial = pcm16[usable:]
+        if self.up == self.down or usable == 0:
+            return pcm16[:usable]
+        x = np.frombuffer(pcm16, dtype="<i2", count=usable // 2).astype(np.float64)
+        start = self._consumed
+        end = start + len(x)
+        buffer = np.concatenate((self._history, x))
+
+        # Output n lands on upsampled sample n * down, i.e. it reads input samples up to (n * down) // up
+        # through branch (n * down) % up. Outputs n, n + up, n + 2 * up, ... share a branch and step
+        # `down` input samples apart, so each branch is one strided matrix-vector product.
+        first, last = self._next_out, -(-end * self.up // self.down)
+        y = np.empty(last - first)
+        windows = sliding_window_view(buffer, self.taps_per_phase)
+        for r in range(min(self.up, last - first)):
+            n = first + r
+            window_start = (n * self.down) // self.up - start
+            count = len(range(r, last - first, self.up))
+            y[r::self.up] = windows[window_start::self.down][:count] @ self._reversed_phases[(n * self.down) % self.up]
+
+        self._history = buffer[len(buffer) - (self.taps_per_phase - 1):]
+        self._consumed = end
+        self._next_out = last
+        return np.clip(np.rint(y), -32768, 32767).astype("<i2").tobytes()
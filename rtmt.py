@@ -1,17 +1,110 @@
 import asyncio
+import base64
 import json
 import logging
+import re
+import time
+import uuid
 from enum import Enum
-from typing import Any, Callable, Optional
+from typing import TYPE_CHECKING, Any, Callable, Optional, Sequence
 
 import aiohttp
 from aiohttp import web
 from azure.core.credentials import AzureKeyCredential
-from azure.identity import DefaultAzureCredential, get_bearer_token_provider
+from admission import AdmissionController, AdmissionRejected, QueueTicket
+from answer_cache import ANSWER_ITEM_PREFIX, AnswerCache, CachedAnswer, prompt_digest, response_events
 from azure_search_rag import AzureCognitiveSearchRAG
+from context_compiler import ContextCompiler
+from readiness import Readiness, preload
+from conversation_window import CONTEXT_ITEM_PREFIX, SUMMARY_ITEM_PREFIX, ConversationWindow
+from rag_cache import RetrievalCache
+from relay_logging import LogContext, Payload, bind_log_context
+from relay_metrics import OVERHEAD_BUCKETS, TOKEN_BUCKETS, MetricFamily, MetricsRegistry, SuspendTimer, TurnTimeline
+from relay_queue import INTERRUPTION_TYPES, RelayQueue, RelayQueueStats, drain_to
+from session_recorder import FROM_CLIENT, FROM_SERVER, SessionRecorder, SessionRecording
+from session_resume import FrameRing, SessionResumption
+from token_manager import LazyCredential, TokenManager
+from upstream_pool import UpstreamPool
+
+if TYPE_CHECKING:
+    from azure.identity import DefaultAzureCredential
+    from resampler import StreamingResampler
 
 logger = logging.getLogger("voicerag")
 
+# The realtime API's pcm16 format is 24 kHz mono little-endian
+REALTIME_SAMPLE_RATE = 24000
+# Sample rates accepted for raw binary PCM16 from the client (?input_rate=...)
+MIN_INPUT_RATE = 8000
+MAX_INPUT_RATE = 192000
+
+# Frames are relayed as opaque strings unless their type is one the middle tier rewrites.
+# The realtime API (and chat.js, via JSON.stringify) always emit "type" as the first key,
+# so reading it from the frame prefix avoids decoding the large base64 audio payloads.
+_FRAME_TYPE_PREFIX = re.compile(r'\s*\{\s*"type"\s*:\s*"([^"\\]*)"')
+# Deltas carry their response id ahead of the payload
+_RESPONSE_ID = re.compile(r'"response_id"\s*:\s*"([^"\\]*)"')
+# The id of the response object in response.created
+_CREATED_RESPONSE_ID = re.compile(r'"response"\s*:\s*\{[^{}]*?"id"\s*:\s*"([^"\\]*)"')
+_DELTA_FIELD = re.compile(r'"delta"\s*:\s*"')
+
+_CLIENT_REWRITE_TYPES = frozenset({
+    "conversation.input",
+    "input_audio_buffer.speech_started",
+    "input_audio_buffer.speech_stopped",
+    "conversation.item.input_audio_transcription.delta",
+    "conversation.item.input_audio_transcription.completed",
+    "conversation.item.input_audio_transcription.failed",
+    "session.created",
+    "response.output_item.added",
+    "conversation.item.created",
+    "conversation.item.deleted",
+    "response.function_call_arguments.delta",
+    "response.function_call_arguments.done",
+    "response.output_item.done",
+    "response.done",
+    "error",
+})
+
+# Output of a response that is stale once the response has been cancelled by an interruption
+_RESPONSE_DELTA_TYPES = frozenset({
+    "response.audio.delta",
+    "response.audio_transcript.delta",
+    "response.text.delta",
+})
+
+# Passthrough frames that still mark a point on the turn timeline
+_TIMELINE_TYPES = frozenset({
+    "response.created",
+    "response.text.delta",
+    "response.audio.delta",
+    "response.audio_transcript.delta",
+})
+
+# Output channels a client can declare it consumes (?outputs=...), see RTSession.outputs
+OUTPUT_CHANNELS = frozenset({"audio", "text", "transcript"})
+
+_SERVER_REWRITE_TYPES = frozenset({
+    "session.update",
+    "conversation.item.create",
+    "response.create",
+    "user.interruption",
+})
+
+def frame_type(data: str) -> Optional[str]:
+    """
+    Return the top-level "type" of a realtime frame without decoding the whole payload.
+    Falls back to a full parse when "type" is not the first key.
+    """
+    match = _FRAME_TYPE_PREFIX.match(data)
+    if match is not None:
+        return match.group(1)
+    try:
+        message = json.loads(data)
+    except json.JSONDecodeError:
+        return None
+    return message.get("type") if isinstance(message, dict) else None
+
 class ToolResultDirection(Enum):
     TO_SERVER = 1
     TO_CLIENT = 2
@@ -45,6 +138,169 @@ class RTToolCall:
         self.tool_call_id = tool_call_id
         self.previous_id = previous_id
 
+class RAGPrefetch:
+    """
+    Speculative retrieval for the current voice turn of one connection, started as soon as
+    (partial) user text is available so it overlaps with the rest of the turn.
+    """
+    # True when the middle tier owns response.create for VAD turns (see session.update)
+    auto_response: bool = False
+    partial_text: str = ""
+    query: str = ""
+    task: Optional[asyncio.Task] = None
+    injected: bool = False
+    # Whether this turn's response has been requested, and the fallback that requests it if no transcript arrives
+    responded: bool = False
+    response_task: Optional[asyncio.Task] = None
+    fallback_task: Optional[asyncio.Task] = None
+
+    def reset(self):
+        self.partial_text = ""
+        self.query = ""
+        self.task = None
+        self.injected = False
+        self.responded = False
+        self.cancel_fallback()
+        # A response still waiting on the previous turn's retrieval must not be created mid-utterance
+        if self.response_task is not None:
+            self.response_task.cancel()
+            self.response_task = None
+
+    def cancel_fallback(self):
+        if self.fallback_task is not None:
+            self.fallback_task.cancel()
+            self.fallback_task = None
+
+class ResponsePlayback:
+    """
+    The response being generated for one connection and how much of its audio has been sent to the
+    client, so a barge-in can cancel it and truncate its item at the point the visitor heard.
+    """
+    active: bool = False
+    response_id: Optional[str] = None
+    item_id: Optional[str] = None
+    content_index: int = 0
+    audio_bytes_sent: int = 0
+    first_audio_at: Optional[float] = None
+    # Set while deltas of a cancelled response may still arrive; None inside means "whichever is active"
+    cancelled: bool = False
+    cancelled_id: Optional[str] = None
+    interrupted_at: Optional[float] = None
+    # A response the middle tier answered from the answer cache instead; none of its frames reach the client
+    replaced_id: Optional[str] = None
+
+    def start(self, response_id: Optional[str] = None):
+        self.active = True
+        self.response_id = response_id
+        self.item_id = None
+        self.content_index = 0
+        self.audio_bytes_sent = 0
+        self.first_audio_at = None
+
+    def audio_sent(self, frame: str):
+        # PCM16 bytes from the base64 length, without decoding the payload
+        match = _DELTA_FIELD.search(frame)
+        if match is None:
+            return
+        start = match.end()
+        self.audio_bytes_sent += (frame.find('"', start) - start) * 3 // 4
+        if self.first_audio_at is None:
+            self.first_audio_at = time.perf_counter()
+
+    def sent_ms(self) -> int:
+        return self.audio_bytes_sent * 1000 // (REALTIME_SAMPLE_RATE * 2)
+
+    def played_ms(self) -> int:
+        """
+        Estimated audio the client has played: what was sent, bounded by the time since playback started.
+        """
+        if self.first_audio_at is None:
+            return 0
+        return min(self.sent_ms(), int((time.perf_counter() - self.first_audio_at) * 1000))
+
+    def is_replaced(self, frame: str) -> bool:
+        if self.replaced_id is None:
+            return False
+        match = _RESPONSE_ID.search(frame, 0, 512)
+        return match is not None and match.group(1) == self.replaced_id
+
+    def is_stale(self, frame: str) -> bool:
+        if not self.cancelled:
+            return False
+        if self.cancelled_id is None:
+            return True
+        match = _RESPONSE_ID.search(frame, 0, 512)
+        return match is None or match.group(1) == self.cancelled_id
+
+class RTSession:
+    """
+    Relay state for one client connection and its upstream realtime session.
+    """
+    client_ws: web.WebSocketResponse
+    server_ws: aiohttp.ClientWebSocketResponse
+
+    def __init__(self, client_ws: web.WebSocketResponse, server_ws: aiohttp.ClientWebSocketResponse,
+                 to_client: Optional[RelayQueue] = None, to_server: Optional[RelayQueue] = None,
+                 outputs: frozenset[str] = OUTPUT_CHANNELS):
+        self.client_ws = client_ws
+        self.server_ws = server_ws
+        self.to_client = to_client
+        self.to_server = to_server
+        # Output channels the client consumes; model audio is not relayed to clients that do not play it
+        self.outputs = outputs
+        self.bytes_to_client = 0
+        self.audio_bytes_stripped = 0
+        self.turn = TurnTimeline()
+        self.tools_pending: dict[str, RTToolCall] = {}
+        self.tool_tasks: list[asyncio.Task] = []
+        self.prefetch = RAGPrefetch()
+        # Bounded mirror of the upstream conversation (turn/token budget, knowledge block cleanup)
+        self.window = ConversationWindow()
+        self.playback = ResponsePlayback()
+        # Created when the client streams raw binary PCM16 instead of input_audio_buffer.append frames
+        self.input_resampler: Optional["StreamingResampler"] = None
+        self.input_rate = REALTIME_SAMPLE_RATE
+        self.recording: Optional[SessionRecording] = None
+        # Service side of the relay, which outlives a dropped client connection when resumption is enabled
+        self.upstream: Optional[asyncio.Task] = None
+        # Resumption: token, frames sent to the client, and the current client attachment
+        self.resume_token: Optional[str] = None
+        self.sent: Optional[FrameRing] = None
+        self.parked_seq = 0
+        self.park_task: Optional[asyncio.Task] = None
+        self.detach: Optional[asyncio.Event] = None
+        self.client_done: Optional[asyncio.Future] = None
+        # Answer cache: the visitor question the next response answers, whether retrieved knowledge
+        # went into that response, and the instructions the session runs under
+        self.question = ""
+        self.grounded = False
+        self.prompt_digest: Optional[str] = None
+        self.responses_done = 0
+        # The service creates the responses of voice turns itself (server VAD, not taken over), and
+        # the response of this turn if it finished before its transcript arrived
+        self.vad_responses = False
+        self.answered: Optional[dict[str, Any]] = None
+        # Session and turn attached to everything logged while relaying this session
+        self.log = LogContext(uuid.uuid4().hex[:12])
+
+    def new_turn(self):
+        self.turn = TurnTimeline()
+        self.log.turn += 1
+
+    # Frames generated by the middle tier go through the relay queues to keep their order
+    # relative to relayed frames
+    async def send_to_server(self, message: dict[str, Any]):
+        if self.to_server is not None:
+            await self.to_server.put(json.dumps(message), message["type"])
+        else:
+            await self.server_ws.send_json(message)
+
+    async def send_to_client(self, message: dict[str, Any]):
+        if self.to_client is not None:
+            await self.to_client.put(json.dumps(message), message["type"])
+        else:
+            await self.client_ws.send_json(message)
+
 class RTMiddleTier:
     endpoint: str
     deployment: str
@@ -52,7 +308,7 @@ class RTMiddleTier:
     
     # Tools are server-side only for now, though the case could be made for client-side tools
     # in addition to server-side tools that are invisible to the client
-    tools: dict[str, Tool] = {}
+    tools: dict[str, Tool]
 
     # Server-enforced configuration, if set, these will override the client's configuration
     # Typically at least the model name and system message will be set by the server
@@ -63,34 +319,412 @@ class RTMiddleTier:
     disable_audio: Optional[bool] = None
     voice_choice: Optional[str] = None
     api_version: str = "2024-10-01-preview"
-    _tools_pending = {}
-    _token_provider = None
+    # How long a response may wait for speculative retrieval before going ahead without context
+    rag_prefetch_budget: float = 0.6
+    # How long after the end of speech a response waits for its transcript when the middle tier owns
+    # response.create, before it is created without one
+    transcript_timeout: float = 3.0
+    # Upper bound (seconds) for a single tool call before the model is told it timed out
+    tool_timeout: float = 20.0
+    # Per-session, per-direction relay queue bounds
+    relay_queue_max_frames: int = 256
+    relay_queue_max_bytes: int = 4 * 1024 * 1024
+    _token_manager: Optional[TokenManager] = None
 
-    def __init__(self, endpoint: str, deployment: str, credentials: AzureKeyCredential | DefaultAzureCredential, voice_choice: Optional[str] = None):
+    def __init__(self, endpoint: str, deployment: str, credentials: "AzureKeyCredential | DefaultAzureCredential | LazyCredential", voice_choice: Optional[str] = None):
         self.endpoint = endpoint
         self.deployment = deployment
         self.voice_choice = voice_choice
+        self.tools = {}
+        self.tool_stats: dict[str, dict[str, float]] = {}
+        self.to_client_stats = RelayQueueStats()
+        self.to_server_stats = RelayQueueStats()
+        self.output_stats = {"text_only_sessions": 0, "bytes_to_client": 0, "audio_bytes_stripped": 0}
+        self.conversation_stats = {"items_deleted": 0, "tokens_trimmed": 0}
+        self.metrics = MetricsRegistry()
+        self._active_sessions = self.metrics.gauge("realtime_active_sessions", "Client sessions currently relayed")
+        self._frames = self.metrics.counter("realtime_frames_total", "Frames received by the relay", label="direction")
+        self._bytes = self.metrics.counter("realtime_bytes_total", "Bytes received by the relay", label="direction")
+        self._ttft_seconds = self.metrics.histogram(
+            "realtime_upstream_ttft_seconds", "Time from response creation to the first text/audio delta from upstream")
+        self._turn_seconds = self.metrics.histogram(
+            "realtime_turn_latency_seconds", "Time from the end of user speech to the first text/audio delta")
+        self._rag_seconds = self.metrics.histogram("realtime_rag_seconds", "Duration of RAG retrievals")
+        self._relay_overhead_seconds = self.metrics.histogram(
+            "realtime_relay_overhead_seconds", "Time the middle tier spends processing a relayed frame, excluding waits", OVERHEAD_BUCKETS)
+        self._relay_wait_seconds = self.metrics.histogram(
+            "realtime_relay_wait_seconds", "Time a relayed frame waits on retrieval, the prefetch budget or queue backpressure while it is processed")
+        self._context_tokens = self.metrics.counter("realtime_context_tokens_total", "Estimated tokens of knowledge injected ahead of responses")
+        self._context_tokens_saved = self.metrics.histogram(
+            "realtime_context_tokens_saved", "Estimated prompt tokens saved per turn by the context compiler", TOKEN_BUCKETS)
+        self._barge_ins = self.metrics.counter("realtime_barge_ins_total", "Responses cut off by the visitor speaking over them", label="trigger")
+        self._stale_deltas = self.metrics.counter("realtime_stale_deltas_dropped_total", "Deltas of cancelled responses dropped before reaching the client")
+        self._interruption_seconds = self.metrics.histogram(
+            "realtime_interruption_seconds", "Time from detected visitor speech until the cancelled response has stopped")
+        self.metrics.add_collector(self._collect_metrics)
         if voice_choice is not None:
             logger.info("Realtime voice choice set to %s", voice_choice)
         if isinstance(credentials, AzureKeyCredential):
             self.key = credentials.key
         else:
-            self._token_provider = get_bearer_token_provider(credentials, "https://cognitiveservices.azure.com/.default")
-            self._token_provider() # Warm up during startup so we have a token cached when the first request arrives
+            # Refreshed in the background (first fetch at app startup) so connections never wait on Entra ID
+            self._token_manager = TokenManager(credentials, "https://cognitiveservices.azure.com/.default")
+        # Background warm-up of the subsystems below, for /readyz
+        self.readiness = Readiness()
         # Instantiate Azure Cognitive Search RAG helper
         self.rag_helper = AzureCognitiveSearchRAG()
+        # Shared across all sessions so repeated kiosk questions skip the search round trip
+        self.rag_cache = RetrievalCache()
+        # Keeps the injected knowledge block deduplicated, on-topic and under RAG_CONTEXT_TOKEN_BUDGET
+        self.context_compiler = ContextCompiler()
+        # Answers to repeated questions about the prompt's own content, served without a model turn
+        self.answer_cache = AnswerCache()
+        self.rag_prefetch_stats = {"in_time": 0, "missed": 0, "empty": 0}
+        # Opt-in capture of both directions for offline replay (RECORD_SESSIONS_DIR)
+        self.recorder = SessionRecorder()
+        # Session cap, wait queue, per-address rate limits and upstream-driven load shedding
+        self.admission = AdmissionController()
+        # Parks sessions of dropped clients so a reconnect picks up the same conversation
+        self.resumption = SessionResumption()
+        # Pre-dialed upstream realtime sessions, refilled in the background
+        self._upstream_pool = UpstreamPool(
+            endpoint, "/openai/realtime", { "api-version": self.api_version, "deployment": deployment }, self._auth_headers
+        )
 
-    def rag_retrieve(self, query: str, top: int = 3):
+    async def rag_retrieve(self, query: str, top: int = 3):
         """
-        Retrieve relevant documents from Azure Cognitive Search for RAG.
-        Returns a list of dicts with keys: id, content, title.
+        Retrieve relevant documents from Azure Cognitive Search for RAG without blocking the event loop.
+        Returns a list of dicts with keys: content, people, organizations, locations, keyphrases.
         """
-        return self.rag_helper.retrieve_documents(query, top=top)
+        return await self.rag_cache.get_or_fetch(
+            query, top, self.rag_helper.select_fields(),
+            lambda: self.rag_helper.retrieve_documents_async(query, top=top)
+        )
+
+    def _format_context(self, query: str, rag_results: list[dict[str, Any]]) -> str:
+        context = self.context_compiler.compile(query, rag_results)
+        self._context_tokens.inc(context.tokens)
+        self._context_tokens_saved.observe(context.tokens_saved)
+        logger.debug("Compiled %d-token context for %r, saved %d tokens", context.tokens, query, context.tokens_saved)
+        return context.text
+
+    async def _timed_rag_retrieve(self, turn: TurnTimeline, query: str):
+        turn.mark("rag_start")
+        start = time.perf_counter()
+        try:
+            return await self.rag_retrieve(query, top=3)
+        finally:
+            self._rag_seconds.observe(time.perf_counter() - start)
+            turn.mark("rag_end")
+
+    def _start_prefetch(self, rt_session: RTSession, text: str):
+        prefetch = rt_session.prefetch
+        text = text.strip()
+        if not text or text == prefetch.query or prefetch.injected:
+            return
+        prefetch.query = text
+        prefetch.task = asyncio.create_task(self._timed_rag_retrieve(rt_session.turn, text))
+
+    def _mark_turn(self, rt_session: RTSession, event: str):
+        turn = rt_session.turn
+        match event:
+            case "response.create":
+                # A response requested after the previous one finished starts a new (e.g. typed) turn
+                if "response.done" in turn.events:
+                    rt_session.new_turn()
+                    turn = rt_session.turn
+                turn.mark(event)
+            case "response.text.delta" | "response.audio.delta" | "response.audio_transcript.delta":
+                if turn.mark("first_delta"):
+                    ttft = turn.between("response.create", "first_delta") or turn.between("response.created", "first_delta")
+                    if ttft is not None:
+                        self._ttft_seconds.observe(ttft)
+                        self.admission.observe_latency(ttft)
+                    turn_latency = turn.between("speech_stopped", "first_delta")
+                    if turn_latency is not None:
+                        self._turn_seconds.observe(turn_latency)
+            case "response.done":
+                if turn.mark(event):
+                    logger.debug("Turn timeline (ms): %s", turn.summary())
+            case _:
+                turn.mark(event)
+
+    async def _inject_prefetched_context(self, rt_session: RTSession):
+        """
+        Add the turn's retrieved knowledge to the conversation ahead of the model's response,
+        waiting at most rag_prefetch_budget seconds for the retrieval to land.
+        """
+        prefetch = rt_session.prefetch
+        if prefetch.task is None or prefetch.injected:
+            return
+        prefetch.injected = True
+        try:
+            rag_results = await asyncio.wait_for(asyncio.shield(prefetch.task), timeout=self.rag_prefetch_budget)
+        except asyncio.TimeoutError:
+            self.rag_prefetch_stats["missed"] += 1
+            logger.info("RAG prefetch missed the %.2fs budget for query: %s", self.rag_prefetch_budget, prefetch.query)
+            return
+        if not rag_results:
+            self.rag_prefetch_stats["empty"] += 1
+            return
+        self.rag_prefetch_stats["in_time"] += 1
+        rt_session.grounded = True
+        await rt_session.send_to_server({
+            "type": "conversation.item.create",
+            "item": {
+                # Tagged so the conversation window can delete the block once the turn is answered
+                "id": rt_session.window.new_context_id(),
+                "type": "message",
+                "role": "system",
+                "content": [{
+                    "type": "input_text",
+                    "text": f"Knowledge retrieved from search:\n{self._format_context(prefetch.query, rag_results)}"
+                }]
+            }
+        })
+
+    def _auto_respond(self, rt_session: RTSession):
+        """
+        Create the response of a voice turn when the middle tier owns response.create, once per turn.
+        """
+        prefetch = rt_session.prefetch
+        if prefetch.responded:
+            return
+        prefetch.responded = True
+        prefetch.cancel_fallback()
+        prefetch.response_task = asyncio.create_task(self._respond_with_context(rt_session))
+
+    async def _respond_without_transcript(self, rt_session: RTSession):
+        # Transcription can fail or never arrive; the visitor must still get an answer
+        await asyncio.sleep(self.transcript_timeout)
+        rt_session.prefetch.fallback_task = None
+        logger.warning("No transcript %gs after the end of speech, responding without it", self.transcript_timeout)
+        self._auto_respond(rt_session)
+
+    async def _respond_with_context(self, rt_session: RTSession):
+        if await self._answer_from_cache(rt_session):
+            return
+        await self._create_response(rt_session, {"type": "response.create"})
+
+    async def _create_response(self, rt_session: RTSession, response: dict[str, Any]):
+        await self._inject_prefetched_context(rt_session)
+        self._mark_turn(rt_session, "response.create")
+        await rt_session.send_to_server(response)
+
+    def _cached_answer(self, rt_session: RTSession) -> Optional[CachedAnswer]:
+        """
+        The cached answer to the visitor's question, if any. Only for clients that do not play model
+        audio, since cached answers are text.
+        """
+        if (not self.answer_cache.enabled or not rt_session.question or rt_session.prompt_digest is None
+                or "audio" in rt_session.outputs):
+            return None
+        return self.answer_cache.lookup(rt_session.prompt_digest, rt_session.question)
+
+    async def _answer_from_cache(self, rt_session: RTSession) -> bool:
+        """
+        Answer the visitor's question from the answer cache instead of the model, if it is a hit.
+        """
+        answer = self._cached_answer(rt_session)
+        if answer is None:
+            return False
+        await self._serve_cached_answer(rt_session, answer)
+        return True
+
+    async def _replace_with_cached_answer(self, rt_session: RTSession):
+        """
+        For voice turns the service answers itself: once the transcript is known, cancel the model's
+        response in favour of a cached answer, provided none of its output has reached the client yet.
+        """
+        playback = rt_session.playback
+        if not playback.active or playback.response_id is None or "first_delta" in rt_session.turn.events:
+            return
+        answer = self._cached_answer(rt_session)
+        if answer is None:
+            return
+        playback.replaced_id = playback.response_id
+        # A cancel that arrives after the response finished upstream is not reported to the client
+        playback.interrupted_at = time.perf_counter()
+        await rt_session.send_to_server({"type": "response.cancel"})
+        await self._serve_cached_answer(rt_session, answer)
+
+    async def _drop_replaced_response(self, rt_session: RTSession, response: dict[str, Any]):
+        # Whatever the replaced response produced upstream is removed; the cached answer took its place
+        rt_session.playback.replaced_id = None
+        self._end_playback(rt_session, response.get("id"))
+        rt_session.tools_pending.clear()
+        for output in response.get("output") or []:
+            if output.get("id"):
+                await rt_session.send_to_server(rt_session.window.delete(output["id"]))
+
+    async def _serve_cached_answer(self, rt_session: RTSession, answer: CachedAnswer):
+        logger.debug("Answered %s from the answer cache", Payload(rt_session.question))
+        rt_session.question = ""
+        item_id = ANSWER_ITEM_PREFIX + uuid.uuid4().hex[:24]
+        # The answer goes into the upstream conversation too, so later turns can refer to it
+        await rt_session.send_to_server({
+            "type": "conversation.item.create",
+            "item": {"id": item_id, "type": "message", "role": "assistant", "content": [{"type": "text", "text": answer.text}]}
+        })
+        for event in response_events(item_id, answer.text, transcript="text" not in rt_session.outputs):
+            await rt_session.send_to_client(event)
+        self._mark_turn(rt_session, "response.done")
+        rt_session.responses_done += 1
+        for event in rt_session.window.on_response_done():
+            await rt_session.send_to_server(event)
+
+    def _store_answer(self, rt_session: RTSession, response: dict[str, Any]):
+        """
+        Keep the model's answer to the visitor's question if it came from the instructions alone: a
+        completed text answer with no tool calls or retrieved knowledge. The first response of a
+        session is skipped, since the instructions ask for an introduction there, and the cache
+        itself leaves out questions that refer back to earlier turns.
+        """
+        question, rt_session.question = rt_session.question, ""
+        output = response.get("output") or []
+        if (not question or rt_session.grounded or rt_session.prompt_digest is None or rt_session.responses_done == 0
+                or response.get("status") != "completed" or len(output) != 1 or output[0].get("type") != "message"):
+            return
+        text = " ".join(part.get("text") or part.get("transcript") or "" for part in output[0].get("content") or []).strip()
+        duration = rt_session.turn.between("response.create", "response.done") or rt_session.turn.between("response.created", "response.done")
+        if duration is not None:
+            self.answer_cache.observe_response(duration)
+        self.answer_cache.store(rt_session.prompt_digest, question, text, (response.get("usage") or {}).get("output_tokens", 0))
+
+    def _record_tool_latency(self, tool_name: str, seconds: float, outcome: str):
+        stats = self.tool_stats.setdefault(tool_name, {"calls": 0, "total_seconds": 0.0, "max_seconds": 0.0, "timeouts": 0, "errors": 0})
+        stats["calls"] += 1
+        stats["total_seconds"] += seconds
+        stats["max_seconds"] = max(stats["max_seconds"], seconds)
+        if outcome != "ok":
+            stats[outcome] += 1
+
+    async def _run_tool_call(self, rt_session: RTSession, item: dict[str, Any], tool_call: RTToolCall):
+        # The model may call a tool that does not exist; it still gets an output for the call
+        tool = self.tools.get(item["name"])
+        args_str = item["arguments"]
+
+        # Parse arguments once and reuse
+        try:
+            args_dict = json.loads(args_str)
+        except json.JSONDecodeError as e:
+            logger.warning("Invalid arguments for tool %s (%s): %s", item["name"], e, Payload(args_str))
+            args_dict = {}
+
+        # Send intermediate feedback to UI only (no audio to avoid double voice)
+        try:
+            if tool is not None:
+                await self._send_intermediate_feedback_to_ui(rt_session, item["name"], args_dict)
+        except Exception as feedback_error:
+            logger.warning("Intermediate feedback for tool %s failed: %s", item["name"], feedback_error)
+
+        logger.debug("Executing tool %s", item["name"])
+        start = time.perf_counter()
+        outcome = "ok"
+        try:
+            if tool is None:
+                raise LookupError("unknown tool")
+            result = await asyncio.wait_for(tool.target(args_dict), timeout=self.tool_timeout)
+        except asyncio.TimeoutError:
+            outcome = "timeouts"
+            result = ToolResult({"error": f"Tool '{item['name']}' timed out after {self.tool_timeout:g}s"}, ToolResultDirection.TO_SERVER)
+        except Exception as e:
+            outcome = "errors"
+            result = ToolResult({"error": f"Tool '{item['name']}' failed: {e}"}, ToolResultDirection.TO_SERVER)
+        self._record_tool_latency(item["name"], time.perf_counter() - start, outcome)
+
+        await rt_session.send_to_server({
+            "type": "conversation.item.create",
+            "item": {
+                "type": "function_call_output",
+                "call_id": item["call_id"],
+                "output": result.to_text() if result.destination == ToolResultDirection.TO_SERVER else ""
+            }
+        })
+        if result.destination == ToolResultDirection.TO_CLIENT:
+            # TODO: this will break clients that don't know about this extra message, rewrite
+            # this to be a regular text message with a special marker of some sort
+            await rt_session.send_to_client({
+                "type": "extension.middle_tier_tool_response",
+                "previous_item_id": tool_call.previous_id,
+                "tool_name": item["name"],
+                "tool_result": result.to_text()
+            })
+
+    async def _finish_tool_calls(self, rt_session: RTSession, tool_tasks: list[asyncio.Task]):
+        # Tool calls of one response run concurrently; continue the response as soon as the last one lands
+        await asyncio.gather(*tool_tasks, return_exceptions=True)
+        self._mark_turn(rt_session, "response.create")
+        await rt_session.send_to_server({
+            "type": "response.create"
+        })
+
+    async def _barge_in(self, rt_session: RTSession, trigger: str):
+        """
+        The visitor started speaking: cancel the response being generated, truncate its audio item at
+        what the client has played so the model knows what was heard, and drop its pending deltas.
+        """
+        playback = rt_session.playback
+        if rt_session.to_client is not None:
+            self._stale_deltas.inc(rt_session.to_client.drop_stale(_RESPONSE_DELTA_TYPES))
+        played_ms = playback.played_ms()
+        cancel = playback.active and not playback.cancelled
+        # The response may be done upstream while the client is still playing its audio
+        truncate = playback.item_id is not None and played_ms < playback.sent_ms()
+        if not cancel and not truncate:
+            return
+        self._barge_ins.inc(1, trigger)
+        if cancel:
+            playback.cancelled = True
+            playback.cancelled_id = playback.response_id
+            playback.interrupted_at = time.perf_counter()
+            await rt_session.send_to_server({"type": "response.cancel"})
+        if truncate:
+            await rt_session.send_to_server({
+                "type": "conversation.item.truncate",
+                "item_id": playback.item_id,
+                "content_index": playback.content_index,
+                "audio_end_ms": played_ms
+            })
+            playback.item_id = None
+        logger.debug("Barge-in (%s): cancel=%s, truncated at %d ms", trigger, cancel, played_ms)
+
+    def _end_playback(self, rt_session: RTSession, response_id: Optional[str]):
+        playback = rt_session.playback
+        playback.active = False
+        if playback.cancelled and playback.cancelled_id in (None, response_id):
+            playback.cancelled = False
+            self._interruption_seconds.observe(time.perf_counter() - playback.interrupted_at)
+
+    async def _process_message_to_client(self, msg: str, rt_session: RTSession) -> Optional[str]:
+        # Fast path: audio deltas and other passthrough frames are forwarded byte-for-byte
+        ftype = frame_type(msg.data)
+        if (rt_session.playback.replaced_id is not None and ftype is not None and ftype.startswith("response.")
+                and ftype != "response.done" and rt_session.playback.is_replaced(msg.data)):
+            return None
+        if ftype not in _CLIENT_REWRITE_TYPES:
+            if ftype in _RESPONSE_DELTA_TYPES and rt_session.playback.is_stale(msg.data):
+                self._stale_deltas.inc()
+                return None
+            if ftype == "response.created":
+                match = _CREATED_RESPONSE_ID.search(msg.data)
+                rt_session.playback.start(match.group(1) if match is not None else None)
+            if ftype in _TIMELINE_TYPES:
+                self._mark_turn(rt_session, ftype)
+            if ftype == "response.audio.delta" and "audio" not in rt_session.outputs:
+                rt_session.audio_bytes_stripped += len(msg.data)
+                return None
+            return msg.data
 
-    async def _process_message_to_client(self, msg: str, client_ws: web.WebSocketResponse, server_ws: web.WebSocketResponse) -> Optional[str]:
-        # RAG augmentation: intercept user message and retrieve knowledge
         message = json.loads(msg.data)
         updated_message = msg.data
+        if message.get("type") == "response.done" and rt_session.playback.replaced_id is not None \
+                and message.get("response", {}).get("id") == rt_session.playback.replaced_id:
+            await self._drop_replaced_response(rt_session, message["response"])
+            # The client saw the response start; it ends as cancelled, without its output
+            message["response"].update(status="cancelled", output=[])
+            return json.dumps(message)
+        # RAG augmentation: intercept user message and retrieve knowledge
         if message.get("type") == "conversation.input" and "item" in message and message["item"].get("role") == "user":
             user_content = message["item"].get("content", "")
             if isinstance(user_content, list):
@@ -98,33 +732,62 @@ class RTMiddleTier:
                 user_text = " ".join([c.get("text", "") for c in user_content if isinstance(c, dict) and c.get("type") == "text"])
             else:
                 user_text = user_content
-            logger.info(f"[RAG DEBUG] Triggered for user_text: {user_text}")
             # Retrieve RAG documents
-            rag_results = self.rag_retrieve(user_text, top=3)
-            logger.info(f"[RAG DEBUG] rag_results: {rag_results}")
+            rag_results = await self._timed_rag_retrieve(rt_session.turn, user_text)
+            logger.debug("Retrieved %d documents for %s: %s", len(rag_results or ()), Payload(user_text), Payload(rag_results))
             if rag_results:
+                rt_session.grounded = True
                 # Format retrieved docs as context
-                context_lines = []
-                for i, doc in enumerate(rag_results, 1):
-                    context_lines.append(f"[Source {i}] {doc['content']}")
-                    if doc.get('people'):
-                        context_lines.append(f"  People: {', '.join(doc['people'])}")
-                    if doc.get('organizations'):
-                        context_lines.append(f"  Organizations: {', '.join(doc['organizations'])}")
-                    if doc.get('locations'):
-                        context_lines.append(f"  Locations: {', '.join(doc['locations'])}")
-                    if doc.get('keyphrases'):
-                        context_lines.append(f"  Keyphrases: {', '.join(doc['keyphrases'])}")
-                context_block = "\n".join(context_lines)
-                logger.info(f"[RAG DEBUG] context_block:\n{context_block}")
+                context_block = self._format_context(user_text, rag_results)
+                logger.debug("Context block: %s", Payload(context_block))
                 # Prepend to user message content
                 message["item"]["content"] = f"Knowledge retrieved from search:\n{context_block}\n\nUser message: {user_text}"
             updated_message = json.dumps(message)
 
-        message = json.loads(msg.data)
-        updated_message = msg.data
         if message is not None:
             match message["type"]:
+                # Voice turns: start retrieval as soon as any user text is known
+                case "input_audio_buffer.speech_started":
+                    await self._barge_in(rt_session, "speech_started")
+                    rt_session.prefetch.reset()
+                    rt_session.new_turn()
+                    rt_session.question = ""
+                    rt_session.answered = None
+
+                case "conversation.item.input_audio_transcription.delta":
+                    rt_session.prefetch.partial_text += message.get("delta", "")
+
+                case "input_audio_buffer.speech_stopped":
+                    self._mark_turn(rt_session, "speech_stopped")
+                    self._start_prefetch(rt_session, rt_session.prefetch.partial_text)
+                    prefetch = rt_session.prefetch
+                    if prefetch.auto_response and not prefetch.responded:
+                        prefetch.cancel_fallback()
+                        prefetch.fallback_task = asyncio.create_task(self._respond_without_transcript(rt_session))
+
+                case "conversation.item.input_audio_transcription.completed":
+                    self._mark_turn(rt_session, "transcript_completed")
+                    rt_session.window.item_text(message.get("item_id", ""), message.get("transcript", ""))
+                    prefetch = rt_session.prefetch
+                    self._start_prefetch(rt_session, message.get("transcript", ""))
+                    rt_session.question = message.get("transcript", "").strip()
+                    rt_session.grounded = False
+                    if prefetch.auto_response:
+                        self._auto_respond(rt_session)
+                    elif rt_session.vad_responses:
+                        if rt_session.answered is not None:
+                            # The model answered before the transcript arrived
+                            answered, rt_session.answered = rt_session.answered, None
+                            self._store_answer(rt_session, answered)
+                        else:
+                            await self._replace_with_cached_answer(rt_session)
+
+                case "conversation.item.input_audio_transcription.failed":
+                    self._mark_turn(rt_session, "transcript_failed")
+                    logger.warning("Input audio transcription failed: %s", (message.get("error") or {}).get("message"))
+                    if rt_session.prefetch.auto_response:
+                        self._auto_respond(rt_session)
+
                 case "session.created":
                     session = message["session"]
                     # Hide the instructions, tools and max tokens from clients, if we ever allow client-side 
@@ -144,12 +807,20 @@ class RTMiddleTier:
                 case "response.output_item.added":
                     if "item" in message and message["item"]["type"] == "function_call":
                         updated_message = None
+                    elif "item" in message and message["item"].get("role") == "assistant":
+                        rt_session.playback.response_id = message.get("response_id")
+                        rt_session.playback.item_id = message["item"].get("id")
 
                 case "conversation.item.created":
-                    if "item" in message and message["item"]["type"] == "function_call":
+                    if "item" in message:
+                        rt_session.window.item_created(message["item"])
+                    if "item" in message and message["item"].get("id", "").startswith((CONTEXT_ITEM_PREFIX, SUMMARY_ITEM_PREFIX, ANSWER_ITEM_PREFIX)):
+                        # Items the middle tier created itself (knowledge blocks, summaries, cached answers) are not for the client
+                        updated_message = None
+                    elif "item" in message and message["item"]["type"] == "function_call":
                         item = message["item"]
-                        if item["call_id"] not in self._tools_pending:
-                            self._tools_pending[item["call_id"]] = RTToolCall(item["call_id"], message["previous_item_id"])
+                        if item["call_id"] not in rt_session.tools_pending:
+                            rt_session.tools_pending[item["call_id"]] = RTToolCall(item["call_id"], message["previous_item_id"])
                         updated_message = None
                     elif "item" in message and message["item"]["type"] == "function_call_output":
                         updated_message = None
@@ -160,58 +831,36 @@ class RTMiddleTier:
                 case "response.function_call_arguments.done":
                     updated_message = None
 
+                case "conversation.item.deleted":
+                    if rt_session.window.item_deleted(message.get("item_id", "")):
+                        updated_message = None
+
                 case "response.output_item.done":
+                    if "item" in message:
+                        rt_session.window.item_done(message["item"])
                     if "item" in message and message["item"]["type"] == "function_call":
                         item = message["item"]
-                        tool_call = self._tools_pending[message["item"]["call_id"]]
-                        tool = self.tools[item["name"]]
-                        args_str = item["arguments"]
-
-                        # Parse arguments once and reuse
-                        try:
-                            args_dict = json.loads(args_str)
-                        except json.JSONDecodeError as e:
-                            print(f"❌ Error parsing tool arguments: {e}")
-                            print(f"   Raw arguments: {args_str}")
-                            args_dict = {}
-
-                        # Send intermediate feedback to UI only (no audio to avoid double voice)
-                        print(f"💬 Sending intermediate feedback for tool: {item['name']}")
-                        try:
-                            feedback_text = await self._send_intermediate_feedback_to_ui(client_ws, server_ws, item["name"], args_dict)
-                        except Exception as feedback_error:
-                            print(f"⚠️ Intermediate feedback failed: {feedback_error}")
-
-                        # Small delay for UI update
-                        await asyncio.sleep(0.1)
-
-                        print(f"🔧 Executing tool: {item['name']}")
-                        result = await tool.target(args_dict)
-                        await server_ws.send_json({
-                            "type": "conversation.item.create",
-                            "item": {
-                                "type": "function_call_output",
-                                "call_id": item["call_id"],
-                                "output": result.to_text() if result.destination == ToolResultDirection.TO_SERVER else ""
-                            }
-                        })
-                        if result.destination == ToolResultDirection.TO_CLIENT:
-                            # TODO: this will break clients that don't know about this extra message, rewrite
-                            # this to be a regular text message with a special marker of some sort
-                            await client_ws.send_json({
-                                "type": "extension.middle_tier_tool_response",
-                                "previous_item_id": tool_call.previous_id,
-                                "tool_name": item["name"],
-                                "tool_result": result.to_text()
-                            })
+                        tool_call = rt_session.tools_pending[item["call_id"]]
+                        rt_session.tool_tasks.append(asyncio.create_task(self._run_tool_call(rt_session, item, tool_call)))
                         updated_message = None
 
                 case "response.done":
-                    if len(self._tools_pending) > 0:
-                        self._tools_pending.clear() # Any chance tool calls could be interleaved across different outstanding responses?
-                        await server_ws.send_json({
-                            "type": "response.create"
-                        })
+                    self._mark_turn(rt_session, "response.done")
+                    self._end_playback(rt_session, message.get("response", {}).get("id"))
+                    if rt_session.question:
+                        self._store_answer(rt_session, message.get("response", {}))
+                    elif rt_session.vad_responses and rt_session.responses_done > 0:
+                        rt_session.answered = message.get("response", {})
+                    rt_session.responses_done += 1
+                    if not rt_session.tools_pending:
+                        # The turn is answered (no tool follow-up response is coming)
+                        for event in rt_session.window.on_response_done():
+                            await rt_session.send_to_server(event)
+                    if len(rt_session.tools_pending) > 0:
+                        tool_tasks = rt_session.tool_tasks
+                        rt_session.tool_tasks = []
+                        rt_session.tools_pending.clear()
+                        rt_session.tool_tasks.append(asyncio.create_task(self._finish_tool_calls(rt_session, tool_tasks)))
                     if "response" in message and "output" in message["response"]:
                         replace = False
                         # Create a new output list without function calls
@@ -226,9 +875,34 @@ class RTMiddleTier:
                             message["response"]["output"] = new_output
                             updated_message = json.dumps(message)
 
+                case "error":
+                    # With server VAD the service may already have cancelled the response itself
+                    error = message.get("error") or {}
+                    if error.get("code") == "response_cancel_not_active" and rt_session.playback.interrupted_at is not None:
+                        updated_message = None
+                    elif error.get("type") == "server_error" or "rate_limit" in (error.get("code") or ""):
+                        self.admission.overloaded()
+
         return updated_message
 
-    async def _process_message_to_server(self, msg: str, ws: web.WebSocketResponse) -> Optional[str]:
+    def _process_binary_audio(self, data: bytes, rt_session: RTSession, input_rate: int) -> Optional[str]:
+        """
+        Turn a raw PCM16 frame from the client into an upstream append message, resampling to 24 kHz.
+        """
+        if rt_session.input_resampler is None:
+            from resampler import StreamingResampler
+            rt_session.input_resampler = StreamingResampler(input_rate, REALTIME_SAMPLE_RATE)
+        pcm16 = rt_session.input_resampler.process(data)
+        if not pcm16:
+            return None
+        # Base64 needs no JSON escaping, so the frame can be assembled directly
+        return '{"type":"input_audio_buffer.append","audio":"' + base64.b64encode(pcm16).decode("ascii") + '"}'
+
+    async def _process_message_to_server(self, msg: str, rt_session: RTSession) -> Optional[str]:
+        # Fast path: input_audio_buffer.append and other passthrough frames are forwarded byte-for-byte
+        if frame_type(msg.data) not in _SERVER_REWRITE_TYPES:
+            return msg.data
+
         message = json.loads(msg.data)
         updated_message = msg.data
         if message is not None:
@@ -247,11 +921,51 @@ class RTMiddleTier:
                         session["voice"] = self.voice_choice
                     session["tool_choice"] = "auto" if len(self.tools) > 0 else "none"
                     session["tools"] = [tool.schema for tool in self.tools.values()]
+                    # Clients that only read response text do not need the model to generate audio at all;
+                    # transcript consumers still need it upstream and get the audio stripped on the way back
+                    if not rt_session.outputs & {"audio", "transcript"}:
+                        session["modalities"] = ["text"]
+                    # With server VAD the service would create the response before the transcript (and
+                    # retrieval) is ready, so take over response.create and inject context first
+                    rt_session.prompt_digest = prompt_digest(session["instructions"]) if session.get("instructions") else None
+                    turn_detection = session.get("turn_detection")
+                    server_vad = isinstance(turn_detection, dict) and turn_detection.get("type") == "server_vad"
+                    if self.rag_helper.enabled and session.get("input_audio_transcription") and server_vad:
+                        turn_detection["create_response"] = False
+                        rt_session.prefetch.auto_response = True
+                    elif "turn_detection" in session:
+                        # The answer cache then swaps the service's own response once the transcript is in
+                        rt_session.vad_responses = server_vad and turn_detection.get("create_response", True) is not False
                     updated_message = json.dumps(message)
 
+                case "conversation.item.create":
+                    # Typed questions
+                    item = message.get("item") or {}
+                    if item.get("role") == "user":
+                        rt_session.question = " ".join(c.get("text", "") for c in item.get("content") or [] if c.get("type") == "input_text").strip()
+                        rt_session.grounded = False
+
+                case "response.create":
+                    prefetch = rt_session.prefetch
+                    if await self._answer_from_cache(rt_session):
+                        updated_message = None
+                    elif prefetch.task is not None and not prefetch.injected and not prefetch.task.done():
+                        # Waiting on retrieval here would hold up the client's audio queued behind this frame
+                        prefetch.response_task = asyncio.create_task(self._create_response(rt_session, message))
+                        updated_message = None
+                    else:
+                        await self._inject_prefetched_context(rt_session)
+                        self._mark_turn(rt_session, "response.create")
+
+                case "user.interruption":
+                    # chat.js's own voice detection; handled here since the service does not know this event
+                    await self._barge_in(rt_session, "client")
+                    await rt_session.send_to_client({"type": "extension.interruption_acknowledged"})
+                    updated_message = None
+
         return updated_message
 
-    async def _send_intermediate_feedback_to_ui(self, client_ws: web.WebSocketResponse, server_ws: web.WebSocketResponse, tool_name: str, args: dict) -> str:
+    async def _send_intermediate_feedback_to_ui(self, rt_session: RTSession, tool_name: str, args: dict) -> str:
         """
         Send intermediate feedback to the UI to show what the agent is doing
         while waiting for tool execution (especially web search)
@@ -270,10 +984,10 @@ class RTMiddleTier:
             }
 
             feedback_text = feedback_messages.get(tool_name, f"I'm working on that using {tool_name}.")
-            print(f"💬 Intermediate feedback: '{feedback_text}' for tool '{tool_name}'")
+            logger.debug("Intermediate feedback for tool %s: %s", tool_name, feedback_text)
 
             # Send feedback message directly to the client UI
-            await client_ws.send_json({
+            await rt_session.send_to_client({
                 "type": "extension.intermediate_feedback",
                 "feedback_text": feedback_text,
                 "tool_name": tool_name,
@@ -281,15 +995,10 @@ class RTMiddleTier:
             })
 
             # Skip audio feedback to avoid double audio - just show in UI
-            print("💬 Skipping audio feedback to avoid double audio (UI feedback is sufficient)")
-
-            print("💬 Intermediate feedback sent to UI successfully")
             return feedback_text
 
-        except Exception as e:
-            print(f"❌ Error sending intermediate feedback: {e}")
-            import traceback
-            traceback.print_exc()
+        except Exception:
+            logger.exception("Sending intermediate feedback for tool %s failed", tool_name)
             return ""
 
     def _get_search_feedback_message(self, args: dict) -> str:
@@ -312,51 +1021,467 @@ class RTMiddleTier:
         else:
             return "Let me find that information for you."
 
-    async def _forward_messages(self, ws: web.WebSocketResponse):
-        async with aiohttp.ClientSession(base_url=self.endpoint) as session:
-            params = { "api-version": self.api_version, "deployment": self.deployment}
-            headers = {}
-            if "x-ms-client-request-id" in ws.headers:
-                headers["x-ms-client-request-id"] = ws.headers["x-ms-client-request-id"]
-            if self.key is not None:
-                headers = { "api-key": self.key }
-            else:
-                headers = { "Authorization": f"Bearer {self._token_provider()}" } # NOTE: no async version of token provider, maybe refresh token on a timer?
-            async with session.ws_connect("/openai/realtime", headers=headers, params=params) as target_ws:
-                async def from_client_to_server():
-                    async for msg in ws:
-                        if msg.type == aiohttp.WSMsgType.TEXT:
-                            new_msg = await self._process_message_to_server(msg, ws)
-                            if new_msg is not None:
-                                await target_ws.send_str(new_msg)
-                        else:
-                            print("Error: unexpected message type:", msg.type)
-                    
-                    # Means it is gracefully closed by the client then time to close the target_ws
-                    if target_ws:
-                        print("Closing OpenAI's realtime socket connection.")
-                        await target_ws.close()
-                        
-                async def from_server_to_client():
-                    async for msg in target_ws:
-                        if msg.type == aiohttp.WSMsgType.TEXT:
-                            new_msg = await self._process_message_to_client(msg, ws, target_ws)
-                            if new_msg is not None:
-                                await ws.send_str(new_msg)
-                        else:
-                            print("Error: unexpected message type:", msg.type)
+    async def _auth_headers(self) -> dict[str, str]:
+        if self.key is not None:
+            return { "api-key": self.key }
+        return { "Authorization": f"Bearer {await self._token_manager.get_token()}" }
+
+    def _collect_metrics(self) -> list[MetricFamily]:
+        """
+        Expose the subsystems' own counters (cache, prefetch, pool, tokens, tools, queues) on /metrics.
+        """
+        families: list[MetricFamily] = [
+            ("realtime_rag_cache", "gauge", "RAG retrieval cache counters",
+             [({"stat": k}, v) for k, v in self.rag_cache.stats().items()]),
+            ("realtime_rag_prefetch_total", "counter", "Speculative RAG prefetches by outcome",
+             [({"outcome": k}, v) for k, v in self.rag_prefetch_stats.items()]),
+            ("realtime_upstream_pool", "gauge", "Pre-warmed upstream session pool counters",
+             [({"stat": k}, v) for k, v in self._upstream_pool.stats().items()]),
+            ("realtime_search_fanout_total", "counter", "Azure Search fan-out queries, hedged requests and partial results",
+             [({"stat": k}, v) for k, v in self.rag_helper.fanout_stats.items()]),
+            ("realtime_search_p95_seconds", "gauge", "Rolling p95 latency per search index, the hedging threshold",
+             [({"index": index}, tracker.p95()) for index, tracker in self.rag_helper.latency.items() if tracker.p95() is not None]),
+            ("realtime_rag_local_total", "counter", "Lookups answered by the local index, passed on to Azure Search, or served as a fallback",
+             [({"outcome": k}, v) for k, v in self.rag_helper.local_stats.items()]),
+            ("realtime_admission_total", "counter", "Realtime connections admitted, queued and rejected",
+             [({"outcome": k}, v) for k, v in self.admission.counts.items()]),
+            ("realtime_admission", "gauge", "Admission control state: active sessions, queue length, adaptive session limit",
+             [({"stat": k}, v) for k, v in self.admission.stats().items()]),
+            ("realtime_session_resume_total", "counter", "Sessions parked after a client drop, resumed or expired, and frames replayed or lost",
+             [({"outcome": k}, v) for k, v in self.resumption.counts.items()]),
+            ("realtime_session_resume", "gauge", "Sessions that can be resumed and sessions currently parked",
+             [({"stat": k}, v) for k, v in self.resumption.stats().items()]),
+            ("realtime_output", "gauge", "Output channel negotiation counters",
+             [({"stat": k}, v) for k, v in self.output_stats.items()]),
+            ("realtime_conversation_window_total", "counter", "Conversation items deleted and estimated tokens trimmed by the conversation window",
+             [({"stat": k}, v) for k, v in self.conversation_stats.items()]),
+            ("realtime_answer_cache_total", "counter", "Answer cache lookups and entries stored, expired, evicted and invalidated",
+             [({"stat": k}, v) for k, v in self.answer_cache.counts.items()]),
+            ("realtime_answer_cache", "gauge", "Answer cache size",
+             [({"stat": k}, v) for k, v in self.answer_cache.stats().items()]),
+            ("realtime_answer_cache_saved_total", "counter", "Estimated model response seconds and output tokens saved by answer cache hits",
+             [({"unit": "seconds"}, self.answer_cache.seconds_saved), ({"unit": "tokens"}, self.answer_cache.tokens_saved)]),
+            ("realtime_relay_queue", "gauge", "Relay queue counters",
+             [({"direction": direction, "stat": k}, v) for direction, stats in self.relay_stats().items() for k, v in stats.items()]),
+            ("realtime_tool_calls", "gauge", "Tool call counters and latency",
+             [({"tool": name, "stat": k}, v) for name, stats in self.tool_stats.items() for k, v in stats.items()]),
+        ]
+        if self._token_manager is not None:
+            families.append(("realtime_token_refresh", "gauge", "Entra ID token refresh counters",
+                             [({"stat": k}, v) for k, v in self._token_manager.stats().items() if v is not None]))
+        return families
+
+    def _observe_processing(self, start: float, processing: SuspendTimer):
+        # Waits (RAG, prefetch budget, backpressure) go to their own histogram, not the relay's overhead
+        self._relay_overhead_seconds.observe(time.perf_counter() - start - processing.waited)
+        if processing.suspended:
+            self._relay_wait_seconds.observe(processing.waited)
+
+    def relay_stats(self) -> dict[str, dict[str, Any]]:
+        return {
+            "to_client": self.to_client_stats.as_dict(),
+            "to_server": self.to_server_stats.as_dict(),
+        }
+
+    async def _forward_messages(self, ws: web.WebSocketResponse, target_ws: aiohttp.ClientWebSocketResponse,
+                                input_rate: int = REALTIME_SAMPLE_RATE, outputs: frozenset[str] = OUTPUT_CHANNELS,
+                                pending: Sequence[aiohttp.WSMessage] = (), upstream_pending: Sequence[aiohttp.WSMessage] = ()):
+        # Each direction is decoupled by a bounded queue so a slow browser does not stall upstream
+        # reads and a slow upstream does not stall microphone intake
+        to_client = RelayQueue(self.to_client_stats, self.relay_queue_max_frames, self.relay_queue_max_bytes,
+                               droppable=frozenset({"response.audio.delta"}))
+        to_server = RelayQueue(self.to_server_stats, self.relay_queue_max_frames, self.relay_queue_max_bytes,
+                               droppable=frozenset({"input_audio_buffer.append"}))
+        rt_session = RTSession(ws, target_ws, to_client, to_server, outputs)
+        rt_session.input_rate = input_rate
+        self._active_sessions.inc()
+        # The session owns the admission slot and the upstream socket from here on; until the upstream
+        # relay has started, they are released here if setting the session up fails
+        try:
+            if not outputs & {"audio", "transcript"}:
+                self.output_stats["text_only_sessions"] += 1
+            rt_session.recording = self.recorder.start_session({"input_rate": input_rate, "outputs": sorted(outputs)})
+            if self.resumption.enabled:
+                rt_session.resume_token = self.resumption.register(rt_session)
+                rt_session.sent = FrameRing(self.resumption.buffer_frames, self.resumption.buffer_bytes)
+                await rt_session.send_to_client({
+                    "type": "extension.session_resumable",
+                    "resume_token": rt_session.resume_token,
+                    "grace_seconds": self.resumption.grace,
+                    "resumed": False
+                })
+            if rt_session.recording is not None:
+                rt_session.log.session = rt_session.recording.session_id
+            bind_log_context(rt_session.log)
+            rt_session.upstream = asyncio.create_task(self._relay_upstream(rt_session, upstream_pending))
+        finally:
+            if rt_session.upstream is None:
+                await self._end_session(rt_session)
+        await self._serve_client(rt_session, ws, pending)
+
+    async def _relay_upstream(self, rt_session: RTSession, pending: Sequence[aiohttp.WSMessage] = ()):
+        """
+        Relay the service side of a session until the service closes or the session is ended, then
+        release it. Runs independently of the client connection, which may drop and be replaced.
+        `pending` are frames the service sent before the relay started (read by the upstream pool).
+        """
+        to_client, to_server, target_ws, recording = rt_session.to_client, rt_session.to_server, rt_session.server_ws, rt_session.recording
+
+        async def send_to_server():
+            await drain_to(to_server, target_ws.send_str)
+            # Means it is gracefully closed by the client then time to close the target_ws
+            logger.debug("Closing the realtime service connection")
+            await target_ws.close()
+
+        async def server_messages():
+            for msg in pending:
+                yield msg
+            async for msg in target_ws:
+                yield msg
+
+        async def from_server_to_client():
+            async for msg in (server_messages() if pending else target_ws):
+                if msg.type == aiohttp.WSMsgType.TEXT:
+                    start = time.perf_counter()
+                    if recording is not None:
+                        recording.record(FROM_SERVER, msg.data)
+                    self._frames.inc(1, "to_client")
+                    self._bytes.inc(len(msg.data), "to_client")
+                    processing = SuspendTimer(self._process_message_to_client(msg, rt_session))
+                    new_msg = await processing
+                    self._observe_processing(start, processing)
+                    if new_msg is not None:
+                        ftype = frame_type(new_msg)
+                        if ftype in INTERRUPTION_TYPES:
+                            to_client.drop_stale(frozenset({"response.audio.delta"}))
+                        rt_session.bytes_to_client += len(new_msg)
+                        await to_client.put(new_msg, ftype)
+                else:
+                    logger.warning("Unexpected message type from the realtime service: %s", msg.type)
+            to_client.close()
+            # Nothing more can be sent to a closed service socket
+            to_server.discard()
+
+        pumps = [asyncio.create_task(pump()) for pump in (send_to_server, from_server_to_client)]
+        try:
+            await asyncio.gather(*pumps)
+        except ConnectionResetError:
+            pass
+        except Exception:
+            logger.exception("Relaying the realtime service connection failed")
+        finally:
+            for task in pumps:
+                task.cancel()
+            await self._end_session(rt_session)
+
+    async def _end_session(self, rt_session: RTSession):
+        """
+        Release everything a session holds: its tasks, queues, upstream socket, recording, resume
+        token and admission slot.
+        """
+        for task in rt_session.tool_tasks:
+            task.cancel()
+        rt_session.prefetch.reset()
+        rt_session.to_client.discard()
+        rt_session.to_server.discard()
+        self._active_sessions.dec()
+        try:
+            await rt_session.server_ws.close()
+            if rt_session.recording is not None:
+                await rt_session.recording.close()
+        finally:
+            if rt_session.resume_token is not None:
+                self.resumption.unregister(rt_session.resume_token)
+            self.admission.release()
+        self.output_stats["bytes_to_client"] += rt_session.bytes_to_client
+        self.output_stats["audio_bytes_stripped"] += rt_session.audio_bytes_stripped
+        self.conversation_stats["items_deleted"] += rt_session.window.items_deleted
+        self.conversation_stats["tokens_trimmed"] += rt_session.window.tokens_trimmed
+        if rt_session.audio_bytes_stripped:
+            logger.info("Session relayed %d bytes to the client, saved %d bytes of unused audio",
+                        rt_session.bytes_to_client, rt_session.audio_bytes_stripped)
+
+    async def _serve_client(self, rt_session: RTSession, ws: web.WebSocketResponse, pending: Sequence[aiohttp.WSMessage] = ()):
+        """
+        Relay between one client connection and its session until either side goes away. A client that
+        drops without closing the socket leaves the session parked for resumption instead of ended.
+        """
+        to_client, to_server, recording = rt_session.to_client, rt_session.to_server, rt_session.recording
+        rt_session.client_ws = ws
+        bind_log_context(rt_session.log)
+        rt_session.detach = asyncio.Event()
+        rt_session.client_done = asyncio.get_running_loop().create_future()
+
+        async def client_messages():
+            # Frames the client sent while it waited for admission come first
+            for msg in pending:
+                yield msg
+            async for msg in ws:
+                yield msg
+
+        async def from_client_to_server():
+            async for msg in (client_messages() if pending else ws):
+                start = time.perf_counter()
+                if recording is not None and msg.type in (aiohttp.WSMsgType.TEXT, aiohttp.WSMsgType.BINARY):
+                    recording.record(FROM_CLIENT, msg.data)
+                self._frames.inc(1, "to_server")
+                self._bytes.inc(len(msg.data) if msg.type in (aiohttp.WSMsgType.TEXT, aiohttp.WSMsgType.BINARY) else 0, "to_server")
+                if msg.type == aiohttp.WSMsgType.TEXT:
+                    processing = SuspendTimer(self._process_message_to_server(msg, rt_session))
+                    new_msg = await processing
+                    self._observe_processing(start, processing)
+                    if new_msg is not None:
+                        ftype = frame_type(new_msg)
+                        if ftype in INTERRUPTION_TYPES:
+                            to_client.drop_stale(frozenset({"response.audio.delta"}))
+                        await to_server.put(new_msg, ftype)
+                elif msg.type == aiohttp.WSMsgType.BINARY:
+                    new_msg = self._process_binary_audio(msg.data, rt_session, rt_session.input_rate)
+                    self._relay_overhead_seconds.observe(time.perf_counter() - start)
+                    if new_msg is not None:
+                        await to_server.put(new_msg, "input_audio_buffer.append")
+                else:
+                    logger.warning("Unexpected message type from the client: %s", msg.type)
+
+        async def send_to_client():
+            playback = rt_session.playback
+            sent = rt_session.sent
+
+            async def send(data: str):
+                ftype = frame_type(data)
+                # Audio actually handed to the client, for the truncation offset on barge-in
+                if ftype == "response.audio.delta":
+                    playback.audio_sent(data)
+                elif sent is not None:
+                    sent.append(data)
+                await ws.send_str(data)
+
+            await drain_to(to_client, send)
+
+        reader = asyncio.create_task(from_client_to_server())
+        writer = asyncio.create_task(send_to_client())
+        detach = asyncio.create_task(rt_session.detach.wait())
+        try:
+            await asyncio.wait({reader, writer, detach, rt_session.upstream}, return_when=asyncio.FIRST_COMPLETED)
+            send_failed = writer.done() and writer.exception() is not None
+            if (writer.done() and not send_failed) or rt_session.upstream.done():
+                # The session ended upstream: deliver what is left, then let the client go
+                reader.cancel()
+                await asyncio.gather(writer, return_exceptions=True)
+                await ws.close()
+                return
+            for task in (reader, writer):
+                task.cancel()
+            await asyncio.gather(reader, writer, return_exceptions=True)
+            dropped = send_failed or ws.close_code in (None, aiohttp.WSCloseCode.ABNORMAL_CLOSURE)
+            if rt_session.resume_token is not None and (detach.done() or dropped):
+                if detach.done():
+                    await ws.close(code=4000, message=b"session resumed on another connection")
+                self._park(rt_session)
+                return
+            # Gracefully closed by the client: end the session
+            to_server.close()
+            await asyncio.gather(rt_session.upstream, return_exceptions=True)
+        finally:
+            detach.cancel()
+            for task in (reader, writer):
+                task.cancel()
+            rt_session.client_done.set_result(None)
 
-                try:
-                    await asyncio.gather(from_client_to_server(), from_server_to_client())
-                except ConnectionResetError:
-                    # Ignore the errors resulting from the client disconnecting the socket
-                    pass
+    def _park(self, rt_session: RTSession):
+        rt_session.parked_seq = rt_session.sent.next_seq
+        missed = rt_session.sent
+
+        async def buffer(data: str):
+            # Model audio is not worth replaying once the moment has passed; text and events are
+            if frame_type(data) != "response.audio.delta":
+                missed.append(data)
+
+        rt_session.park_task = asyncio.create_task(drain_to(rt_session.to_client, buffer))
+        self.resumption.park(rt_session.resume_token, rt_session.to_server.close)
+        logger.info("Client dropped, session parked for %gs", self.resumption.grace)
+
+    async def _resume_client(self, rt_session: RTSession, ws: web.WebSocketResponse, last_event: Optional[str]) -> bool:
+        """
+        Re-attach a reconnecting client to its parked session and replay the frames it missed.
+        Returns False if the session ended before it could be resumed.
+        """
+        if rt_session.client_done is not None and not rt_session.client_done.done():
+            # The old connection has not noticed it is gone yet
+            rt_session.detach.set()
+            await rt_session.client_done
+        if rt_session.upstream.done() or not self.resumption.unpark(rt_session.resume_token):
+            return False
+        rt_session.park_task.cancel()
+        await asyncio.gather(rt_session.park_task, return_exceptions=True)
+        start = rt_session.sent.seq_after(last_event) if last_event else None
+        frames, missed = rt_session.sent.since(start if start is not None else rt_session.parked_seq)
+        self.resumption.counts["replayed_frames"] += len(frames)
+        self.resumption.counts["missed_frames"] += missed
+        await ws.send_json({
+            "type": "extension.session_resumable",
+            "resume_token": rt_session.resume_token,
+            "grace_seconds": self.resumption.grace,
+            "resumed": True,
+            "replayed": len(frames),
+            "missed": missed
+        })
+        for data in frames:
+            await ws.send_str(data)
+        logger.info("Session resumed, replayed %d frames (%d lost)", len(frames), missed)
+        await self._serve_client(rt_session, ws)
+        return True
 
     async def _websocket_handler(self, request: web.Request):
-        ws = web.WebSocketResponse()
-        await ws.prepare(request)
-        await self._forward_messages(ws)
+        # Pings detect clients that vanished without closing, so their sessions can be parked
+        ws = web.WebSocketResponse(heartbeat=self.resumption.heartbeat if self.resumption.enabled else None)
+        # Sample rate of raw binary PCM16 frames sent by the client, if it streams audio that way
+        try:
+            input_rate = int(request.query.get("input_rate", REALTIME_SAMPLE_RATE))
+        except ValueError:
+            input_rate = None
+        if input_rate is None or not MIN_INPUT_RATE <= input_rate <= MAX_INPUT_RATE:
+            raise web.HTTPBadRequest(text=f"input_rate must be an integer sample rate between {MIN_INPUT_RATE} and {MAX_INPUT_RATE}")
+        # Output channels the client consumes, e.g. ?outputs=text for clients that voice replies themselves
+        outputs = OUTPUT_CHANNELS
+        if "outputs" in request.query:
+            outputs = frozenset(channel.strip() for channel in request.query["outputs"].split(",") if channel.strip())
+            if not outputs or not outputs <= OUTPUT_CHANNELS:
+                raise web.HTTPBadRequest(text=f"outputs must be a comma-separated subset of {', '.join(sorted(OUTPUT_CHANNELS))}")
+        headers = {}
+        if "x-ms-client-request-id" in request.headers:
+            headers["x-ms-client-request-id"] = request.headers["x-ms-client-request-id"]
+        # A reconnecting client takes its parked session back; it already holds an admission slot
+        resumable = self.resumption.get(request.query["resume"]) if "resume" in request.query else None
+        if resumable is not None:
+            try:
+                self.admission.check_rate(self.admission.client_ip(request))
+            except AdmissionRejected as e:
+                raise web.HTTPTooManyRequests(headers={"Retry-After": e.retry_after_header()}, text="Too many connections, retry later")
+            await ws.prepare(request)
+            if not await self._resume_client(resumable, ws, request.query.get("last_event")):
+                # Ended while the old connection was being let go; the client starts a new session
+                await ws.close(code=4001, message=b"session expired")
+            return ws
+        try:
+            ticket = self.admission.request(self.admission.client_ip(request))
+        except AdmissionRejected as e:
+            if e.reason == "rate_limited":
+                raise web.HTTPTooManyRequests(headers={"Retry-After": e.retry_after_header()}, text="Too many connections, retry later")
+            # Browsers cannot read the status of a refused upgrade, so busy clients get the hint in-band
+            await ws.prepare(request)
+            await self._reject_busy(ws, e)
+            return ws
+        if ticket is not None:
+            pending = None
+            try:
+                await ws.prepare(request)
+                pending = await self._wait_for_admission(ws, ticket)
+            finally:
+                if not ticket.admitted.done():
+                    self.admission.leave(ticket)
+                elif pending is None:
+                    # Admitted just as the client went away
+                    self.admission.release()
+            if pending is None:
+                return ws
+            upstream = asyncio.create_task(self._upstream_pool.acquire(headers))
+        else:
+            pending = []
+            # Take an upstream session from the warm pool while the client handshake completes
+            upstream = asyncio.create_task(self._upstream_pool.acquire(headers))
+            try:
+                await ws.prepare(request)
+            except Exception:
+                if upstream.done() and not upstream.cancelled() and upstream.exception() is None:
+                    await upstream.result().ws.close()
+                else:
+                    upstream.cancel()
+                self.admission.release()
+                raise
+        try:
+            target = await upstream
+        except BaseException as e:
+            if isinstance(e, (aiohttp.ClientError, asyncio.TimeoutError)):
+                self.admission.overloaded()
+            self.admission.release()
+            raise
+        # The session gives its admission slot back when it ends, which may be after this client has gone
+        await self._forward_messages(ws, target.ws, input_rate, outputs, pending, target.pending)
         return ws
-    
+
+    async def _reject_busy(self, ws: web.WebSocketResponse, rejection: AdmissionRejected):
+        await ws.send_json({
+            "type": "error",
+            "error": {
+                "type": "server_busy",
+                "code": rejection.reason,
+                "message": "All assistants are busy, please try again shortly",
+                "retry_after": int(rejection.retry_after_header())
+            }
+        })
+        # 1013: try again later
+        await ws.close(code=1013, message=b"server busy")
+
+    async def _wait_for_admission(self, ws: web.WebSocketResponse, ticket: QueueTicket) -> Optional[list[aiohttp.WSMessage]]:
+        """
+        Hold a queued client until a session slot frees up, keeping it informed of its position.
+        Frames it sends meanwhile (e.g. its session.update) are kept for the relay, microphone audio
+        is dropped. Returns None if the client left or was turned away after waiting too long.
+        """
+        pending: list[aiohttp.WSMessage] = []
+        deadline = time.monotonic() + self.admission.queue_timeout
+        position = None
+        receive: Optional[asyncio.Task] = None
+        try:
+            while not ticket.admitted.done():
+                if self.admission.position(ticket) != position:
+                    position = self.admission.position(ticket)
+                    await ws.send_json({"type": "extension.queue_position", "position": position, "queue_length": len(self.admission.queue)})
+                if receive is None:
+                    receive = asyncio.create_task(ws.receive())
+                changed = asyncio.create_task(self.admission.changed.wait())
+                done, _ = await asyncio.wait({ticket.admitted, receive, changed}, timeout=deadline - time.monotonic(),
+                                             return_when=asyncio.FIRST_COMPLETED)
+                changed.cancel()
+                if receive in done:
+                    msg = receive.result()
+                    receive = None
+                    if msg.type in (aiohttp.WSMsgType.CLOSE, aiohttp.WSMsgType.CLOSING, aiohttp.WSMsgType.CLOSED, aiohttp.WSMsgType.ERROR):
+                        return None
+                    if msg.type == aiohttp.WSMsgType.TEXT and frame_type(msg.data) != "input_audio_buffer.append" and len(pending) < 64:
+                        pending.append(msg)
+                elif not done:
+                    self.admission.leave(ticket, timed_out=True)
+                    await self._reject_busy(ws, AdmissionRejected("queue_timeout", self.admission.queue_timeout))
+                    return None
+        finally:
+            if receive is not None:
+                # receive() must have returned before the relay reads the socket again
+                receive.cancel()
+                await asyncio.gather(receive, return_exceptions=True)
+                if not receive.cancelled() and receive.exception() is None and receive.result().type == aiohttp.WSMsgType.TEXT:
+                    pending.append(receive.result())
+        await ws.send_json({"type": "extension.queue_position", "position": 0, "queue_length": len(self.admission.queue)})
+        return pending
+
+    async def _on_startup(self, app):
+        # Nothing here holds up serving: these warm up concurrently and are reported on /readyz
+        if self._token_manager is not None:
+            self.readiness.track("token", self._token_manager.warm_up())
+        self.readiness.track("search", self.rag_helper.start(), required=self.rag_helper.enabled)
+        self.readiness.track("upstream_pool", self._upstream_pool.warm_up(), required=False)
+        # numpy, for clients that stream raw microphone audio
+        self.readiness.track("resampler", preload("resampler"), required=False)
+
+    async def _on_cleanup(self, app):
+        await self.readiness.close()
+        if self._token_manager is not None:
+            await self._token_manager.close()
+        await self._upstream_pool.close()
+        await self.rag_helper.close()
+
     def attach_to_app(self, app, path):
         app.router.add_get(path, self._websocket_handler)
+        app.on_startup.append(self._on_startup)
+        app.on_cleanup.append(self._on_cleanup)
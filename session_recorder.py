@@ -0,0 +1,190 @@
+import asyncio
+import base64
+import json
+import logging
+import os
+import struct
+import time
+import uuid
+from pathlib import Path
+from typing import Any, BinaryIO, Iterable, Iterator, NamedTuple, Optional
+
+logger = logging.getLogger("voicerag")
+
+# File layout: MAGIC, then records of HEADER (direction, kind, seconds since session start, payload
+# length) followed by the payload. Every rotated part starts with MAGIC and a META record.
+MAGIC = b"RTREC\x01"
+HEADER = struct.Struct("<BBdI")
+
+FROM_CLIENT = 0
+FROM_SERVER = 1
+
+KIND_META = 0
+KIND_TEXT = 1
+KIND_BINARY = 2
+# JSON frame whose base64 audio field was moved out: <u32 json length><json><raw audio bytes>
+KIND_TEXT_RAW_AUDIO = 3
+
+# Frame types carrying base64 PCM16, and the field holding it
+AUDIO_FIELDS = {
+    "input_audio_buffer.append": "audio",
+    "response.audio.delta": "delta",
+}
+
+class Record(NamedTuple):
+    direction: int
+    kind: int
+    t: float
+    data: Any
+
+def _pack_frame(direction: int, t: float, data: str | bytes, raw_audio: bool) -> bytes:
+    if isinstance(data, bytes):
+        return HEADER.pack(direction, KIND_BINARY, t, len(data)) + data
+    if raw_audio:
+        message = json.loads(data)
+        field = AUDIO_FIELDS.get(message.get("type"))
+        if field is not None and isinstance(message.get(field), str):
+            audio = base64.b64decode(message.pop(field))
+            header = json.dumps({"field": field, "message": message}, separators=(",", ":")).encode()
+            payload = struct.pack("<I", len(header)) + header + audio
+            return HEADER.pack(direction, KIND_TEXT_RAW_AUDIO, t, len(payload)) + payload
+    payload = data.encode()
+    return HEADER.pack(direction, KIND_TEXT, t, len(payload)) + payload
+
+def _unpack_payload(kind: int, payload: bytes) -> Any:
+    if kind == KIND_BINARY:
+        return payload
+    if kind == KIND_TEXT_RAW_AUDIO:
+        (header_len,) = struct.unpack_from("<I", payload)
+        header = json.loads(payload[4:4 + header_len])
+        message = header["message"]
+        message[header["field"]] = base64.b64encode(payload[4 + header_len:]).decode("ascii")
+        return json.dumps(message)
+    if kind == KIND_META:
+        return json.loads(payload)
+    return payload.decode()
+
+def read_records(paths: Iterable[str | Path]) -> Iterator[Record]:
+    """
+    Yield the records of a recording, given its parts in order. Text frames come back as the JSON
+    string the relay saw (audio re-encoded as base64 if it was stored raw), binary frames as bytes
+    and META records as dicts.
+    """
+    for path in paths:
+        with open(path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{path} is not a session recording")
+            while header := f.read(HEADER.size):
+                if len(header) < HEADER.size:
+                    logger.warning("Truncated record at the end of %s", path)
+                    break
+                direction, kind, t, length = HEADER.unpack(header)
+                payload = f.read(length)
+                if len(payload) < length:
+                    logger.warning("Truncated record at the end of %s", path)
+                    break
+                yield Record(direction, kind, t, _unpack_payload(kind, payload))
+
+class SessionRecording:
+    """
+    Recording of one relayed session. `record` only timestamps and buffers the frame on the event
+    loop; packing, base64 decoding of audio and file writes happen in batches on a worker thread.
+    """
+    def __init__(self, directory: Path, session_id: str, meta: dict[str, Any], max_bytes: int, raw_audio: bool, flush_interval: float):
+        self.directory = directory
+        self.session_id = session_id
+        self.meta = meta
+        self.max_bytes = max_bytes
+        self.raw_audio = raw_audio
+        self.flush_interval = flush_interval
+        self.bytes_written = 0
+        self._start = time.monotonic()
+        self._pending: list[tuple[int, float, str | bytes]] = []
+        self._file: Optional[BinaryIO] = None
+        self._file_bytes = 0
+        self._head_bytes = 0
+        self._part = 0
+        # The batch being written on the worker thread; cancelling the flusher does not stop it
+        self._writing: Optional[asyncio.Task] = None
+        self._flusher = asyncio.create_task(self._run())
+
+    def record(self, direction: int, data: str | bytes):
+        self._pending.append((direction, time.monotonic() - self._start, data))
+
+    def _open_part(self):
+        if self._file is not None:
+            self._file.close()
+            self._part += 1
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self.directory / f"{self.session_id}-{self._part:03d}.rtrec"
+        self._file = open(path, "wb")
+        meta = json.dumps(self.meta).encode()
+        head = MAGIC + HEADER.pack(FROM_SERVER, KIND_META, 0.0, len(meta)) + meta
+        self._file.write(head)
+        self._file_bytes = self._head_bytes = len(head)
+
+    def _write_batch(self, batch: list[tuple[int, float, str | bytes]]):
+        if self._file is None:
+            self._open_part()
+        for direction, t, data in batch:
+            record = _pack_frame(direction, t, data, self.raw_audio)
+            if self._file_bytes + len(record) > self.max_bytes and self._file_bytes > self._head_bytes:
+                self._open_part()
+            self._file.write(record)
+            self._file_bytes += len(record)
+            self.bytes_written += len(record)
+        self._file.flush()
+
+    async def _flush(self):
+        if self._pending:
+            batch, self._pending = self._pending, []
+            self._writing = asyncio.create_task(asyncio.to_thread(self._write_batch, batch))
+            await asyncio.shield(self._writing)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self._flush()
+            except OSError as e:
+                logger.warning("Session recording %s stopped: %s", self.session_id, e)
+                return
+
+    async def close(self):
+        self._flusher.cancel()
+        await asyncio.gather(self._flusher, return_exceptions=True)
+        # File I/O stays serialized: the final batch and the close wait for the write in flight
+        if self._writing is not None:
+            await asyncio.gather(self._writing, return_exceptions=True)
+        try:
+            await self._flush()
+        except OSError as e:
+            logger.warning("Failed to flush session recording %s: %s", self.session_id, e)
+        if self._file is not None:
+            await asyncio.to_thread(self._file.close)
+            self._file = None
+
+class SessionRecorder:
+    """
+    Opt-in recorder for relayed sessions (set RECORD_SESSIONS_DIR). Each session is written to
+    `<session id>-<part>.rtrec` files that rotate at RECORD_MAX_BYTES; with RECORD_RAW_AUDIO=true
+    base64 audio payloads are stored as raw bytes, which makes recordings about 25% smaller.
+    """
+    def __init__(self, directory: Optional[str] = None, max_bytes: Optional[int] = None,
+                 raw_audio: Optional[bool] = None, flush_interval: float = 0.25):
+        directory = directory if directory is not None else os.environ.get("RECORD_SESSIONS_DIR")
+        self.directory = Path(directory) if directory else None
+        self.max_bytes = max_bytes if max_bytes is not None else int(os.environ.get("RECORD_MAX_BYTES", str(64 * 1024 * 1024)))
+        self.raw_audio = raw_audio if raw_audio is not None else os.environ.get("RECORD_RAW_AUDIO", "false").lower() == "true"
+        self.flush_interval = flush_interval
+
+    @property
+    def enabled(self) -> bool:
+        return self.directory is not None
+
+    def start_session(self, meta: dict[str, Any]) -> Optional[SessionRecording]:
+        if self.directory is None:
+            return None
+        session_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        meta = dict(meta, session_id=session_id, started_at=time.time())
+        return SessionRecording(self.directory, session_id, meta, self.max_bytes, self.raw_audio, self.flush_interval)
@@ -0,0 +1,101 @@
+import asyncio
+import os
+import secrets
+from collections import deque
+from typing import Any, Callable, Optional
+
+class FrameRing:
+    """
+    Bounded, numbered history of the frames sent to a client, so the frames a dropped client missed
+    can be replayed when it reconnects. The oldest frames are evicted first.
+    """
+    def __init__(self, max_frames: int, max_bytes: int):
+        self.max_frames = max_frames
+        self.max_bytes = max_bytes
+        self.next_seq = 0
+        self._frames: deque[tuple[int, str]] = deque()
+        self._bytes = 0
+
+    def append(self, data: str):
+        self._frames.append((self.next_seq, data))
+        self.next_seq += 1
+        self._bytes += len(data)
+        while len(self._frames) > self.max_frames or self._bytes > self.max_bytes:
+            self._bytes -= len(self._frames.popleft()[1])
+
+    def seq_after(self, event_id: str) -> Optional[int]:
+        """
+        Sequence number following the frame carrying `event_id`, or None if it is no longer buffered.
+        """
+        # Event ids are unique, so the quoted id identifies the frame whatever its JSON spacing
+        needle = f'"{event_id}"'
+        for seq, data in reversed(self._frames):
+            if needle in data:
+                return seq + 1
+        return None
+
+    def since(self, seq: int) -> tuple[list[str], int]:
+        """
+        Buffered frames from `seq` on, and how many frames after `seq` were already evicted.
+        """
+        first = self._frames[0][0] if self._frames else self.next_seq
+        return [data for s, data in self._frames if s >= seq], max(0, first - seq)
+
+class SessionResumption:
+    """
+    Sessions a client can re-attach to after its WebSocket drops. A session is announced to the
+    client with a resume token; when the client goes away without closing the socket, the upstream
+    realtime session is parked for RESUME_GRACE_SECONDS (0 disables resumption) while the frames it
+    produces are buffered, and a client reconnecting with ?resume=<token> gets them replayed.
+    Dead connections are detected by WebSocket pings every RESUME_HEARTBEAT seconds.
+    """
+    def __init__(self, grace: Optional[float] = None, buffer_frames: Optional[int] = None,
+                 buffer_bytes: Optional[int] = None, heartbeat: Optional[float] = None):
+        self.grace = grace if grace is not None else float(os.environ.get("RESUME_GRACE_SECONDS", "30"))
+        self.buffer_frames = buffer_frames if buffer_frames is not None else int(os.environ.get("RESUME_BUFFER_FRAMES", "512"))
+        self.buffer_bytes = buffer_bytes if buffer_bytes is not None else int(os.environ.get("RESUME_BUFFER_BYTES", str(256 * 1024)))
+        self.heartbeat = heartbeat if heartbeat is not None else float(os.environ.get("RESUME_HEARTBEAT", "10"))
+        self._sessions: dict[str, Any] = {}
+        self._parked: dict[str, asyncio.TimerHandle] = {}
+        self.counts = {"parked": 0, "resumed": 0, "expired": 0, "replayed_frames": 0, "missed_frames": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.grace > 0
+
+    def register(self, session: Any) -> str:
+        token = secrets.token_urlsafe(18)
+        self._sessions[token] = session
+        return token
+
+    def unregister(self, token: str):
+        self._sessions.pop(token, None)
+        handle = self._parked.pop(token, None)
+        if handle is not None:
+            handle.cancel()
+
+    def get(self, token: str) -> Optional[Any]:
+        return self._sessions.get(token)
+
+    def park(self, token: str, on_expire: Callable[[], None]):
+        """
+        Keep the session for the grace period; `on_expire` ends it if no client has come back by then.
+        """
+        def expire():
+            if self._parked.pop(token, None) is not None:
+                self.counts["expired"] += 1
+                on_expire()
+
+        self.counts["parked"] += 1
+        self._parked[token] = asyncio.get_running_loop().call_later(self.grace, expire)
+
+    def unpark(self, token: str) -> bool:
+        handle = self._parked.pop(token, None)
+        if handle is None:
+            return False
+        handle.cancel()
+        self.counts["resumed"] += 1
+        return True
+
+    def stats(self) -> dict[str, int]:
+        return {"resumable": len(self._sessions), "parked": len(self._parked)}
@@ -0,0 +1,124 @@
+import copy
+import gzip
+import hashlib
+import mimetypes
+import re
+from pathlib import Path
+from typing import Iterable, Optional
+
+from aiohttp import web
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, gzip is always available
+    brotli = None
+
+# Content types worth compressing; images are already compressed
+COMPRESSIBLE = re.compile(r"^(text/|application/(javascript|json|xml)|image/svg\+xml)")
+# Relative references to local assets in HTML, e.g. src="./js/chat.js?ver=2"
+ASSET_REFERENCE = re.compile(r"""(?P<attr>(?:src|href)=["'])(?:\./|/)?(?P<path>(?:css|js|image)/[^"'?#]+)(?:\?[^"'#]*)?(?=["'])""")
+
+# One entity tag of an If-None-Match list; W/ (weak) tags match too, as conditional GETs compare weakly
+ENTITY_TAG = re.compile(r'(?:W/)?"([^"]*)"')
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+
+class Asset:
+    """
+    One in-memory response body with its precompressed variants and a content-hash ETag.
+    """
+    def __init__(self, body: bytes, content_type: str, cache_control: str):
+        self.content_type = content_type
+        self.cache_control = cache_control
+        self.digest = hashlib.sha256(body).hexdigest()[:16]
+        self.variants = {"identity": body}
+        if COMPRESSIBLE.match(content_type) and len(body) > 256:
+            compressed = gzip.compress(body, compresslevel=9, mtime=0)
+            if len(compressed) < len(body):
+                self.variants["gzip"] = compressed
+            if brotli is not None:
+                compressed = brotli.compress(body, quality=11)
+                if len(compressed) < len(body):
+                    self.variants["br"] = compressed
+        # The ETags handed out for this content, one per variant
+        self.etags = frozenset(self.digest if encoding == "identity" else f"{self.digest}-{encoding}" for encoding in self.variants)
+
+    def with_cache_control(self, cache_control: str) -> "Asset":
+        # Shares the body and compressed variants
+        clone = copy.copy(self)
+        clone.cache_control = cache_control
+        return clone
+
+    def _encoding(self, accept_encoding: str) -> str:
+        accepted = {part.split(";")[0].strip() for part in accept_encoding.lower().split(",")}
+        for encoding in ("br", "gzip"):
+            if encoding in accepted and encoding in self.variants:
+                return encoding
+        return "identity"
+
+    def matches(self, if_none_match: str) -> bool:
+        # Any variant of the same content satisfies a conditional request
+        if if_none_match.strip() == "*":
+            return True
+        return not self.etags.isdisjoint(ENTITY_TAG.findall(if_none_match))
+
+    def respond(self, request: web.Request) -> web.Response:
+        encoding = self._encoding(request.headers.get("Accept-Encoding", ""))
+        etag = f'"{self.digest}"' if encoding == "identity" else f'"{self.digest}-{encoding}"'
+        headers = {"ETag": etag, "Cache-Control": self.cache_control, "Vary": "Accept-Encoding", "Content-Type": self.content_type}
+        if self.matches(request.headers.get("If-None-Match", "")):
+            return web.Response(status=304, headers=headers)
+        if encoding != "identity":
+            headers["Content-Encoding"] = encoding
+        return web.Response(body=self.variants[encoding], headers=headers)
+
+class StaticAssets:
+    """
+    Serves the frontend from memory. Every file is loaded and precompressed (gzip, plus brotli when
+    the package is installed) once at startup and also published under a content-fingerprinted name,
+    e.g. /js/chat.3f2a9c1d0e4b5a67.js, that is cached as immutable; HTML references are rewritten
+    to those names. Unfingerprinted URLs still work and revalidate with their ETag.
+    """
+    def __init__(self, root: Path, directories: Iterable[str] = ("css", "js", "image")):
+        self.root = root
+        self.directories = tuple(directories)
+        self.assets: dict[str, Asset] = {}
+        self.fingerprinted: dict[str, str] = {}
+
+    def add(self, path: str, body: bytes, content_type: str, cache_control: str = REVALIDATE) -> Asset:
+        self.assets[path] = Asset(body, content_type, cache_control)
+        return self.assets[path]
+
+    def load(self):
+        """
+        Read, fingerprint and precompress every asset. Blocking; run it before serving or in a thread.
+        """
+        for directory in self.directories:
+            for file in sorted((self.root / directory).rglob("*")):
+                if not file.is_file():
+                    continue
+                path = "/" + file.relative_to(self.root).as_posix()
+                content_type = mimetypes.guess_type(file.name)[0] or "application/octet-stream"
+                if content_type.startswith("text/") or content_type in ("application/javascript", "application/json"):
+                    content_type += "; charset=utf-8"
+                asset = self.add(path, file.read_bytes(), content_type)
+                stem, dot, suffix = path.rpartition(".")
+                fingerprinted = f"{stem}.{asset.digest}.{suffix}" if dot else f"{path}.{asset.digest}"
+                self.assets[fingerprinted] = asset.with_cache_control(IMMUTABLE)
+                self.fingerprinted[path] = fingerprinted
+
+    def rewrite_html(self, html: str) -> str:
+        def replace(match: re.Match) -> str:
+            fingerprinted = self.fingerprinted.get("/" + match.group("path"))
+            return match.group("attr") + fingerprinted if fingerprinted else match.group(0)
+        return ASSET_REFERENCE.sub(replace, html)
+
+    def add_page(self, path: str, file: Path) -> Asset:
+        return self.add(path, self.rewrite_html(file.read_text(encoding="utf-8")).encode("utf-8"), "text/html; charset=utf-8")
+
+    async def handle(self, request: web.Request) -> web.Response:
+        asset: Optional[Asset] = self.assets.get(request.path)
+        if asset is None:
+            raise web.HTTPNotFound()
+        return asset.respond(request)
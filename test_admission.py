@@ -0,0 +1,128 @@
+import asyncio
+
+import pytest
+
+from admission import AdmissionController, AdmissionRejected
+
+def _controller(**overrides) -> AdmissionController:
+    options = dict(max_sessions=2, queue_size=3, queue_per_ip=2, queue_timeout=30, ip_rate=0, ip_burst=20,
+                   latency_target=3.0, shed_window=10, trust_forwarded=False)
+    options.update(overrides)
+    return AdmissionController(**options)
+
+def test_admits_up_to_limit_then_queues_in_order():
+    async def run():
+        admission = _controller()
+        assert admission.request("10.0.0.1") is None
+        assert admission.request("10.0.0.2") is None
+        first = admission.request("10.0.0.3")
+        second = admission.request("10.0.0.4")
+        assert (admission.position(first), admission.position(second)) == (1, 2)
+
+        admission.release()
+        assert await asyncio.wait_for(first.admitted, 1)
+        assert not second.admitted.done()
+        assert admission.position(second) == 1
+        return admission
+
+    admission = asyncio.run(run())
+    assert admission.active == 2
+    assert admission.counts["admitted"] == 2
+    assert admission.counts["admitted_after_queue"] == 1
+
+def test_new_client_does_not_jump_the_queue():
+    async def run():
+        admission = _controller(max_sessions=1)
+        admission.request("10.0.0.1")
+        waiting = admission.request("10.0.0.2")
+        admission.active -= 1  # a slot freed without release() handing it over
+        return waiting, admission.request("10.0.0.3")
+
+    waiting, late = asyncio.run(run())
+    assert waiting is not None and late is not None
+
+def test_queue_full_and_per_ip_limit():
+    async def run():
+        admission = _controller(max_sessions=1, queue_size=3, queue_per_ip=2)
+        admission.request("10.0.0.1")
+        admission.request("10.0.0.9")
+        admission.request("10.0.0.9")
+        with pytest.raises(AdmissionRejected) as per_ip:
+            admission.request("10.0.0.9")
+        admission.request("10.0.0.8")
+        with pytest.raises(AdmissionRejected) as full:
+            admission.request("10.0.0.7")
+        return admission, per_ip.value, full.value
+
+    admission, per_ip, full = asyncio.run(run())
+    assert per_ip.reason == full.reason == "queue_full"
+    assert full.retry_after_header() == "30"
+    assert admission.counts["rejected_queue_full"] == 2
+
+def test_leaving_the_queue_is_counted():
+    async def run():
+        admission = _controller(max_sessions=1)
+        admission.request("10.0.0.1")
+        gone = admission.request("10.0.0.2")
+        late = admission.request("10.0.0.3")
+        admission.leave(gone)
+        admission.leave(late, timed_out=True)
+        admission.leave(late, timed_out=True)
+        return admission
+
+    admission = asyncio.run(run())
+    assert len(admission.queue) == 0
+    assert admission.counts["abandoned"] == 1
+    assert admission.counts["rejected_queue_timeout"] == 1
+
+def test_overload_sheds_instead_of_queueing():
+    async def run():
+        admission = _controller(max_sessions=10)
+        admission.overloaded()
+        assert admission.limit == 7
+        for _ in range(7):
+            assert admission.request("10.0.0.1") is None
+        with pytest.raises(AdmissionRejected) as shed:
+            admission.request("10.0.0.2")
+        return admission, shed.value
+
+    admission, shed = asyncio.run(run())
+    assert shed.reason == "shed"
+    assert 9 < shed.retry_after <= 10
+    assert not admission.queue
+    assert admission.counts["rejected_shed"] == 1
+
+def test_overload_signals_within_cooldown_cut_once():
+    admission = _controller(max_sessions=10)
+    admission.overloaded()
+    admission.overloaded()
+    admission.observe_latency(5.0)
+    assert admission.limit == 7
+
+def test_limit_grows_back_once_no_longer_shedding():
+    async def run():
+        admission = _controller(max_sessions=4, shed_window=0)
+        admission.overloaded()
+        assert admission.limit == pytest.approx(2.8)
+        for _ in range(2):
+            admission.request("10.0.0.1")
+        waiting = admission.request("10.0.0.2")
+        admission.observe_latency(0.5)
+        admission.observe_latency(0.5)
+        assert await asyncio.wait_for(waiting.admitted, 1)
+        for _ in range(10):
+            admission.observe_latency(0.5)
+        return admission
+
+    assert asyncio.run(run()).limit == 4
+
+def test_rate_limit_per_address():
+    admission = _controller(ip_rate=60, ip_burst=2)
+    admission.check_rate("10.0.0.1")
+    admission.check_rate("10.0.0.1")
+    with pytest.raises(AdmissionRejected) as limited:
+        admission.check_rate("10.0.0.1")
+    admission.check_rate("10.0.0.2")
+    assert limited.value.reason == "rate_limited"
+    assert 0 < limited.value.retry_after <= 1
+    assert admission.counts["rejected_rate_limited"] == 1
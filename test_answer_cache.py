@@ -0,0 +1,80 @@
+from answer_cache import AnswerCache, is_self_contained
+
+DIGEST = "prompt-a"
+
+def _cache(**overrides) -> AnswerCache:
+    options = dict(ttl=3600, max_entries=16, min_terms=2)
+    options.update(overrides)
+    return AnswerCache(**options)
+
+def _answer(cache: AnswerCache, question: str):
+    entry = cache.lookup(DIGEST, question)
+    return entry.text if entry is not None else None
+
+def test_same_content_words_hit_in_any_order():
+    cache = _cache()
+    cache.store(DIGEST, "Where is the networking event?", "In hall B.", output_tokens=12)
+    assert _answer(cache, "where is the networking event") == "In hall B."
+    assert _answer(cache, "The networking event, where is it held?") is None
+    assert _answer(cache, "Networking events: where?") == "In hall B."
+    assert cache.counts["hits"] == 2
+    assert cache.tokens_saved == 24
+
+def test_different_question_about_same_subject_misses():
+    cache = _cache()
+    cache.store(DIGEST, "Where is the networking event?", "In hall B.")
+    assert _answer(cache, "What time is the networking event?") is None
+
+def test_negation_misses():
+    cache = _cache()
+    cache.store(DIGEST, "How do I reset my password?", "Use the reset link.")
+    assert _answer(cache, "how do I not reset my password") is None
+
+def test_added_or_dropped_qualifier_misses():
+    cache = _cache()
+    cache.store(DIGEST, "How do I reset my password?", "Use the reset link.")
+    assert _answer(cache, "How do I reset my password on mac?") is None
+    cache.store(DIGEST, "How do I reset my password on mac?", "Open System Settings.")
+    assert _answer(cache, "How do I reset my password on mac?") == "Open System Settings."
+    assert _answer(cache, "How do I reset my password?") == "Use the reset link."
+
+def test_context_dependent_questions_are_neither_learned_nor_served():
+    cache = _cache()
+    assert not is_self_contained("When does his talk start?")
+    cache.store(DIGEST, "When does his talk start?", "At 10am.")
+    assert cache.counts["context_dependent"] == 1
+    assert cache.stats()["entries"] == 0
+    cache.store(DIGEST, "When does the keynote talk start?", "At 9am.")
+    assert _answer(cache, "When does the keynote talk start?") == "At 9am."
+    assert _answer(cache, "When does that keynote talk start?") is None
+
+def test_short_questions_are_not_cached():
+    cache = _cache(min_terms=3)
+    cache.store(DIGEST, "Where is it held?", "In hall B.")
+    cache.store(DIGEST, "Parking?", "Level 2.")
+    assert cache.stats()["entries"] == 0
+
+def test_new_instructions_invalidate_answers():
+    cache = _cache()
+    cache.store(DIGEST, "Where is the networking event?", "In hall B.")
+    assert cache.lookup("prompt-b", "Where is the networking event?") is None
+    cache.store("prompt-b", "What time is the networking event?", "At 6pm.")
+    assert cache.counts["invalidated"] == 1
+    assert cache.lookup(DIGEST, "What time is the networking event?") is None
+    assert cache.lookup("prompt-b", "Where is the networking event?") is None
+
+def test_expired_answers_are_dropped():
+    cache = _cache(ttl=-1)
+    cache.store(DIGEST, "Where is the networking event?", "In hall B.")
+    assert _answer(cache, "Where is the networking event?") is None
+    assert cache.counts["expired"] == 1
+
+def test_least_recently_used_answer_is_evicted():
+    cache = _cache(max_entries=2)
+    cache.store(DIGEST, "Where is the networking event?", "In hall B.")
+    cache.store(DIGEST, "What time is the networking event?", "At 6pm.")
+    _answer(cache, "Where is the networking event?")
+    cache.store(DIGEST, "Where is the keynote talk?", "Main stage.")
+    assert cache.counts["evicted"] == 1
+    assert _answer(cache, "What time is the networking event?") is None
+    assert _answer(cache, "Where is the networking event?") == "In hall B."
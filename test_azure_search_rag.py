@@ -1,5 +1,94 @@
+import asyncio
 import os
-from azure_search_rag import AzureCognitiveSearchRAG
+
+import pytest
+
+from azure_search_rag import AzureCognitiveSearchRAG, reciprocal_rank_fusion
+from local_index import build_index
+
+def _docs(*contents):
+    return [{"content": content, "source": "replica"} for content in contents]
+
+def test_reciprocal_rank_fusion_favours_documents_ranked_well_everywhere():
+    fused = reciprocal_rank_fusion([_docs("a", "b", "c"), _docs("b", "c", "d"), _docs("c", "b")], top=4)
+    assert [doc["content"] for doc in fused] == ["b", "c", "a", "d"]
+
+def test_reciprocal_rank_fusion_merges_copies_and_keeps_first():
+    first = {"content": "a", "source": "primary"}
+    fused = reciprocal_rank_fusion([[first], [{"content": "a", "source": "secondary"}]], top=3)
+    assert fused == [first]
+
+def test_reciprocal_rank_fusion_limits_to_top():
+    fused = reciprocal_rank_fusion([_docs("a", "b", "c"), _docs("a", "c")], top=2)
+    assert [doc["content"] for doc in fused] == ["a", "c"]
+
+def test_reciprocal_rank_fusion_of_nothing():
+    assert reciprocal_rank_fusion([], top=3) == []
+    assert reciprocal_rank_fusion([[], []], top=3) == []
+
+LOCAL_DOCS = [
+    {"content": "The opening keynote starts at 9am on the main stage."},
+    {"content": "Visitor parking is on level 2 of the north garage."},
+]
+
+def _rag(monkeypatch, tmp_path, mode, azure=None):
+    """
+    A search helper over a local index in `mode`; `azure` stands in for the Azure Search fan-out
+    (documents to return, an exception to raise, or None for Azure Search not configured).
+    """
+    build_index(LOCAL_DOCS, str(tmp_path))
+    monkeypatch.setenv("LOCAL_INDEX_DIR", str(tmp_path))
+    monkeypatch.setenv("LOCAL_INDEX_MODE", mode)
+    for name in ("AZURE_SEARCH_ENDPOINT", "AZURE_SEARCH_INDEX", "AZURE_SEARCH_API_KEY"):
+        if azure is None:
+            monkeypatch.delenv(name, raising=False)
+        else:
+            monkeypatch.setenv(name, "https://search.example" if name == "AZURE_SEARCH_ENDPOINT" else "x")
+    rag = AzureCognitiveSearchRAG()
+    calls = []
+
+    async def fan_out(query, top):
+        calls.append(query)
+        if isinstance(azure, Exception):
+            raise azure
+        return azure
+    rag._fan_out = fan_out
+    return rag, calls
+
+def _search(rag, query):
+    return [doc["content"] for doc in asyncio.run(rag.retrieve_documents_async(query, top=1))]
+
+def test_first_mode_answers_confident_queries_locally(monkeypatch, tmp_path):
+    rag, calls = _rag(monkeypatch, tmp_path, "first", azure=[{"content": "from Azure Search"}])
+    assert rag.local_index is None
+    assert _search(rag, "where is the keynote stage") == [LOCAL_DOCS[0]["content"]]
+    assert _search(rag, "who is speaking about robotics") == ["from Azure Search"]
+    assert calls == ["who is speaking about robotics"]
+    assert rag.local_stats == {"answered": 1, "fell_through": 1, "fallback": 0}
+
+def test_fallback_mode_uses_local_index_only_when_azure_fails(monkeypatch, tmp_path):
+    rag, calls = _rag(monkeypatch, tmp_path, "fallback", azure=RuntimeError("search unavailable"))
+    assert _search(rag, "where is the keynote stage") == [LOCAL_DOCS[0]["content"]]
+    assert calls == ["where is the keynote stage"]
+    assert rag.local_stats["fallback"] == 1
+    rag, calls = _rag(monkeypatch, tmp_path, "fallback", azure=[{"content": "from Azure Search"}])
+    assert _search(rag, "where is the keynote stage") == ["from Azure Search"]
+
+def test_only_mode_never_calls_azure(monkeypatch, tmp_path):
+    rag, calls = _rag(monkeypatch, tmp_path, "only", azure=[{"content": "from Azure Search"}])
+    assert _search(rag, "who is speaking about robotics") == []
+    assert _search(rag, "parking") == [LOCAL_DOCS[1]["content"]]
+    assert calls == []
+
+def test_local_index_without_azure_search(monkeypatch, tmp_path):
+    rag, _ = _rag(monkeypatch, tmp_path, "first")
+    assert rag.enabled
+    assert rag.retrieve_documents("parking garage", top=1)[0]["content"] == LOCAL_DOCS[1]["content"]
+
+def test_invalid_local_index_mode_is_rejected(monkeypatch):
+    monkeypatch.setenv("LOCAL_INDEX_MODE", "sometimes")
+    with pytest.raises(ValueError, match="LOCAL_INDEX_MODE"):
+        AzureCognitiveSearchRAG()
 
 if __name__ == "__main__":
     # Ensure environment variables are loaded (if using dotenv in dev)
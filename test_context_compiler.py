@@ -0,0 +1,41 @@
+from context_compiler import ContextCompiler, estimate_tokens, format_documents
+
+KEYNOTE = ("The opening keynote starts at 9am on the main stage. Coffee is served in the foyer from 8am. "
+           "Badges can be collected at the registration desk.")
+PARKING = "Visitor parking is available on level 2 of the north garage. The garage closes at midnight."
+
+def test_output_stays_under_token_budget():
+    docs = [{"content": " ".join(f"Sentence {i} about the conference schedule and venue." for i in range(60))}]
+    for budget in (20, 50, 120):
+        context = ContextCompiler(token_budget=budget).compile("conference schedule", docs)
+        assert context.tokens <= budget
+        assert context.text
+    assert context.tokens_saved > 0
+    assert context.original_tokens == estimate_tokens(format_documents(docs))
+
+def test_near_duplicate_passages_are_dropped():
+    docs = [{"content": KEYNOTE}, {"content": KEYNOTE.replace("9am", "9 am")}, {"content": PARKING}]
+    context = ContextCompiler(token_budget=400).compile("keynote", docs)
+    assert context.text.count("opening keynote") == 1
+    assert "[Source 2] Visitor parking" in context.text
+    assert "[Source 3]" not in context.text
+
+def test_duplicate_sentences_across_documents_are_dropped():
+    docs = [{"content": KEYNOTE}, {"content": "Registration opens Monday. " + KEYNOTE.split(". ")[0] + "."}]
+    context = ContextCompiler(token_budget=400).compile("keynote", docs)
+    assert context.text.count("opening keynote starts") == 1
+    assert "Registration opens Monday." in context.text
+
+def test_top_scoring_sentences_are_kept_in_document_order():
+    budget = estimate_tokens("The garage closes at midnight.") + estimate_tokens("Visitor parking is available on level 2 of the north garage.") + 4
+    context = ContextCompiler(token_budget=budget).compile("when does the parking garage close", [{"content": KEYNOTE}, {"content": PARKING}])
+    assert context.text == "[Source 1] Visitor parking is available on level 2 of the north garage. The garage closes at midnight."
+
+def test_matching_metadata_fills_leftover_budget():
+    docs = [{"content": PARKING, "locations": ["North garage", "Hall B"], "people": ["Ada Lovelace"]}]
+    context = ContextCompiler(token_budget=400).compile("where is hall B", docs)
+    assert "  Locations: Hall B" in context.text
+    assert "Ada Lovelace" not in context.text
+    # Not kept when the budget is already spent on sentences
+    tight = ContextCompiler(token_budget=estimate_tokens(PARKING) + 4).compile("where is hall B", docs)
+    assert "Locations" not in tight.text
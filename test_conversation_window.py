@@ -0,0 +1,80 @@
+from conversation_window import ConversationWindow, SUMMARY_ITEM_PREFIX
+
+def _message(item_id: str, role: str, text: str) -> dict:
+    content_type = "input_audio" if role == "user" else "audio"
+    return {"id": item_id, "type": "message", "role": role, "content": [{"type": content_type, "transcript": text}]}
+
+def _turns(window: ConversationWindow, count: int, words: int = 5):
+    for i in range(count):
+        window.item_created(_message(f"u{i}", "user", f"question {i} " + "word " * words))
+        window.item_created(_message(f"a{i}", "assistant", f"answer {i} " + "word " * words))
+
+def _deleted(events: list[dict]) -> list[str]:
+    return [e["item_id"] for e in events if e["type"] == "conversation.item.delete"]
+
+def test_within_budget_nothing_is_trimmed():
+    window = ConversationWindow(max_tokens=10000, max_turns=12, keep_turns=4, summary_tokens=200)
+    _turns(window, 5)
+    assert window.on_response_done() == []
+    assert window.turns() == 5
+
+def test_turn_limit_trims_all_but_kept_turns_into_summary():
+    window = ConversationWindow(max_tokens=10000, max_turns=3, keep_turns=2, summary_tokens=200)
+    _turns(window, 5)
+    events = window.on_response_done()
+    assert _deleted(events) == ["u0", "a0", "u1", "a1", "u2", "a2"]
+    create = events[-1]
+    assert create["type"] == "conversation.item.create"
+    assert create["previous_item_id"] == "root"
+    assert create["item"]["id"].startswith(SUMMARY_ITEM_PREFIX)
+    assert len(create["item"]["id"]) <= 32
+    summary = create["item"]["content"][0]["text"]
+    assert "- Visitor: question 0" in summary
+    assert "- Assistant: answer 2" in summary
+    assert "question 3" not in summary
+
+def test_token_budget_triggers_trim():
+    window = ConversationWindow(max_tokens=50, max_turns=100, keep_turns=1, summary_tokens=200)
+    _turns(window, 3, words=10)
+    assert window.tokens() > 50
+    assert _deleted(window.on_response_done()) == ["u0", "a0", "u1", "a1"]
+    assert window.tokens_trimmed > 0
+
+def test_pending_deletions_are_not_requested_twice():
+    window = ConversationWindow(max_tokens=10000, max_turns=3, keep_turns=2, summary_tokens=200)
+    _turns(window, 4)
+    first = _deleted(window.on_response_done())
+    # The deletions have not been confirmed yet, so the next turn only adds its own overflow
+    window.item_created(_message("u4", "user", "question 4"))
+    second = _deleted(window.on_response_done())
+    assert set(first).isdisjoint(second)
+    assert all(window.item_deleted(item_id) for item_id in first)
+    assert not window.item_deleted("unknown")
+
+def test_summary_is_replaced_and_kept_within_budget():
+    window = ConversationWindow(max_tokens=10000, max_turns=2, keep_turns=1, summary_tokens=30)
+    _turns(window, 3)
+    events = window.on_response_done()
+    first_summary = events[-1]["item"]
+    window.item_created(first_summary)
+    for item_id in _deleted(events):
+        window.item_deleted(item_id)
+    window.item_created(_message("u3", "user", "question 3"))
+    window.item_created(_message("a3", "assistant", "answer 3"))
+    window.item_created(_message("u4", "user", "question 4"))
+    events = window.on_response_done()
+    assert first_summary["id"] in _deleted(events)
+    assert events[-1]["item"]["id"] != first_summary["id"]
+    summary = events[-1]["item"]["content"][0]["text"]
+    assert "question 0" not in summary
+    assert "answer 3" in summary
+
+def test_context_blocks_are_dropped_after_the_turn():
+    window = ConversationWindow(max_tokens=10000, max_turns=12, keep_turns=4, summary_tokens=200)
+    context_id = window.new_context_id()
+    window.item_created({"id": context_id, "type": "message", "role": "system",
+                         "content": [{"type": "input_text", "text": "Knowledge: hall B"}]})
+    _turns(window, 1)
+    assert _deleted(window.on_response_done()) == [context_id]
+    assert window.item_deleted(context_id)
+    assert window.stats()["items"] == 2
@@ -0,0 +1,55 @@
+import json
+
+import pytest
+
+from local_index import LocalIndex, build_index, load_documents
+
+DOCS = [
+    {"content": "The opening keynote by Grace Hopper starts at 9am on the main stage.", "people": ["Grace Hopper"]},
+    {"content": "Visitor parking is on level 2 of the north garage.", "locations": ["North garage"]},
+    {"content": "Lunch is served in hall B from noon.", "keyphrases": ["lunch"]},
+]
+
+@pytest.fixture
+def index_dir(tmp_path):
+    source = tmp_path / "docs.jsonl"
+    source.write_text("\n".join(json.dumps(doc) for doc in DOCS) + "\n")
+    build_index(load_documents(str(source)), str(tmp_path / "index"), dense_dim=256)
+    return tmp_path / "index"
+
+def test_build_then_search_round_trip(index_dir):
+    index = LocalIndex(str(index_dir))
+    assert index.documents == 3
+    (doc, score, coverage), = index.search("where is the parking garage", top=1)
+    assert doc["content"] == DOCS[1]["content"]
+    assert doc["locations"] == ["North garage"]
+    assert doc["people"] == []
+    assert score > 0
+    assert coverage == pytest.approx(2 / 3)
+
+def test_metadata_is_searchable(index_dir):
+    results = LocalIndex(str(index_dir)).search("grace hopper", top=3)
+    assert results[0][0]["content"] == DOCS[0]["content"]
+    assert results[0][2] == 1.0
+
+def test_misspelled_term_is_found_by_dense_vectors(index_dir):
+    results = LocalIndex(str(index_dir)).search("grase hoper keynot", top=1)
+    assert results and results[0][0]["content"] == DOCS[0]["content"]
+    assert results[0][2] == 0.0
+
+def test_unknown_terms_find_nothing_without_dense_vectors(tmp_path):
+    build_index(DOCS, str(tmp_path), dense_dim=0)
+    index = LocalIndex(str(tmp_path))
+    assert index.search("zzz " + "x" * 80) == []
+    assert index.search("the") == []
+    assert [doc["content"] for doc, _, _ in index.search("lunch hall", top=5)] == [DOCS[2]["content"]]
+
+def test_empty_corpus(tmp_path):
+    build_index([], str(tmp_path))
+    assert LocalIndex(str(tmp_path)).search("keynote") == []
+
+def test_text_files_are_split_into_paragraphs(tmp_path):
+    source = tmp_path / "corpus.txt"
+    source.write_text("First paragraph\nwraps here.\n\nSecond paragraph.\n")
+    docs = load_documents(str(source))
+    assert [doc["content"] for doc in docs] == ["First paragraph wraps here.", "Second paragraph."]
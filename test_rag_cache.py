@@ -0,0 +1,109 @@
+import asyncio
+
+import pytest
+
+from rag_cache import RetrievalCache, content_terms, normalize_query
+
+FIELDS = ["content"]
+
+def _fetcher(results, calls: list, delay: float = 0.0):
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(delay)
+        return results
+    return fetch
+
+def _lookup(cache: RetrievalCache, query: str, results, calls: list, delay: float = 0.0):
+    return cache.get_or_fetch(query, 3, FIELDS, _fetcher(results, calls, delay))
+
+def test_repeated_phrasings_share_an_entry():
+    async def run():
+        cache = RetrievalCache(max_entries=8, ttl=60)
+        calls = []
+        first = await _lookup(cache, "Where is the keynote?", [{"content": "Main stage"}], calls)
+        second = await _lookup(cache, "where's   keynote", [{"content": "other"}], calls)
+        return cache, calls, first, second
+
+    cache, calls, first, second = asyncio.run(run())
+    assert normalize_query("Where is the keynote?") == "where keynote"
+    assert len(calls) == 1
+    assert second == first
+    assert (cache.stats()["hits"], cache.stats()["misses"]) == (1, 1)
+
+def test_expired_entries_are_fetched_again():
+    async def run():
+        cache = RetrievalCache(max_entries=8, ttl=-1)
+        calls = []
+        await _lookup(cache, "keynote", [{"content": "Main stage"}], calls)
+        await _lookup(cache, "keynote", [{"content": "Main stage"}], calls)
+        return cache, calls
+
+    cache, calls = asyncio.run(run())
+    assert len(calls) == 2
+    assert cache.stats()["entries"] == 1
+    assert cache.stats()["hits"] == 0
+
+def test_least_recently_used_entry_is_evicted():
+    async def run():
+        cache = RetrievalCache(max_entries=2, ttl=60)
+        calls = []
+        await _lookup(cache, "keynote", [{"content": "a"}], calls)
+        await _lookup(cache, "parking", [{"content": "b"}], calls)
+        await _lookup(cache, "keynote", [{"content": "a"}], calls)
+        await _lookup(cache, "lunch", [{"content": "c"}], calls)
+        await _lookup(cache, "keynote", [{"content": "a"}], calls)
+        await _lookup(cache, "parking", [{"content": "b"}], calls)
+        return cache, calls
+
+    cache, calls = asyncio.run(run())
+    assert len(calls) == 4
+    assert cache.stats()["evictions"] == 2
+
+def test_concurrent_identical_lookups_share_one_fetch():
+    async def run():
+        cache = RetrievalCache(max_entries=8, ttl=60)
+        calls = []
+        results = await asyncio.gather(*(_lookup(cache, "keynote", [{"content": "a"}], calls, delay=0.05) for _ in range(5)))
+        return cache, calls, results
+
+    cache, calls, results = asyncio.run(run())
+    assert len(calls) == 1
+    assert all(r == [{"content": "a"}] for r in results)
+    assert cache.stats()["coalesced"] == 4
+
+def test_empty_and_failed_results_are_not_cached():
+    async def run():
+        cache = RetrievalCache(max_entries=8, ttl=60)
+        calls = []
+        await _lookup(cache, "keynote", [], calls)
+        await _lookup(cache, "keynote", [], calls)
+
+        async def fail():
+            raise RuntimeError("search unavailable")
+        with pytest.raises(RuntimeError):
+            await cache.get_or_fetch("parking", 3, FIELDS, fail)
+        return cache, calls
+
+    cache, calls = asyncio.run(run())
+    assert len(calls) == 2
+    assert cache.stats()["entries"] == 0
+
+def test_cancelled_caller_does_not_cancel_the_shared_fetch():
+    async def run():
+        cache = RetrievalCache(max_entries=8, ttl=60)
+        calls = []
+        impatient = asyncio.create_task(_lookup(cache, "keynote", [{"content": "a"}], calls, delay=0.05))
+        patient = asyncio.create_task(_lookup(cache, "keynote", [{"content": "a"}], calls, delay=0.05))
+        await asyncio.sleep(0.01)
+        impatient.cancel()
+        result = await patient
+        return cache, calls, result, impatient
+
+    cache, calls, result, impatient = asyncio.run(run())
+    assert impatient.cancelled()
+    assert result == [{"content": "a"}]
+    assert len(calls) == 1
+    assert cache.stats()["entries"] == 1
+
+def test_content_terms_fold_plurals_and_drop_stop_words():
+    assert content_terms("What are the sessions about glass?") == ["what", "session", "glass"]
@@ -0,0 +1,97 @@
+import asyncio
+import importlib
+
+from aiohttp.test_utils import TestClient, TestServer
+
+from readiness import Readiness
+from relay_logging import LogPipeline
+from rtmt import RTMiddleTier
+
+async def _unavailable():
+    raise ConnectionError("search unavailable")
+
+def _client_app(monkeypatch, startup):
+    # Importing app installs its log pipeline on the root logger, which would take over pytest's capture
+    monkeypatch.setattr(LogPipeline, "install", lambda self: None)
+    app = importlib.import_module("app")
+    monkeypatch.setenv("RUNNING_IN_PRODUCTION", "1")
+    monkeypatch.setenv("AZURE_OPENAI_API_KEY", "key")
+    monkeypatch.setenv("AZURE_OPENAI_ENDPOINT", "https://realtime.example")
+    monkeypatch.setenv("AZURE_OPENAI_REALTIME_DEPLOYMENT", "deployment")
+    monkeypatch.delenv("APP_METRICS_DIR", raising=False)
+    # The warm-ups would dial Azure; the test decides what each subsystem does instead
+    monkeypatch.setattr(RTMiddleTier, "_on_startup", startup)
+    return app
+
+async def _get(client: TestClient, path: str) -> tuple[int, dict]:
+    async with client.get(path) as response:
+        return response.status, await response.json()
+
+def test_readyz_is_unavailable_until_required_subsystems_are_ready(monkeypatch):
+    async def run():
+        search, pool = asyncio.Event(), asyncio.Event()
+
+        async def startup(self, _):
+            self.readiness.track("search", search.wait())
+            self.readiness.track("upstream_pool", pool.wait(), required=False)
+
+        app = _client_app(monkeypatch, startup)
+        async with TestClient(TestServer(await app.create_app())) as client:
+            health_status, _ = await _get(client, "/healthz")
+            status, starting = await _get(client, "/readyz")
+            search.set()
+            await asyncio.sleep(0)
+            status_ready, ready = await _get(client, "/readyz")
+        return health_status, status, starting, status_ready, ready
+
+    health_status, status, starting, status_ready, ready = asyncio.run(run())
+    assert health_status == 200
+    assert status == 503
+    assert starting["ready"] is False
+    assert starting["subsystems"]["search"] == {"state": "starting", "required": True}
+    assert status_ready == 200
+    assert ready["ready"] is True
+    assert ready["subsystems"]["search"]["state"] == "ready"
+    assert "seconds" in ready["subsystems"]["search"]
+    # Optional subsystems are reported but do not hold up readiness
+    assert ready["subsystems"]["upstream_pool"] == {"state": "starting", "required": False}
+
+def test_readyz_reports_failed_subsystems(monkeypatch):
+    async def run():
+        async def startup(self, _):
+            self.readiness.track("search", _unavailable())
+            self.readiness.track("resampler", asyncio.sleep(0))
+
+        app = _client_app(monkeypatch, startup)
+        async with TestClient(TestServer(await app.create_app())) as client:
+            await asyncio.sleep(0.01)
+            return await _get(client, "/readyz"), await _get(client, "/healthz")
+
+    (status, report), (health_status, _) = asyncio.run(run())
+    assert status == 503
+    assert report["subsystems"]["search"]["state"] == "failed"
+    assert report["subsystems"]["search"]["error"] == "search unavailable"
+    assert report["subsystems"]["resampler"]["state"] == "ready"
+    assert health_status == 200
+
+def test_failed_optional_subsystem_does_not_block_readiness():
+    async def run():
+        readiness = Readiness()
+        await readiness.track("upstream_pool", _unavailable(), required=False)
+        return readiness.report()
+
+    report = asyncio.run(run())
+    assert report["ready"] is True
+    assert report["subsystems"]["upstream_pool"]["state"] == "failed"
+
+def test_close_cancels_warm_ups_still_running():
+    async def run():
+        readiness = Readiness()
+        task = readiness.track("token", asyncio.Event().wait())
+        await asyncio.sleep(0)
+        await readiness.close()
+        return readiness, task
+
+    readiness, task = asyncio.run(run())
+    assert task.cancelled()
+    assert not readiness.ready()
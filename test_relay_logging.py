@@ -0,0 +1,121 @@
+import contextvars
+import json
+import logging
+import os
+import queue
+import signal
+import time
+
+import pytest
+
+from relay_logging import DroppingQueueHandler, JsonFormatter, LogContext, LogPipeline, Payload, TextFormatter, bind_log_context
+
+# The pipeline under test is never installed, so pytest's own capture of the root logger is left alone
+def _logger(pipeline: LogPipeline, queue_size: int, name: str) -> tuple[logging.Logger, DroppingQueueHandler]:
+    pipeline.handler = DroppingQueueHandler(queue.Queue(queue_size))
+    pipeline.handler.addFilter(pipeline.rate_limit)
+    logger = logging.getLogger(f"voicerag.test.{name}")
+    logger.handlers = [pipeline.handler]
+    logger.propagate = False
+    logger.setLevel(logging.DEBUG)
+    return logger, pipeline.handler
+
+def _queued(handler: DroppingQueueHandler) -> list[logging.LogRecord]:
+    records = []
+    while not handler.queue.empty():
+        records.append(handler.queue.get_nowait())
+    return records
+
+def _discarded(pipeline: LogPipeline) -> dict[str, int]:
+    [(_, _, _, samples)] = pipeline.collect_metrics()
+    return {labels["reason"]: value for labels, value in samples}
+
+def test_full_queue_drops_and_counts_records():
+    pipeline = LogPipeline(queue_size=2, debug_rate=0)
+    logger, handler = _logger(pipeline, 2, "overflow")
+    for i in range(5):
+        logger.info("record %d", i)
+    assert [r.getMessage() for r in _queued(handler)] == ["record 0", "record 1"]
+    assert handler.dropped == 3
+    assert _discarded(pipeline) == {"dropped": 3, "rate_limited": 0}
+
+def test_debug_records_are_rate_limited_per_call_site():
+    pipeline = LogPipeline(debug_rate=0.001, debug_burst=2)
+    logger, handler = _logger(pipeline, 100, "rate")
+    for i in range(5):
+        logger.debug("frame %d", i)
+    logger.debug("other site")
+    for i in range(3):
+        logger.info("info %d", i)
+    messages = [r.getMessage() for r in _queued(handler)]
+    assert messages == ["frame 0", "frame 1", "other site", "info 0", "info 1", "info 2"]
+    assert _discarded(pipeline) == {"dropped": 0, "rate_limited": 3}
+
+def test_suppressed_count_is_attached_to_the_next_record_let_through():
+    pipeline = LogPipeline(debug_rate=20, debug_burst=1)
+    logger, handler = _logger(pipeline, 100, "suppressed")
+    for i in range(5):
+        if i == 4:
+            time.sleep(0.06)
+        logger.debug("frame %d", i)
+    records = _queued(handler)
+    assert [r.getMessage() for r in records] == ["frame 0", "frame 4"]
+    assert records[1].suppressed == 3
+    assert json.loads(JsonFormatter().format(records[1]))["suppressed"] == 3
+    assert TextFormatter().format(records[1]).endswith(" [3 suppressed]: frame 4")
+
+def test_payload_is_cut_to_the_limit_with_length_and_digest():
+    assert str(Payload("short", limit=10)) == "short"
+    text = str(Payload("x" * 50, limit=10))
+    assert text.startswith("x" * 10 + "...[50 chars, sha1 ")
+    assert len(text.split("sha1 ")[1].rstrip("]")) == 10
+    assert str(Payload("x" * 50, limit=0)).startswith("[50 chars, sha1 ")
+    assert str(Payload({"id": 1}, limit=100)) == "{'id': 1}"
+
+def test_payload_is_rendered_when_queued_not_when_written():
+    pipeline = LogPipeline(debug_rate=0)
+    logger, handler = _logger(pipeline, 10, "payload")
+    documents = ["hall B"]
+    logger.info("context %s", Payload(documents, limit=100))
+    documents.append("level 2")
+    [record] = _queued(handler)
+    assert record.getMessage() == "context ['hall B']"
+    assert record.args is None
+
+def test_json_records_carry_session_and_turn():
+    pipeline = LogPipeline(debug_rate=0)
+    logger, handler = _logger(pipeline, 10, "context")
+    context = LogContext("s-1")
+
+    def relay():
+        bind_log_context(context)
+        logger.info("turn started")
+        context.turn = 2
+        try:
+            raise RuntimeError("upstream closed")
+        except RuntimeError:
+            logger.exception("relay failed")
+
+    logger.info("outside any session")
+    contextvars.copy_context().run(relay)
+    outside, started, failed = (json.loads(JsonFormatter().format(r)) for r in _queued(handler))
+    assert "session" not in outside and "turn" not in outside
+    assert (started["session"], started["turn"], started["msg"]) == ("s-1", 0, "turn started")
+    assert (failed["session"], failed["turn"], failed["level"]) == ("s-1", 2, "ERROR")
+    assert "RuntimeError: upstream closed" in failed["exc"]
+
+@pytest.mark.skipif(not hasattr(signal, "SIGUSR1"), reason="no SIGUSR1 on this platform")
+def test_sigusr1_toggles_between_configured_level_and_debug():
+    pipeline = LogPipeline(level="warning")
+    root = logging.getLogger()
+    level = root.level
+    previous = signal.signal(signal.SIGUSR1, pipeline._toggle_debug)
+    try:
+        root.setLevel(pipeline.level)
+        os.kill(os.getpid(), signal.SIGUSR1)
+        assert root.level == logging.DEBUG
+        os.kill(os.getpid(), signal.SIGUSR1)
+        assert root.level == logging.WARNING
+    finally:
+        signal.signal(signal.SIGUSR1, previous)
+        root.setLevel(level)
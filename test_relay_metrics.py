@@ -0,0 +1,37 @@
+from relay_metrics import MetricsRegistry, merge_expositions
+
+def _worker(sessions: int, frames: int, latencies: list[float]) -> str:
+    registry = MetricsRegistry()
+    registry.counter("realtime_frames_total", "Frames relayed.").inc(frames)
+    registry.gauge("realtime_active_sessions", "Sessions open.").inc(sessions)
+    histogram = registry.histogram("realtime_turn_latency_seconds", "Turn latency.", buckets=(0.5, 1.0))
+    for latency in latencies:
+        histogram.observe(latency)
+    return registry.render()
+
+def _samples(text: str) -> dict[str, str]:
+    return dict(line.rsplit(" ", 1) for line in text.splitlines() if not line.startswith("#"))
+
+def test_counters_and_histograms_are_summed():
+    merged = _samples(merge_expositions({"1": _worker(2, 10, [0.2, 0.7]), "2": _worker(3, 5, [2.0])}))
+    assert merged["realtime_frames_total"] == "15"
+    assert merged['realtime_turn_latency_seconds_bucket{le="0.5"}'] == "1"
+    assert merged['realtime_turn_latency_seconds_bucket{le="1.0"}'] == "2"
+    assert merged['realtime_turn_latency_seconds_bucket{le="+Inf"}'] == "3"
+    assert merged["realtime_turn_latency_seconds_count"] == "3"
+    assert float(merged["realtime_turn_latency_seconds_sum"]) == 2.9
+
+def test_gauges_are_kept_per_worker():
+    merged = _samples(merge_expositions({"1": _worker(2, 0, []), "2": _worker(3, 0, [])}))
+    assert merged['realtime_active_sessions{worker="1"}'] == "2"
+    assert merged['realtime_active_sessions{worker="2"}'] == "3"
+    assert "realtime_active_sessions" not in merged
+
+def test_worker_label_joins_existing_labels():
+    text = '# HELP pool_size Pooled sessions.\n# TYPE pool_size gauge\npool_size{state="idle"} 4\n'
+    assert 'pool_size{worker="a",state="idle"} 4' in merge_expositions({"a": text})
+
+def test_help_and_type_are_written_once():
+    merged = merge_expositions({"1": _worker(1, 1, []), "2": _worker(1, 1, [])})
+    assert merged.count("# TYPE realtime_frames_total counter") == 1
+    assert merged.count("# HELP realtime_active_sessions Sessions open.") == 1
@@ -0,0 +1,80 @@
+import asyncio
+
+from relay_queue import RelayQueue, RelayQueueStats
+
+AUDIO = "response.audio.delta"
+
+def test_droppable_frame_evicts_oldest_droppable():
+    async def run():
+        queue = RelayQueue(RelayQueueStats(), max_frames=3, max_bytes=1 << 20, droppable=frozenset({AUDIO}))
+        await queue.put("a1", AUDIO)
+        await queue.put("done", "response.done")
+        await queue.put("a2", AUDIO)
+        await queue.put("a3", AUDIO)
+        return [await queue.get() for _ in range(len(queue))], queue.stats
+
+    frames, stats = asyncio.run(run())
+    assert frames == ["done", "a2", "a3"]
+    assert stats.dropped == 1
+    assert stats.depth == 0
+
+def test_droppable_frame_dropped_when_nothing_to_evict():
+    async def run():
+        queue = RelayQueue(RelayQueueStats(), max_frames=2, max_bytes=1 << 20, droppable=frozenset({AUDIO}))
+        await queue.put("created", "response.created")
+        await queue.put("done", "response.done")
+        await queue.put("a1", AUDIO)
+        return [await queue.get() for _ in range(len(queue))], queue.stats
+
+    frames, stats = asyncio.run(run())
+    assert frames == ["created", "done"]
+    assert stats.dropped == 1
+
+def test_byte_limit_applies_once_queue_is_not_empty():
+    async def run():
+        queue = RelayQueue(RelayQueueStats(), max_frames=10, max_bytes=4, droppable=frozenset({AUDIO}))
+        # A single frame larger than the budget is still accepted into an empty queue
+        await queue.put("x" * 8, AUDIO)
+        await queue.put("y", AUDIO)
+        return [await queue.get() for _ in range(len(queue))]
+
+    assert asyncio.run(run()) == ["y"]
+
+def test_non_droppable_frame_waits_for_room():
+    async def run():
+        queue = RelayQueue(RelayQueueStats(), max_frames=1, max_bytes=1 << 20)
+        await queue.put("first", "response.created")
+        put = asyncio.create_task(queue.put("second", "response.done"))
+        await asyncio.sleep(0)
+        assert not put.done()
+        assert await queue.get() == "first"
+        await put
+        return await queue.get(), queue.stats
+
+    frame, stats = asyncio.run(run())
+    assert frame == "second"
+    assert stats.dropped == 0
+
+def test_drop_stale_removes_only_given_types():
+    async def run():
+        queue = RelayQueue(RelayQueueStats(), max_frames=10, max_bytes=1 << 20)
+        await queue.put("a1", AUDIO)
+        await queue.put("t1", "response.audio_transcript.delta")
+        await queue.put("a2", AUDIO)
+        dropped = queue.drop_stale(frozenset({AUDIO}))
+        return dropped, [await queue.get() for _ in range(len(queue))], queue.stats
+
+    dropped, frames, stats = asyncio.run(run())
+    assert dropped == 2
+    assert frames == ["t1"]
+    assert stats.stale_dropped == 2
+
+def test_get_returns_none_once_closed_and_drained():
+    async def run():
+        queue = RelayQueue(RelayQueueStats(), max_frames=10, max_bytes=1 << 20)
+        await queue.put("last", "response.done")
+        queue.close()
+        await queue.put("late", "response.done")
+        return await queue.get(), await queue.get()
+
+    assert asyncio.run(run()) == ("last", None)
@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+
+from resampler import StreamingResampler
+
+def _tone(rate: int, seconds: float, freq: float = 440.0) -> bytes:
+    t = np.arange(int(rate * seconds)) / rate
+    return (np.sin(2 * np.pi * freq * t) * 8000).astype("<i2").tobytes()
+
+@pytest.mark.parametrize("in_rate,out_rate", [(16000, 24000), (48000, 24000), (44100, 24000), (8000, 24000)])
+@pytest.mark.parametrize("chunk", [1, 3, 320, 4801])
+def test_chunked_matches_one_shot(in_rate, out_rate, chunk):
+    pcm = _tone(in_rate, 0.25)
+    whole = StreamingResampler(in_rate, out_rate).process(pcm)
+    streaming = StreamingResampler(in_rate, out_rate)
+    pieces = b"".join(streaming.process(pcm[i:i + chunk]) for i in range(0, len(pcm), chunk))
+    assert pieces == whole
+
+def test_output_length_follows_rate_ratio():
+    pcm = _tone(16000, 1.0)
+    out = StreamingResampler(16000, 24000).process(pcm)
+    assert len(out) // 2 == 24000
+
+def test_same_rate_passes_samples_through():
+    resampler = StreamingResampler(24000, 24000)
+    pcm = _tone(24000, 0.01)
+    # The odd byte is held back until the next frame completes the sample
+    assert resampler.process(pcm + b"\x01") == pcm
+    assert resampler.process(b"\x02") == b"\x01\x02"
+
+def test_tone_survives_resampling():
+    out = np.frombuffer(StreamingResampler(48000, 24000).process(_tone(48000, 0.5)), dtype="<i2")
+    spectrum = np.abs(np.fft.rfft(out[1000:]))
+    peak = np.argmax(spectrum) * 24000 / len(out[1000:])
+    assert abs(peak - 440.0) < 5
+
+@pytest.mark.parametrize("in_rate,out_rate", [(0, 24000), (-16000, 24000), (16000, 0)])
+def test_rejects_non_positive_rates(in_rate, out_rate):
+    with pytest.raises(ValueError):
+        StreamingResampler(in_rate, out_rate)
@@ -0,0 +1,297 @@
+import asyncio
+import json
+import time
+from typing import Any
+
+import aiohttp
+import pytest
+from azure.core.credentials import AzureKeyCredential
+
+from relay_queue import RelayQueue, RelayQueueStats
+from rtmt import RTMiddleTier, RTSession, RTToolCall, Tool, ToolResult, ToolResultDirection, frame_type
+
+class FakeSocket:
+    """
+    Stands in for either WebSocket of a session and records what is sent on it.
+    """
+    def __init__(self):
+        self.sent: list[dict[str, Any]] = []
+        self.closed = False
+
+    async def send_json(self, message: dict[str, Any]):
+        self.sent.append(message)
+
+    async def send_str(self, data: str):
+        self.sent.append(json.loads(data))
+
+    async def close(self, **kwargs):
+        self.closed = True
+
+    def types(self) -> list[str]:
+        return [message["type"] for message in self.sent]
+
+def _middle_tier() -> RTMiddleTier:
+    return RTMiddleTier("https://realtime.example", "deployment", AzureKeyCredential("key"))
+
+def _session() -> RTSession:
+    return RTSession(FakeSocket(), FakeSocket())
+
+def _frame(message: dict[str, Any]) -> aiohttp.WSMessage:
+    return aiohttp.WSMessage(aiohttp.WSMsgType.TEXT, json.dumps(message), None)
+
+def test_new_utterance_cancels_response_waiting_on_retrieval():
+    async def run():
+        rtmt = _middle_tier()
+        rtmt.rag_prefetch_budget = 0.05
+        rt_session = _session()
+        rt_session.prefetch.auto_response = True
+        rt_session.prefetch.task = asyncio.get_running_loop().create_future()
+        rtmt._auto_respond(rt_session)
+        await asyncio.sleep(0)
+        await rtmt._process_message_to_client(_frame({"type": "input_audio_buffer.speech_started"}), rt_session)
+        await asyncio.sleep(0.1)
+        return rt_session
+
+    rt_session = asyncio.run(run())
+    assert rt_session.server_ws.types() == []
+    assert rt_session.prefetch.response_task is None
+
+def test_client_response_create_does_not_wait_for_retrieval():
+    async def run():
+        rtmt = _middle_tier()
+        rt_session = _session()
+        retrieval = asyncio.get_running_loop().create_future()
+        rt_session.prefetch.query = "where is the keynote"
+        rt_session.prefetch.task = retrieval
+        response = {"type": "response.create", "response": {"modalities": ["text"]}}
+        forwarded = await asyncio.wait_for(rtmt._process_message_to_server(_frame(response), rt_session), 0.1)
+        assert forwarded is None
+        retrieval.set_result([{"content": "The keynote is on the main stage."}])
+        await rt_session.prefetch.response_task
+        return rt_session, response
+
+    rt_session, response = asyncio.run(run())
+    assert rt_session.server_ws.types() == ["conversation.item.create", "response.create"]
+    assert rt_session.server_ws.sent[-1] == response
+
+def test_client_response_create_forwarded_inline_once_retrieval_is_done():
+    async def run():
+        rtmt = _middle_tier()
+        rt_session = _session()
+        retrieval = asyncio.get_running_loop().create_future()
+        retrieval.set_result([])
+        rt_session.prefetch.task = retrieval
+        frame = _frame({"type": "response.create"})
+        return await rtmt._process_message_to_server(frame, rt_session), frame, rt_session
+
+    forwarded, frame, rt_session = asyncio.run(run())
+    assert forwarded == frame.data
+    assert rt_session.prefetch.response_task is None
+
+def test_failed_session_setup_releases_admission_slot(monkeypatch):
+    async def fail(self, message):
+        raise ConnectionResetError("client went away")
+
+    async def run():
+        rtmt = _middle_tier()
+        assert rtmt.resumption.enabled
+        assert rtmt.admission.request("10.0.0.1") is None
+        monkeypatch.setattr(RTSession, "send_to_client", fail)
+        upstream = FakeSocket()
+        with pytest.raises(ConnectionResetError):
+            await rtmt._forward_messages(FakeSocket(), upstream)
+        return rtmt, upstream
+
+    rtmt, upstream = asyncio.run(run())
+    assert rtmt.admission.active == 0
+    assert rtmt._active_sessions.value == 0
+    assert upstream.closed
+    assert rtmt.resumption.stats()["resumable"] == 0
+
+def _tool(delay: float) -> Tool:
+    async def target(args: dict[str, Any]) -> ToolResult:
+        await asyncio.sleep(delay)
+        return ToolResult({"slept": delay}, ToolResultDirection.TO_SERVER)
+    return Tool(target, {"type": "function", "name": "sleep"})
+
+def _call_tools(rtmt: RTMiddleTier, rt_session: RTSession, *names: str):
+    async def run():
+        tasks = [
+            asyncio.create_task(rtmt._run_tool_call(
+                rt_session, {"name": name, "arguments": "{}", "call_id": f"call_{i}"}, RTToolCall(f"call_{i}", "item_0")))
+            for i, name in enumerate(names)
+        ]
+        await rtmt._finish_tool_calls(rt_session, tasks)
+    asyncio.run(run())
+
+def _outputs(rt_session: RTSession) -> dict[str, dict]:
+    return {m["item"]["call_id"]: json.loads(m["item"]["output"])
+            for m in rt_session.server_ws.sent if m["type"] == "conversation.item.create"}
+
+def test_unknown_tool_gets_an_error_output():
+    rtmt = _middle_tier()
+    rt_session = _session()
+    _call_tools(rtmt, rt_session, "made_up")
+    assert rt_session.server_ws.types() == ["conversation.item.create", "response.create"]
+    assert _outputs(rt_session) == {"call_0": {"error": "Tool 'made_up' failed: unknown tool"}}
+    assert rt_session.client_ws.sent == []
+    assert rtmt.tool_stats["made_up"]["errors"] == 1
+
+def test_slow_tool_times_out():
+    rtmt = _middle_tier()
+    rtmt.tool_timeout = 0.05
+    rtmt.tools["slow"] = _tool(1.0)
+    rt_session = _session()
+    _call_tools(rtmt, rt_session, "slow")
+    assert _outputs(rt_session) == {"call_0": {"error": "Tool 'slow' timed out after 0.05s"}}
+    assert rt_session.server_ws.types()[-1] == "response.create"
+    assert rtmt.tool_stats["slow"]["timeouts"] == 1
+
+def test_tool_calls_of_one_response_run_concurrently():
+    rtmt = _middle_tier()
+    rtmt.tools["sleep"] = _tool(0.2)
+    rt_session = _session()
+    start = time.perf_counter()
+    _call_tools(rtmt, rt_session, "sleep", "sleep", "sleep")
+    assert time.perf_counter() - start < 0.5
+    assert _outputs(rt_session) == {f"call_{i}": {"slept": 0.2} for i in range(3)}
+    # The response continues once, after the last output
+    assert rt_session.server_ws.types() == ["conversation.item.create"] * 3 + ["response.create"]
+
+@pytest.mark.parametrize("data,expected", [
+    ('{"type":"response.audio.delta","delta":"AAAA"}', "response.audio.delta"),
+    (' \n{ "type" :  "input_audio_buffer.append", "audio": "AAAA"}', "input_audio_buffer.append"),
+    # Escapes and a "type" that is not the first key are left to the JSON parser
+    ('{"type":"custom.\\"quoted\\"","x":1}', 'custom."quoted"'),
+    ('{"event_id":"evt_1","type":"response.done"}', "response.done"),
+    ('{"event_id":"evt_1","delta":"{\\"type\\":\\"fake\\"}","type":"response.text.delta"}', "response.text.delta"),
+    ('{"event_id":"evt_1"}', None),
+    ('["type"]', None),
+    ("not json", None),
+])
+def test_frame_type(data, expected):
+    assert frame_type(data) == expected
+
+def test_passthrough_frames_are_forwarded_byte_identical():
+    async def run():
+        rtmt = _middle_tier()
+        rt_session = _session()
+        audio_in = _frame({"type": "input_audio_buffer.append", "audio": "AAAA" * 64})
+        audio_out = aiohttp.WSMessage(aiohttp.WSMsgType.TEXT, '{"type": "response.audio.delta",  "response_id":"resp_1", "delta":"AAAA"}', None)
+        return (await rtmt._process_message_to_server(audio_in, rt_session), audio_in.data,
+                await rtmt._process_message_to_client(audio_out, rt_session), audio_out.data)
+
+    to_server, sent_by_client, to_client, sent_by_service = asyncio.run(run())
+    assert to_server is sent_by_client
+    assert to_client is sent_by_service
+
+def test_rewrite_types_are_still_parsed():
+    async def run():
+        rtmt = _middle_tier()
+        rtmt.system_message = "You are the kiosk assistant."
+        rt_session = _session()
+        update = await rtmt._process_message_to_server(_frame({"type": "session.update", "session": {"instructions": "client"}}), rt_session)
+        # "type" after other keys still reaches the rewrite
+        created = await rtmt._process_message_to_client(
+            aiohttp.WSMessage(aiohttp.WSMsgType.TEXT, '{"event_id":"evt_1","type":"session.created","session":{"instructions":"secret","tools":[{"name":"t"}]}}', None),
+            rt_session)
+        return json.loads(update), json.loads(created)
+
+    update, created = asyncio.run(run())
+    assert update["session"]["instructions"] == "You are the kiosk assistant."
+    assert update["session"]["tool_choice"] == "none"
+    assert "secret" not in created["session"]["instructions"]
+    assert created["session"]["tools"] == []
+
+# 100 ms of 24 kHz PCM16 audio per delta
+AUDIO_DELTA = "A" * 6400
+
+def _audio_delta(response_id: str) -> str:
+    return json.dumps({"type": "response.audio.delta", "response_id": response_id, "item_id": "item_1", "delta": AUDIO_DELTA})
+
+def _playing_session(sent_deltas: int, playing_for: float, active: bool = True) -> RTSession:
+    """
+    A session whose response resp_1 (audio item item_1) has had `sent_deltas` deltas sent to the
+    client, which started playing them `playing_for` seconds ago.
+    """
+    rt_session = RTSession(FakeSocket(), FakeSocket(), to_client=RelayQueue(RelayQueueStats(), 256, 1 << 22))
+    playback = rt_session.playback
+    playback.start("resp_1")
+    playback.item_id = "item_1"
+    for _ in range(sent_deltas):
+        playback.audio_sent(_audio_delta("resp_1"))
+    playback.first_audio_at = time.perf_counter() - playing_for
+    playback.active = active
+    return rt_session
+
+def test_barge_in_cancels_and_truncates_at_what_was_played():
+    async def run():
+        rtmt = _middle_tier()
+        rt_session = _playing_session(sent_deltas=10, playing_for=0.4)
+        for frame in (_audio_delta("resp_1"), _audio_delta("resp_1"),
+                      json.dumps({"type": "response.audio_transcript.delta", "response_id": "resp_1", "delta": "Hi"}),
+                      json.dumps({"type": "response.output_item.done", "response_id": "resp_1"})):
+            await rt_session.to_client.put(frame, json.loads(frame)["type"])
+        await rtmt._barge_in(rt_session, "speech_started")
+        return rtmt, rt_session
+
+    rtmt, rt_session = asyncio.run(run())
+    assert rt_session.playback.sent_ms() == 1000
+    cancel, truncate = rt_session.server_ws.sent
+    assert cancel == {"type": "response.cancel"}
+    assert truncate["type"] == "conversation.item.truncate"
+    assert (truncate["item_id"], truncate["content_index"]) == ("item_1", 0)
+    assert 400 <= truncate["audio_end_ms"] < 600
+    # Queued deltas of the cancelled response never reach the client; other events still do
+    assert len(rt_session.to_client) == 1
+    assert rtmt._stale_deltas.values[""] == 3
+    assert rtmt._barge_ins.values == {"speech_started": 1}
+    assert rt_session.playback.cancelled and rt_session.playback.cancelled_id == "resp_1"
+
+def test_barge_in_after_response_finished_only_truncates():
+    async def run():
+        rtmt = _middle_tier()
+        rt_session = _playing_session(sent_deltas=10, playing_for=0.2, active=False)
+        await rtmt._barge_in(rt_session, "client")
+        return rt_session
+
+    rt_session = asyncio.run(run())
+    assert rt_session.server_ws.types() == ["conversation.item.truncate"]
+    assert rt_session.server_ws.sent[0]["audio_end_ms"] < 1000
+
+def test_barge_in_after_playback_finished_does_nothing():
+    async def run():
+        rtmt = _middle_tier()
+        rt_session = _playing_session(sent_deltas=5, playing_for=2.0, active=False)
+        await rtmt._barge_in(rt_session, "speech_started")
+        return rtmt, rt_session
+
+    rtmt, rt_session = asyncio.run(run())
+    assert rt_session.server_ws.sent == []
+    assert rtmt._barge_ins.values == {}
+
+def test_late_deltas_of_cancelled_response_are_dropped():
+    async def run():
+        rtmt = _middle_tier()
+        rt_session = _playing_session(sent_deltas=10, playing_for=0.1)
+        await rtmt._barge_in(rt_session, "speech_started")
+        late = await rtmt._process_message_to_client(aiohttp.WSMessage(aiohttp.WSMsgType.TEXT, _audio_delta("resp_1"), None), rt_session)
+        fresh = await rtmt._process_message_to_client(aiohttp.WSMessage(aiohttp.WSMsgType.TEXT, _audio_delta("resp_2"), None), rt_session)
+        await rtmt._process_message_to_client(_frame({"type": "response.done", "response": {"id": "resp_1", "status": "cancelled"}}), rt_session)
+        after_done = await rtmt._process_message_to_client(aiohttp.WSMessage(aiohttp.WSMsgType.TEXT, _audio_delta("resp_1"), None), rt_session)
+        return rtmt, rt_session, late, fresh, after_done
+
+    rtmt, rt_session, late, fresh, after_done = asyncio.run(run())
+    assert late is None
+    assert fresh == _audio_delta("resp_2")
+    assert after_done is not None
+    assert not rt_session.playback.cancelled
+    assert rtmt._stale_deltas.values[""] == 1
+    assert rtmt._interruption_seconds.count == 1
+
+def test_played_ms_is_bounded_by_sent_audio():
+    playback = _playing_session(sent_deltas=3, playing_for=5.0).playback
+    assert playback.sent_ms() == 300
+    assert playback.played_ms() == 300
+    playback = _playing_session(sent_deltas=30, playing_for=0.25).playback
+    assert 250 <= playback.played_ms() < 400
@@ -0,0 +1,81 @@
+import asyncio
+import base64
+import json
+
+import pytest
+
+from session_recorder import (FROM_CLIENT, FROM_SERVER, KIND_BINARY, KIND_META, KIND_TEXT, KIND_TEXT_RAW_AUDIO,
+                              SessionRecorder, read_records)
+
+AUDIO = base64.b64encode(bytes(range(256)) * 8).decode("ascii")
+
+FRAMES = [
+    (FROM_CLIENT, json.dumps({"type": "session.update", "session": {"voice": "alloy"}})),
+    (FROM_CLIENT, json.dumps({"type": "input_audio_buffer.append", "audio": AUDIO})),
+    (FROM_CLIENT, bytes(range(200))),
+    (FROM_SERVER, json.dumps({"type": "response.audio.delta", "response_id": "resp_1", "delta": AUDIO})),
+    (FROM_SERVER, json.dumps({"type": "response.audio_transcript.delta", "delta": "Hello"})),
+    (FROM_SERVER, json.dumps({"type": "response.done", "response": {"id": "resp_1"}})),
+]
+
+def _record(tmp_path, raw_audio: bool, max_bytes: int):
+    async def run():
+        recorder = SessionRecorder(str(tmp_path), max_bytes=max_bytes, raw_audio=raw_audio, flush_interval=0.01)
+        recording = recorder.start_session({"input_rate": 16000, "outputs": ["audio"]})
+        for i, (direction, data) in enumerate(FRAMES):
+            recording.record(direction, data)
+            if i == 2:
+                # Part of the session is written by the background flusher, the rest by close()
+                await asyncio.sleep(0.05)
+        await recording.close()
+        return recording
+    recording = asyncio.run(run())
+    return recording, sorted(tmp_path.glob(f"{recording.session_id}-*.rtrec"))
+
+def _same_frame(recorded, original) -> bool:
+    if isinstance(original, bytes):
+        return recorded == original
+    return json.loads(recorded) == json.loads(original)
+
+@pytest.mark.parametrize("raw_audio", [False, True])
+def test_write_rotate_read_round_trip(tmp_path, raw_audio):
+    recording, parts = _record(tmp_path, raw_audio, max_bytes=4096)
+    assert len(parts) > 1
+    records = list(read_records(parts))
+    metas = [r for r in records if r.kind == KIND_META]
+    frames = [r for r in records if r.kind != KIND_META]
+    # Every part starts with the session's META record
+    assert len(metas) == len(parts)
+    assert all(meta.data["session_id"] == recording.session_id and meta.data["input_rate"] == 16000 for meta in metas)
+    assert [r.direction for r in frames] == [direction for direction, _ in FRAMES]
+    assert all(_same_frame(r.data, data) for r, (_, data) in zip(frames, FRAMES))
+    assert [r.t for r in frames] == sorted(r.t for r in frames)
+    assert frames[2].kind == KIND_BINARY
+    audio_kinds = {frames[1].kind, frames[3].kind}
+    assert audio_kinds == ({KIND_TEXT_RAW_AUDIO} if raw_audio else {KIND_TEXT})
+    assert frames[4].kind == KIND_TEXT
+    assert sum(part.stat().st_size for part in parts) >= recording.bytes_written
+
+def test_raw_audio_is_smaller(tmp_path):
+    base64_recording, _ = _record(tmp_path / "base64", raw_audio=False, max_bytes=1 << 20)
+    raw_recording, _ = _record(tmp_path / "raw", raw_audio=True, max_bytes=1 << 20)
+    assert raw_recording.bytes_written < base64_recording.bytes_written * 0.85
+
+def test_truncated_recording_reads_up_to_the_last_whole_record(tmp_path):
+    _, parts = _record(tmp_path, raw_audio=True, max_bytes=1 << 20)
+    data = parts[0].read_bytes()
+    parts[0].write_bytes(data[:-10])
+    records = [r for r in read_records(parts) if r.kind != KIND_META]
+    assert len(records) == len(FRAMES) - 1
+
+def test_other_files_are_rejected(tmp_path):
+    path = tmp_path / "notes.rtrec"
+    path.write_bytes(b"not a recording")
+    with pytest.raises(ValueError):
+        list(read_records([path]))
+
+def test_recorder_is_off_without_a_directory(monkeypatch):
+    monkeypatch.delenv("RECORD_SESSIONS_DIR", raising=False)
+    recorder = SessionRecorder()
+    assert not recorder.enabled
+    assert recorder.start_session({}) is None
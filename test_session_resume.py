@@ -0,0 +1,53 @@
+import json
+
+from session_resume import FrameRing
+
+def _frame(event_id: str, size: int = 0) -> str:
+    return json.dumps({"type": "response.audio.delta", "event_id": event_id, "delta": "x" * size})
+
+def test_replays_frames_after_last_seen_event():
+    ring = FrameRing(max_frames=10, max_bytes=1 << 20)
+    for i in range(5):
+        ring.append(_frame(f"evt_{i}"))
+    seq = ring.seq_after("evt_2")
+    frames, missed = ring.since(seq)
+    assert seq == 3
+    assert [json.loads(f)["event_id"] for f in frames] == ["evt_3", "evt_4"]
+    assert missed == 0
+
+def test_nothing_to_replay_after_newest_frame():
+    ring = FrameRing(max_frames=10, max_bytes=1 << 20)
+    ring.append(_frame("evt_0"))
+    assert ring.since(ring.seq_after("evt_0")) == ([], 0)
+
+def test_frame_limit_evicts_oldest_and_reports_missed():
+    ring = FrameRing(max_frames=3, max_bytes=1 << 20)
+    for i in range(6):
+        ring.append(_frame(f"evt_{i}"))
+    assert ring.seq_after("evt_2") is None
+    assert ring.seq_after("evt_3") == 4
+    # A client last seen at frame 1 missed frames 2 to 5; only 3 to 5 are still buffered
+    frames, missed = ring.since(2)
+    assert len(frames) == 3
+    assert missed == 1
+
+def test_byte_limit_evicts_oldest():
+    ring = FrameRing(max_frames=100, max_bytes=2 * len(_frame("evt_0", size=100)))
+    for i in range(4):
+        ring.append(_frame(f"evt_{i}", size=100))
+    frames, missed = ring.since(0)
+    assert [json.loads(f)["event_id"] for f in frames] == ["evt_2", "evt_3"]
+    assert missed == 2
+
+def test_empty_ring_counts_everything_missed():
+    ring = FrameRing(max_frames=1, max_bytes=10)
+    ring.append(_frame("evt_0", size=50))
+    assert ring.since(0) == ([], 1)
+
+def test_event_id_matches_whole_id_only():
+    ring = FrameRing(max_frames=10, max_bytes=1 << 20)
+    ring.append(_frame("evt_12"))
+    ring.append(_frame("evt_1"))
+    assert ring.seq_after("evt_1") == 2
+    assert ring.seq_after("evt_12") == 1
+    assert ring.seq_after("evt_") is None
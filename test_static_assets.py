@@ -0,0 +1,84 @@
+import asyncio
+import gzip
+
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+
+from static_assets import IMMUTABLE, REVALIDATE, StaticAssets
+
+SCRIPT = b"function greet() { return 'hello from the kiosk'; }\n" * 40
+
+def _assets(tmp_path) -> StaticAssets:
+    (tmp_path / "js").mkdir()
+    (tmp_path / "js" / "chat.js").write_bytes(SCRIPT)
+    (tmp_path / "image").mkdir()
+    (tmp_path / "image" / "logo.png").write_bytes(b"\x89PNG" + bytes(1000))
+    (tmp_path / "chat.html").write_text('<script src="./js/chat.js?ver=2"></script><img src="image/logo.png"><a href="https://example.com/js/x.js">')
+    assets = StaticAssets(tmp_path)
+    assets.load()
+    return assets
+
+def _get(assets: StaticAssets, path: str, headers: dict = {}):
+    # The test client would otherwise ask for gzip itself
+    headers = {"Accept-Encoding": "identity", **headers}
+
+    async def run():
+        app = web.Application()
+        page = assets.add_page("/chat", assets.root / "chat.html")
+
+        async def chat(request):
+            return page.respond(request)
+        app.router.add_get("/chat", chat)
+        app.router.add_get("/{directory:css|js|image}/{name:.+}", assets.handle)
+        async with TestClient(TestServer(app), auto_decompress=False) as client:
+            response = await client.get(path, headers=headers)
+            return response.status, response.headers, await response.read()
+    return asyncio.run(run())
+
+def test_full_response_then_304_for_its_etag(tmp_path):
+    assets = _assets(tmp_path)
+    status, headers, body = _get(assets, "/js/chat.js")
+    assert status == 200
+    assert body == SCRIPT
+    assert headers["Cache-Control"] == REVALIDATE
+    assert headers["Content-Type"].endswith("javascript; charset=utf-8")
+    etag = headers["ETag"]
+    assert _get(assets, "/js/chat.js", {"If-None-Match": etag})[0] == 304
+    assert _get(assets, "/js/chat.js", {"If-None-Match": f'"other", W/{etag}'})[0] == 304
+    assert _get(assets, "/js/chat.js", {"If-None-Match": "*"})[0] == 304
+
+def test_etag_must_match_a_whole_entity_tag(tmp_path):
+    assets = _assets(tmp_path)
+    digest = _get(assets, "/js/chat.js")[1]["ETag"].strip('"')
+    for if_none_match in (digest, f'"{digest}x"', f'"x{digest}"', f'"{digest}-deflate"', '"*"'):
+        assert _get(assets, "/js/chat.js", {"If-None-Match": if_none_match})[0] == 200, if_none_match
+
+def test_encoding_negotiation(tmp_path):
+    assets = _assets(tmp_path)
+    status, headers, body = _get(assets, "/js/chat.js", {"Accept-Encoding": "deflate, gzip;q=0.8"})
+    assert status == 200
+    assert headers["Content-Encoding"] == "gzip"
+    assert headers["Vary"] == "Accept-Encoding"
+    assert gzip.decompress(body) == SCRIPT
+    gzip_etag = headers["ETag"]
+    assert gzip_etag.endswith('-gzip"')
+    # Every variant's ETag revalidates the content, whichever encoding is negotiated now
+    assert _get(assets, "/js/chat.js", {"If-None-Match": gzip_etag})[0] == 304
+    # Images are not compressed
+    status, headers, _ = _get(assets, "/image/logo.png", {"Accept-Encoding": "gzip"})
+    assert "Content-Encoding" not in headers
+
+def test_fingerprinted_urls_are_immutable_and_referenced_by_html(tmp_path):
+    assets = _assets(tmp_path)
+    fingerprinted = assets.fingerprinted["/js/chat.js"]
+    assert fingerprinted.startswith("/js/chat.") and fingerprinted.endswith(".js")
+    status, headers, body = _get(assets, fingerprinted)
+    assert (status, body) == (200, SCRIPT)
+    assert headers["Cache-Control"] == IMMUTABLE
+    _, _, html = _get(assets, "/chat")
+    assert f'<script src="{fingerprinted}">' in html.decode()
+    assert assets.fingerprinted["/image/logo.png"] in html.decode()
+    assert "https://example.com/js/x.js" in html.decode()
+
+def test_unknown_asset_is_404(tmp_path):
+    assert _get(_assets(tmp_path), "/js/missing.js")[0] == 404
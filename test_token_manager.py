@@ -0,0 +1,105 @@
+import asyncio
+import threading
+import time
+
+from azure.core.credentials import AccessToken
+
+from token_manager import LazyCredential, TokenManager
+
+SCOPE = "https://cognitiveservices.azure.com/.default"
+
+class FakeCredential:
+    """
+    A synchronous azure-identity style credential issuing numbered tokens valid for `lifetime` seconds,
+    after failing `failures` times.
+    """
+    def __init__(self, lifetime: float = 3600, delay: float = 0.0, failures: int = 0):
+        self.lifetime = lifetime
+        self.delay = delay
+        self.failures = failures
+        self.calls = 0
+        self.threads = set()
+
+    def get_token(self, *scopes: str, **kwargs) -> AccessToken:
+        self.calls += 1
+        self.threads.add(threading.get_ident())
+        time.sleep(self.delay)
+        if self.calls <= self.failures:
+            raise RuntimeError("credential unavailable")
+        return AccessToken(f"token-{self.calls}", int(time.time() + self.lifetime))
+
+def test_concurrent_callers_share_one_fetch():
+    async def run():
+        credential = FakeCredential(delay=0.05)
+        manager = TokenManager(credential, SCOPE, refresh_margin=300, jitter=0)
+        tokens = await asyncio.gather(*(manager.get_token() for _ in range(5)))
+        again = await manager.get_token()
+        return credential, tokens, again
+
+    credential, tokens, again = asyncio.run(run())
+    assert tokens == ["token-1"] * 5
+    assert again == "token-1"
+    assert credential.calls == 1
+    assert threading.get_ident() not in credential.threads
+
+def test_token_is_refreshed_in_the_background_before_it_expires():
+    async def run():
+        # Refreshed `refresh_margin` seconds before expiry, here one second after it was issued
+        credential = FakeCredential(lifetime=301)
+        manager = TokenManager(credential, SCOPE, refresh_margin=300, jitter=0)
+        await manager.warm_up()
+        first = await manager.get_token()
+        await asyncio.sleep(1.3)
+        second = await manager.get_token()
+        await manager.close()
+        return credential, manager, first, second
+
+    credential, manager, first, second = asyncio.run(run())
+    assert (first, second) == ("token-1", "token-2")
+    assert credential.calls == 2
+    assert manager.stats()["refreshes"] == 2
+    assert manager.stats()["expires_in"] > 290
+
+def test_expired_token_is_fetched_on_demand():
+    async def run():
+        credential = FakeCredential(lifetime=10)
+        manager = TokenManager(credential, SCOPE, refresh_margin=0, jitter=0)
+        # Within 30 seconds of expiry a token is not handed out any more
+        return await manager.get_token(), await manager.get_token()
+
+    first, second = asyncio.run(run())
+    assert (first, second) == ("token-1", "token-2")
+
+def test_warm_up_retries_failed_refreshes():
+    async def run():
+        credential = FakeCredential(failures=1)
+        manager = TokenManager(credential, SCOPE, refresh_margin=300, jitter=0)
+        await asyncio.wait_for(manager.warm_up(), 3)
+        token = await manager.get_token()
+        await manager.close()
+        return manager, token
+
+    manager, token = asyncio.run(run())
+    assert token == "token-2"
+    assert manager.stats()["failures"] == 1
+    assert manager.stats()["refreshes"] == 1
+
+def test_lazy_credential_is_built_once_on_first_use():
+    built = []
+
+    def factory():
+        built.append(threading.get_ident())
+        return FakeCredential()
+
+    async def run():
+        credential = LazyCredential(factory)
+        assert built == []
+        manager = TokenManager(credential, SCOPE, refresh_margin=300, jitter=0)
+        await manager.get_token()
+        manager._token = None
+        return await manager.get_token()
+
+    assert asyncio.run(run()) == "token-2"
+    assert len(built) == 1
+    # Built in the worker thread that fetches the token, off the event loop
+    assert built[0] != threading.get_ident()
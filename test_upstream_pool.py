@@ -0,0 +1,149 @@
+import asyncio
+import json
+
+import aiohttp
+
+from upstream_pool import UpstreamPool
+
+class FakeUpstream:
+    """
+    A dialed realtime session: the test plays the service by pushing frames or closing it.
+    """
+    def __init__(self, number: int):
+        self.number = number
+        self.closed = False
+        self.close_code = None
+        self.ping_fails = False
+        self._inbox: asyncio.Queue = asyncio.Queue()
+        self.push({"type": "session.created", "session": {"id": f"sess_{number}"}})
+
+    def push(self, message: dict):
+        self._inbox.put_nowait(aiohttp.WSMessage(aiohttp.WSMsgType.TEXT, json.dumps(message), None))
+
+    def service_closes(self):
+        self.close_code = 1000
+        self._inbox.put_nowait(aiohttp.WSMessage(aiohttp.WSMsgType.CLOSE, 1000, None))
+
+    async def receive(self) -> aiohttp.WSMessage:
+        return await self._inbox.get()
+
+    async def ping(self):
+        if self.ping_fails:
+            raise ConnectionResetError("gone")
+
+    async def close(self):
+        self.closed = True
+
+def _pool(warm_size: int = 2, max_age: float = 60, health_interval: float = 60, failures: int = 0):
+    """
+    A pool whose dials return FakeUpstream sessions, after `failures` failed dials.
+    """
+    async def no_auth():
+        return {}
+
+    pool = UpstreamPool("https://realtime.example", "/openai/realtime", {}, no_auth,
+                        warm_size=warm_size, max_age=max_age, health_interval=health_interval)
+    pool.dialed = []
+
+    async def dial(headers=None):
+        if len(pool.dialed) < failures:
+            pool.dialed.append(None)
+            raise aiohttp.ClientConnectionError("refused")
+        upstream = FakeUpstream(len(pool.dialed))
+        pool.dialed.append(upstream)
+        return upstream
+    pool._dial = dial
+    return pool
+
+async def _settle():
+    for _ in range(20):
+        await asyncio.sleep(0)
+
+def test_warm_sessions_are_handed_out_with_their_frames_and_refilled():
+    async def run():
+        pool = _pool(warm_size=2)
+        await pool.warm_up()
+        await _settle()
+        assert pool.stats()["idle"] == 2
+        conn = await pool.acquire()
+        await _settle()
+        stats = pool.stats()
+        await pool.close()
+        return pool, conn, stats
+
+    pool, conn, stats = asyncio.run(run())
+    assert [json.loads(m.data)["type"] for m in conn.pending] == ["session.created"]
+    assert not conn.ws.closed
+    assert stats["hits"] == 1 and stats["misses"] == 0
+    # The maintainer dialed a replacement for the handed-out session
+    assert stats["idle"] == 2
+    assert len(pool.dialed) == 3
+
+def test_empty_pool_dials_on_demand():
+    async def run():
+        pool = _pool(warm_size=0)
+        conn = await pool.acquire()
+        return pool, conn
+
+    pool, conn = asyncio.run(run())
+    assert conn.ws is pool.dialed[0]
+    assert conn.pending == []
+    assert pool.stats()["misses"] == 1
+
+def test_session_closed_by_service_while_idle_is_evicted_and_replaced():
+    async def run():
+        pool = _pool(warm_size=1)
+        await pool.warm_up()
+        await _settle()
+        first = pool.dialed[0]
+        first.service_closes()
+        await _settle()
+        conn = await pool.acquire()
+        await pool.close()
+        return pool, first, conn
+
+    pool, first, conn = asyncio.run(run())
+    assert first.closed
+    assert conn.ws is pool.dialed[1]
+    assert pool.stats()["evictions"] == 1
+    assert pool.stats()["hits"] == 1
+
+def test_sessions_past_max_age_are_not_handed_out():
+    async def run():
+        pool = _pool(warm_size=1, max_age=0.05)
+        await pool.warm_up()
+        await asyncio.sleep(0.1)
+        conn = await pool.acquire()
+        await pool.close()
+        return pool, conn
+
+    pool, conn = asyncio.run(run())
+    assert pool.dialed[0].closed
+    assert conn.ws is not pool.dialed[0]
+    assert pool.stats()["evictions"] >= 1
+
+def test_unhealthy_sessions_are_evicted_by_maintenance():
+    async def run():
+        pool = _pool(warm_size=1, health_interval=0.05)
+        await pool.warm_up()
+        pool.dialed[0].ping_fails = True
+        await asyncio.sleep(0.2)
+        stats = pool.stats()
+        await pool.close()
+        return pool, stats
+
+    pool, stats = asyncio.run(run())
+    assert pool.dialed[0].closed
+    assert stats["evictions"] == 1
+    assert stats["idle"] == 1
+
+def test_failed_dials_are_counted_and_retried():
+    async def run():
+        pool = _pool(warm_size=1, health_interval=0.02, failures=2)
+        await asyncio.wait_for(pool.warm_up(), 1)
+        await pool.close()
+        return pool
+
+    pool = asyncio.run(run())
+    assert pool.stats()["dial_failures"] == 2
+    assert all(upstream.closed for upstream in pool.dialed if upstream is not None)
@@ -0,0 +1,24 @@
+import time
+
+class TokenBucket:
+    """
+    Rate limiter refilled continuously at `rate` tokens per second, holding at most `burst`.
+    Not thread-safe; callers that share one across threads hold their own lock.
+    """
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def take(self) -> float:
+        """
+        Take a token; returns 0 on success, otherwise the seconds until one is available.
+        """
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
@@ -0,0 +1,123 @@
+import asyncio
+import logging
+import os
+import random
+import time
+from typing import TYPE_CHECKING, Any, Callable, Optional
+
+if TYPE_CHECKING:
+    from azure.core.credentials import AccessToken
+
+logger = logging.getLogger("voicerag")
+
+class TokenManager:
+    """
+    Keeps an Entra ID bearer token fresh in a background task. The azure-identity credentials
+    used by the app are synchronous, so each refresh runs in a worker thread and callers on the
+    event loop only ever read the cached token.
+    """
+    refresh_margin: float
+    jitter: float
+    max_backoff: float
+    refreshes: int = 0
+    failures: int = 0
+    last_refresh_latency: Optional[float] = None
+    total_refresh_latency: float = 0.0
+
+    def __init__(self, credential: Any, scope: str, refresh_margin: Optional[float] = None,
+                 jitter: Optional[float] = None, max_backoff: float = 60.0):
+        self.credential = credential
+        self.scope = scope
+        # Refresh this many seconds before expiry, minus a random jitter so workers do not refresh in lockstep
+        self.refresh_margin = refresh_margin if refresh_margin is not None else float(os.environ.get("TOKEN_REFRESH_MARGIN", "300"))
+        self.jitter = jitter if jitter is not None else float(os.environ.get("TOKEN_REFRESH_JITTER", "60"))
+        self.max_backoff = max_backoff
+        self._token: Optional["AccessToken"] = None
+        self._ready = asyncio.Event()
+        self._inflight: Optional[asyncio.Task] = None
+        self._refresher: Optional[asyncio.Task] = None
+
+    def _is_valid(self) -> bool:
+        # Keep a small safety window so a token does not expire in flight
+        return self._token is not None and self._token.expires_on - time.time() > 30
+
+    async def _fetch(self) -> "AccessToken":
+        start = time.perf_counter()
+        try:
+            token = await asyncio.to_thread(self.credential.get_token, self.scope)
+        except Exception:
+            self.failures += 1
+            raise
+        self.last_refresh_latency = time.perf_counter() - start
+        self.total_refresh_latency += self.last_refresh_latency
+        self.refreshes += 1
+        self._token = token
+        self._ready.set()
+        return token
+
+    async def _refresh(self) -> "AccessToken":
+        # Single-flight: concurrent callers share one credential round trip
+        if self._inflight is None or self._inflight.done():
+            self._inflight = asyncio.create_task(self._fetch())
+        return await asyncio.shield(self._inflight)
+
+    async def _run(self):
+        backoff = 1.0
+        while True:
+            try:
+                token = await self._refresh()
+                backoff = 1.0
+                delay = token.expires_on - time.time() - self.refresh_margin - random.uniform(0, self.jitter)
+            except Exception as e:
+                logger.warning("Token refresh failed, retrying in %.1fs: %s", backoff, e)
+                delay = backoff * random.uniform(0.5, 1.0)
+                backoff = min(backoff * 2, self.max_backoff)
+            await asyncio.sleep(max(delay, 1.0))
+
+    async def start(self):
+        if self._refresher is None:
+            self._refresher = asyncio.create_task(self._run())
+
+    async def warm_up(self):
+        """
+        Start refreshing and wait for the first token; failed attempts are retried with backoff.
+        """
+        await self.start()
+        await self._ready.wait()
+
+    async def get_token(self) -> str:
+        """
+        Return the cached bearer token. Only waits when no valid token exists yet (e.g. the first
+        refresh after startup is still in flight or every refresh so far has failed).
+        """
+        if self._is_valid():
+            return self._token.token
+        return (await self._refresh()).token
+
+    async def close(self):
+        if self._refresher is not None:
+            self._refresher.cancel()
+            self._refresher = None
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "refreshes": self.refreshes,
+            "failures": self.failures,
+            "last_refresh_latency": self.last_refresh_latency,
+            "average_refresh_latency": self.total_refresh_latency / self.refreshes if self.refreshes else None,
+            "expires_in": self._token.expires_on - time.time() if self._token is not None else None,
+        }
+
+class LazyCredential:
+    """
+    A credential built on its first get_token call, which TokenManager makes in a worker thread,
+    so importing and constructing azure-identity credentials stays off the startup path.
+    """
+    def __init__(self, factory: Callable[[], Any]):
+        self.factory = factory
+        self._credential: Optional[Any] = None
+
+    def get_token(self, *scopes: str, **kwargs: Any) -> "AccessToken":
+        if self._credential is None:
+            self._credential = self.factory()
+        return self._credential.get_token(*scopes, **kwargs)
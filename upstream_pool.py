@@ -0,0 +1,196 @@
+import asyncio
+import logging
+import os
+import time
+from typing import Awaitable, Callable, Optional
+
+import aiohttp
+
+logger = logging.getLogger("voicerag")
+
+class PooledConnection:
+    """
+    An upstream session and the frames the service sent while it sat in the pool (its session.created),
+    which the relay delivers before reading the socket itself.
+    """
+    ws: aiohttp.ClientWebSocketResponse
+    created_at: float
+
+    def __init__(self, ws: aiohttp.ClientWebSocketResponse):
+        self.ws = ws
+        self.created_at = time.monotonic()
+        self.pending: list[aiohttp.WSMessage] = []
+        self.dead = False
+        self._reader: Optional[asyncio.Task] = None
+
+    def age(self) -> float:
+        return time.monotonic() - self.created_at
+
+class UpstreamPool:
+    """
+    Pool of pre-dialed, already-authenticated realtime WebSocket sessions so a new visitor
+    does not pay for the TLS and WebSocket handshake before the avatar can speak.
+    Idle sockets are read in the background: frames are kept for the hand-off, so a handed-out
+    connection behaves exactly like a freshly dialed one, and a session the service closes or
+    that errors while idle is evicted instead of being handed to a visitor.
+    """
+    warm_size: int
+    max_age: float
+    health_interval: float
+    hits: int = 0
+    misses: int = 0
+    dial_failures: int = 0
+    evictions: int = 0
+
+    def __init__(self, endpoint: str, path: str, params: dict[str, str], auth_headers: Callable[[], Awaitable[dict[str, str]]],
+                 warm_size: Optional[int] = None, max_age: Optional[float] = None, health_interval: Optional[float] = None):
+        self.endpoint = endpoint
+        self.path = path
+        self.params = params
+        self.auth_headers = auth_headers
+        self.warm_size = warm_size if warm_size is not None else int(os.environ.get("REALTIME_POOL_SIZE", "2"))
+        # Keep well under the service's idle/session limits so a pooled socket is never handed out dead
+        self.max_age = max_age if max_age is not None else float(os.environ.get("REALTIME_POOL_MAX_AGE", "240"))
+        self.health_interval = health_interval if health_interval is not None else float(os.environ.get("REALTIME_POOL_HEALTH_INTERVAL", "10"))
+        self._idle: list[PooledConnection] = []
+        self._dialing = 0
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._refill_needed = asyncio.Event()
+        # Set once the first session has been dialed
+        self._warm = asyncio.Event()
+        self._maintainer: Optional[asyncio.Task] = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None:
+            self._session = aiohttp.ClientSession(base_url=self.endpoint)
+        return self._session
+
+    async def _dial(self, headers: Optional[dict[str, str]] = None) -> aiohttp.ClientWebSocketResponse:
+        all_headers = dict(headers or {})
+        all_headers.update(await self.auth_headers())
+        return await self._get_session().ws_connect(self.path, headers=all_headers, params=self.params)
+
+    def _is_usable(self, conn: PooledConnection) -> bool:
+        return not conn.dead and not conn.ws.closed and conn.age() <= self.max_age
+
+    async def _drain(self, conn: PooledConnection):
+        while True:
+            msg = await conn.ws.receive()
+            if msg.type in (aiohttp.WSMsgType.CLOSE, aiohttp.WSMsgType.CLOSING, aiohttp.WSMsgType.CLOSED, aiohttp.WSMsgType.ERROR):
+                break
+            conn.pending.append(msg)
+        conn.dead = True
+        if conn in self._idle:
+            self._idle.remove(conn)
+            self.evictions += 1
+            logger.info("Pooled realtime session closed by the service while idle (%s)", conn.ws.close_code)
+            self._refill_needed.set()
+        await conn.ws.close()
+
+    async def _stop_reading(self, conn: PooledConnection):
+        if conn._reader is not None:
+            conn._reader.cancel()
+            await asyncio.gather(conn._reader, return_exceptions=True)
+            conn._reader = None
+
+    async def _discard(self, conn: PooledConnection):
+        await self._stop_reading(conn)
+        await conn.ws.close()
+
+    async def _is_healthy(self, conn: PooledConnection) -> bool:
+        if not self._is_usable(conn):
+            return False
+        try:
+            await conn.ws.ping()
+        except Exception:
+            return False
+        return True
+
+    async def _add_warm(self):
+        self._dialing += 1
+        try:
+            conn = PooledConnection(await self._dial())
+            conn._reader = asyncio.create_task(self._drain(conn))
+            self._idle.append(conn)
+            self._warm.set()
+        except Exception as e:
+            self.dial_failures += 1
+            logger.warning("Failed to pre-dial realtime session: %s", e)
+        finally:
+            self._dialing -= 1
+
+    async def _evict_unhealthy(self):
+        for conn in list(self._idle):
+            healthy = await self._is_healthy(conn)
+            # Connections acquired or evicted while checking have already left the pool
+            if not healthy and conn in self._idle:
+                self._idle.remove(conn)
+                self.evictions += 1
+                await self._discard(conn)
+
+    async def _maintain(self):
+        while True:
+            try:
+                await self._evict_unhealthy()
+                missing = self.warm_size - len(self._idle) - self._dialing
+                if missing > 0:
+                    await asyncio.gather(*(self._add_warm() for _ in range(missing)))
+            except Exception as e:
+                logger.warning("Realtime pool maintenance failed: %s", e)
+            self._refill_needed.clear()
+            try:
+                await asyncio.wait_for(self._refill_needed.wait(), timeout=self.health_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def start(self):
+        if self.warm_size > 0 and self._maintainer is None:
+            self._maintainer = asyncio.create_task(self._maintain())
+
+    async def warm_up(self):
+        """
+        Start the pool and wait until its first session is dialed (failed dials are retried by the maintainer).
+        """
+        await self.start()
+        if self.warm_size > 0:
+            await self._warm.wait()
+
+    async def acquire(self, headers: Optional[dict[str, str]] = None) -> PooledConnection:
+        """
+        Take a warm upstream session, or dial one on demand if the pool is empty.
+        The caller owns the returned socket and must close it, and must relay `pending` before
+        reading from it.
+        """
+        while self._idle:
+            conn = self._idle.pop()
+            await self._stop_reading(conn)
+            if not self._is_usable(conn):
+                self.evictions += 1
+                await conn.ws.close()
+                continue
+            self.hits += 1
+            self._refill_needed.set()
+            return conn
+        self.misses += 1
+        self._refill_needed.set()
+        return PooledConnection(await self._dial(headers))
+
+    async def close(self):
+        if self._maintainer is not None:
+            self._maintainer.cancel()
+            self._maintainer = None
+        idle, self._idle = self._idle, []
+        for conn in idle:
+            await self._discard(conn)
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "idle": len(self._idle),
+            "hits": self.hits,
+            "misses": self.misses,
+            "dial_failures": self.dial_failures,
+            "evictions": self.evictions,
+        }
@@ -0,0 +1,181 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import shutil
+import signal
+import tempfile
+import time
+from multiprocessing.connection import wait
+from pathlib import Path
+from typing import Awaitable, Callable, Optional
+
+from aiohttp import web
+
+from relay_metrics import MetricsRegistry, merge_expositions
+
+logger = logging.getLogger("voicerag")
+
+AppFactory = Callable[[], Awaitable[web.Application]]
+
+class SharedMetrics:
+    """
+    /metrics across worker processes. Every worker periodically snapshots its registry to
+    `<directory>/worker-<slot>.prom`; a scrape, which lands on whichever worker the kernel picks,
+    refreshes its own snapshot and merges all of them. Snapshots are keyed by slot, so a restarted
+    worker replaces its predecessor's file instead of leaving a stale one behind.
+    """
+    def __init__(self, registry: MetricsRegistry, directory: str, slot: int, interval: Optional[float] = None):
+        self.registry = registry
+        self.directory = Path(directory)
+        self.slot = slot
+        self.interval = interval if interval is not None else float(os.environ.get("APP_METRICS_INTERVAL", "5"))
+        self._writer: Optional[asyncio.Task] = None
+
+    def _write(self, text: str):
+        path = self.directory / f"worker-{self.slot}.prom"
+        tmp = path.with_suffix(".tmp")
+        tmp.write_text(text)
+        os.replace(tmp, path)
+
+    def _read_all(self) -> dict[str, str]:
+        return {path.stem.removeprefix("worker-"): path.read_text() for path in sorted(self.directory.glob("worker-*.prom"))}
+
+    async def _snapshot(self):
+        await asyncio.to_thread(self._write, self.registry.render())
+
+    async def _run(self):
+        while True:
+            try:
+                await self._snapshot()
+            except OSError as e:
+                logger.warning("Failed to write metrics snapshot: %s", e)
+            await asyncio.sleep(self.interval)
+
+    async def render(self) -> str:
+        await self._snapshot()
+        return merge_expositions(await asyncio.to_thread(self._read_all))
+
+    async def _on_startup(self, _):
+        self._writer = asyncio.create_task(self._run())
+
+    async def _on_cleanup(self, _):
+        if self._writer is not None:
+            self._writer.cancel()
+            self._writer = None
+        # Final counters of a drained worker stay visible until its slot is restarted
+        await self._snapshot()
+
+    def attach_to_app(self, app: web.Application):
+        app.on_startup.append(self._on_startup)
+        app.on_cleanup.append(self._on_cleanup)
+
+def _run_worker(app_factory: AppFactory, host: str, port: int, slot: int, drain_timeout: float):
+    os.environ["APP_WORKER_SLOT"] = str(slot)
+    # run_app turns SIGTERM into a graceful shutdown: the listening socket closes first (the kernel
+    # then sends new connections to the other workers) and live WebSocket conversations get
+    # `drain_timeout` seconds to finish before they are cancelled
+    web.run_app(app_factory(), host=host, port=port, reuse_port=True, shutdown_timeout=drain_timeout,
+                print=print if slot == 0 else None)
+
+class Supervisor:
+    """
+    Runs `workers` copies of the app on one port with SO_REUSEPORT, so the kernel spreads
+    connections across processes and every core does JSON relay work. Crashed workers are
+    restarted (with backoff if they keep dying on startup); SIGTERM/SIGINT drains all of them.
+    """
+    min_uptime: float = 5.0
+    max_backoff: float = 30.0
+
+    def __init__(self, app_factory: AppFactory, host: str, port: int, workers: int, drain_timeout: float):
+        self.app_factory = app_factory
+        self.host = host
+        self.port = port
+        self.workers = workers
+        self.drain_timeout = drain_timeout
+        self._context = multiprocessing.get_context("spawn")
+        self._processes: dict[int, multiprocessing.Process] = {}
+        self._started_at: dict[int, float] = {}
+        self._backoff: dict[int, float] = {}
+        self._restart_at: dict[int, float] = {}
+        self._stopping = False
+
+    def _start(self, slot: int):
+        process = self._context.Process(target=_run_worker, name=f"worker-{slot}",
+                                        args=(self.app_factory, self.host, self.port, slot, self.drain_timeout))
+        process.start()
+        self._processes[slot] = process
+        self._started_at[slot] = time.monotonic()
+        logger.info("Started worker %d (pid %d)", slot, process.pid)
+
+    def _reap(self, slot: int, process: multiprocessing.Process):
+        uptime = time.monotonic() - self._started_at[slot]
+        logger.warning("Worker %d (pid %d) exited with code %s after %.1fs", slot, process.pid, process.exitcode, uptime)
+        del self._processes[slot]
+        if uptime < self.min_uptime:
+            self._backoff[slot] = min(self.max_backoff, self._backoff.get(slot, 0.5) * 2)
+        else:
+            self._backoff[slot] = 0.0
+        self._restart_at[slot] = time.monotonic() + self._backoff[slot]
+
+    def _request_stop(self, signum, _frame):
+        if not self._stopping:
+            logger.info("Received %s, draining workers", signal.Signals(signum).name)
+        self._stopping = True
+
+    def _forward_signal(self, signum, _frame):
+        for process in self._processes.values():
+            if process.is_alive():
+                os.kill(process.pid, signum)
+
+    def _stop_all(self):
+        for process in self._processes.values():
+            if process.is_alive():
+                process.terminate()
+        deadline = time.monotonic() + self.drain_timeout + 5.0
+        for slot, process in self._processes.items():
+            process.join(max(0.0, deadline - time.monotonic()))
+            if process.is_alive():
+                logger.warning("Worker %d did not drain in time, killing it", slot)
+                process.kill()
+                process.join()
+
+    def run(self):
+        created_dir = None
+        if not os.environ.get("APP_METRICS_DIR"):
+            created_dir = tempfile.mkdtemp(prefix="avatar-metrics-")
+            os.environ["APP_METRICS_DIR"] = created_dir
+        signal.signal(signal.SIGTERM, self._request_stop)
+        signal.signal(signal.SIGINT, self._request_stop)
+        if hasattr(signal, "SIGUSR1"):
+            # Log level toggle, see LogPipeline
+            signal.signal(signal.SIGUSR1, self._forward_signal)
+        try:
+            for slot in range(self.workers):
+                self._start(slot)
+            while not self._stopping:
+                now = time.monotonic()
+                for slot, restart_at in list(self._restart_at.items()):
+                    if restart_at <= now:
+                        del self._restart_at[slot]
+                        self._start(slot)
+                timeout = min([t - now for t in self._restart_at.values()] + [1.0])
+                wait([p.sentinel for p in self._processes.values()], timeout=max(0.0, timeout))
+                for slot, process in list(self._processes.items()):
+                    if not process.is_alive() and not self._stopping:
+                        self._reap(slot, process)
+        finally:
+            self._stop_all()
+            if created_dir is not None:
+                shutil.rmtree(created_dir, ignore_errors=True)
+
+def serve(app_factory: AppFactory, host: str, port: int, workers: Optional[int] = None, drain_timeout: Optional[float] = None):
+    """
+    Serve the app on host:port, in this process when `workers` is 1 and under a Supervisor otherwise.
+    """
+    workers = workers if workers is not None else int(os.environ.get("APP_WORKERS", "1"))
+    drain_timeout = drain_timeout if drain_timeout is not None else float(os.environ.get("APP_DRAIN_TIMEOUT", "30"))
+    if workers <= 1:
+        web.run_app(app_factory(), host=host, port=port, shutdown_timeout=drain_timeout)
+    else:
+        Supervisor(app_factory, host, port, workers, drain_timeout).run()